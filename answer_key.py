@@ -0,0 +1,110 @@
+"""
+Answer Key Parser for Questuza Discord Bot
+Scans answer-key text once and keeps the most trustworthy answer per question
+"""
+
+import re
+from typing import Dict, Iterable, List, Tuple, Union
+
+MAX_REASONABLE_QUESTION = 200  # Most tests don't have more than 200 questions
+MIN_TABLE_ROWS = 3  # "12 B" lines on a page before it is treated as a table
+
+# Layouts in the order they are tried at each position, most explicit first.
+# Every layout captures (question, letter); the letter must not start a word.
+_NUM = r'(?<!\d)(\d{1,3})'
+_LETTER = r'([A-Z])(?![A-Z])'
+LAYOUTS: List[Tuple[str, float, str]] = [
+    ('question_answer', 0.95, rf'Question\s*(\d{{1,3}})\s*[:.)]?\s*Answer\s*[:.\-]?\s*{_LETTER}'),
+    ('answer_key', 0.9, rf'(?:Answer\s+)?Key\s*[:.]?\s*(\d{{1,3}})\s*[:.)\-]?\s*{_LETTER}'),
+    ('numbered_answer', 0.9, rf'{_NUM}\s*[.)]\s*Answer\s*[:.\-]?\s*{_LETTER}'),
+    ('q_prefix', 0.85, rf'\bQ\.?\s*(\d{{1,3}})\s*[:.)=\-]?\s*{_LETTER}'),
+    ('item_prefix', 0.85, rf'\bItem\s*(\d{{1,3}})\s*[:.)]?\s*{_LETTER}'),
+    ('equals', 0.8, rf'{_NUM}\s*[=|]\s*{_LETTER}'),
+    ('punctuated', 0.7, rf'{_NUM}\s*[.):\-]\s*{_LETTER}'),
+    ('spaced', 0.5, rf'{_NUM}[ \t]+{_LETTER}'),
+    ('joined', 0.3, rf'{_NUM}{_LETTER}'),
+]
+TABLE_SCORE = 0.9
+CUSTOM_SCORE = 1.0
+
+# One alternation, so the text is scanned a single time. The leading lookahead lets
+# positions that cannot start any layout fail after one character test.
+# Layout i owns groups 2i+1 (question) and 2i+2 (letter), so lastindex identifies it.
+_SCANNER = re.compile(r'(?=[\dQIKA])(?:' + '|'.join(f'(?:{regex})' for _, _, regex in LAYOUTS) + ')',
+                      re.IGNORECASE)
+_SCORES = [score for _, score, _ in LAYOUTS]
+
+_NUMBER_ROW = re.compile(r'^\s*\d{1,3}(?:\s+\d{1,3})+\s*$')
+_LETTER_ROW = re.compile(r'^\s*[A-Z](?:\s+[A-Z])+\s*$', re.IGNORECASE)
+_TABLE_ROW = re.compile(r'^\s*\d{1,3}[ \t.)]+[A-Z]\s*$', re.IGNORECASE)
+
+ScoredAnswers = Dict[int, Tuple[str, float]]
+
+
+def _offer(answers: ScoredAnswers, question: int, letter: str, score: float):
+    """Keep a candidate unless an equally or more confident one is already known"""
+    if 0 < question <= MAX_REASONABLE_QUESTION:
+        current = answers.get(question)
+        if current is None or score > current[1]:
+            answers[question] = (letter.upper(), score)
+
+
+def _scan_tables(page: str, answers: ScoredAnswers):
+    """Detect table layouts on one page.
+
+    A row of question numbers directly above a row of letters pairs them column by
+    column; a page made of many "12 B" lines is a vertical table and is trusted more
+    than a stray "12 B" in prose.
+    """
+    lines = page.splitlines()
+    table_rows = []
+    for i, line in enumerate(lines):
+        if _TABLE_ROW.match(line):
+            table_rows.append(line)
+        elif i + 1 < len(lines) and _NUMBER_ROW.match(line) and _LETTER_ROW.match(lines[i + 1]):
+            numbers, letters = line.split(), lines[i + 1].split()
+            if len(numbers) == len(letters):
+                for number, letter in zip(numbers, letters):
+                    _offer(answers, int(number), letter, TABLE_SCORE)
+    if len(table_rows) >= MIN_TABLE_ROWS:
+        for row in table_rows:
+            match = re.match(r'\s*(\d{1,3})[ \t.)]+([A-Z])', row, re.IGNORECASE)
+            _offer(answers, int(match.group(1)), match.group(2), TABLE_SCORE)
+
+
+def score_answer_key(text: Union[str, Iterable[str]], pattern: str = None) -> ScoredAnswers:
+    """Parse an answer key into {question: (letter, confidence)}.
+
+    `text` is either the whole document or its pages. A custom `pattern` must
+    capture the question number and the letter, and overrides the built-in layouts.
+    """
+    pages = [text] if isinstance(text, str) else list(text)
+    answers: ScoredAnswers = {}
+
+    if pattern:
+        regex = re.compile(pattern, re.IGNORECASE)
+        for page in pages:
+            for match in regex.finditer(page):
+                try:
+                    question, letter = int(match.group(1)), match.group(2).strip()
+                except (IndexError, TypeError, ValueError):
+                    continue
+                if len(letter) == 1 and letter.isalpha():
+                    _offer(answers, question, letter, CUSTOM_SCORE)
+        return answers
+
+    for page in pages:
+        _scan_tables(page, answers)
+        for match in _SCANNER.finditer(page):
+            group = match.lastindex
+            _offer(answers, int(match.group(group - 1)), match.group(group), _SCORES[group // 2 - 1])
+    return answers
+
+
+def parse_answer_key(text: Union[str, Iterable[str]], pattern: str = None) -> Dict[int, str]:
+    """Parse answer key from PDF text, keeping the highest-confidence letter per question"""
+    try:
+        scored = score_answer_key(text, pattern)
+    except re.error:
+        return {}
+    return {question: letter for question, (letter, _) in sorted(scored.items())}
@@ -0,0 +1,74 @@
+"""
+Answer Key Store for Questuza Discord Bot
+Answer keys live in their own table and are checked from memory
+"""
+
+import sqlite3
+import logging
+from typing import Dict, Optional, Tuple
+
+
+def get_db_connection():
+    """Get database connection"""
+    conn = sqlite3.connect('questuza.db', check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class AnswerKeyStore:
+    """Answer keys per study session, cached in memory once loaded.
+
+    study_answer_keys is the source of truth; each session's key is read from it
+    at most once per process, so checking an answer is a dict lookup.
+    """
+
+    def __init__(self):
+        self._keys: Dict[str, Dict[int, str]] = {}
+
+    def _key_for(self, session_id: str) -> Dict[int, str]:
+        key = self._keys.get(session_id)
+        if key is None:
+            conn = get_db_connection()
+            try:
+                rows = conn.execute('''SELECT question_number, answer FROM study_answer_keys
+                                       WHERE session_id = ?''', (session_id,)).fetchall()
+            except sqlite3.Error as e:
+                logging.error(f"Failed to load answer key for session {session_id}: {e}")
+                rows = []
+            finally:
+                conn.close()
+            key = self._keys[session_id] = {row[0]: row[1] for row in rows}
+        return key
+
+    def load(self, session_id: str, answers: Dict[int, str], source_url: Optional[str] = None) -> int:
+        """Store a parsed answer key, replacing answers for the same questions"""
+        rows = [(session_id, question, answer.upper()) for question, answer in answers.items()]
+        conn = get_db_connection()
+        try:
+            conn.executemany('''INSERT INTO study_answer_keys (session_id, question_number, answer)
+                                VALUES (?, ?, ?)
+                                ON CONFLICT(session_id, question_number)
+                                DO UPDATE SET answer = excluded.answer''', rows)
+            if source_url:
+                conn.execute('''UPDATE study_sessions SET answer_key_url = ?
+                                WHERE session_id = ?''', (source_url, session_id))
+            conn.commit()
+        finally:
+            conn.close()
+        self._key_for(session_id).update((question, answer) for _, question, answer in rows)
+        return len(rows)
+
+    def set_answer(self, session_id: str, question_num: int, answer: str):
+        self.load(session_id, {question_num: answer})
+
+    def check(self, session_id: str, question_num: int,
+              user_answer: str) -> Tuple[bool, Optional[str]]:
+        """Check if user's answer is correct; returns (is_correct, correct_answer)"""
+        correct_answer = self._key_for(session_id).get(question_num)
+        if correct_answer is None:
+            return False, None
+        return user_answer.upper() == correct_answer, correct_answer
+
+    def forget(self, session_id: str):
+        """Drop a finished session's key from memory; the table keeps it for history"""
+        self._keys.pop(session_id, None)
@@ -0,0 +1,100 @@
+"""
+Benchmark for the answer key parser
+Times parse_answer_key on synthetic answer keys of growing size and checks accuracy
+against the previous multi-pass implementation. Run: python bench_answer_key.py
+"""
+
+import random
+import re
+import string
+import time
+
+from answer_key import parse_answer_key
+
+LAYOUTS = [
+    "Question {q} Answer: {a}",
+    "{q}. Answer: {a}",
+    "Q{q}: {a}",
+    "Item {q} - {a}",
+    "{q} = {a}",
+    "{q}) {a}",
+    "{q} | {a}",
+]
+PROSE = ("Read the passage carefully. A train leaves at 9 and arrives 3 hours later. "
+         "Section 2 covers Chapter 4B and Appendix C. Marks: 4 for correct, 1 deducted. ")
+
+
+def legacy_parse_answer_key(text, pattern=None):
+    """The multi-pass parser this module replaced, kept for comparison"""
+    answers = {}
+    patterns = [pattern] if pattern else [
+        r'Question\s*(\d+)[:\.\s]*[Aa]nswer[:\.\s]*([A-Z])',
+        r'(\d+)[\.\)]\s*[Aa]nswer[:\.\s]*([A-Z])',
+        r'Q(\d+)[:\.\s]*([A-Z])',
+        r'(\d+)\)\s*([A-Z])',
+        r'(\d+)[:\.\s]*([A-Z])',
+        r'(\d+)\s*=\s*([A-Z])',
+        r'(\d+)\s*-\s*([A-Z])',
+        r'(\d+)\s*\|\s*([A-Z])',
+        r'Item\s*(\d+)[:\.\s]*([A-Z])',
+        r'(\d+)\s+([A-Z])\s',
+        r'(\d{1,3})\s*\t\s*([A-Z])',
+        r'[Aa]nswer\s+[Kk]ey[:\.\s]*(\d+)[:\.\s]*([A-Z])',
+        r'[Kk]ey[:\.\s]*(\d+)[:\.\s]*([A-Z])',
+        r'(\d{1,3})([A-Z])',
+    ]
+    text = re.sub(r'\s+', ' ', text)
+    for pattern_regex in patterns:
+        for match in re.findall(pattern_regex, text, re.IGNORECASE):
+            answer = match[1].upper().strip()
+            if len(answer) == 1 and answer.isalpha():
+                answers[int(match[0])] = answer
+    return {q: a for q, a in answers.items() if q <= 200}
+
+
+def make_key(pages, questions=200, seed=0):
+    """Synthetic answer key: one layout per page, prose between entries, a table page every tenth page"""
+    rng = random.Random(seed)
+    truth = {q: rng.choice("ABCDE") for q in range(1, questions + 1)}
+    out = []
+    for page in range(pages):
+        if page % 10 == 9:
+            numbers = list(range(1, 11))
+            out.append(" ".join(map(str, numbers)) + "\n" + " ".join(truth[n] for n in numbers) + "\n")
+            continue
+        layout = LAYOUTS[page % len(LAYOUTS)]
+        lines = []
+        for q in rng.sample(range(1, questions + 1), 40):
+            lines.append(layout.format(q=q, a=truth[q]))
+            if rng.random() < 0.5:
+                lines.append(PROSE + "".join(rng.choice(string.ascii_lowercase) for _ in range(20)))
+        out.append("\n".join(lines) + "\n")
+    return out, truth
+
+
+def accuracy(found, truth):
+    return sum(1 for q, a in found.items() if truth.get(q) == a) / len(truth)
+
+
+def bench(func, arg, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    print(f"{'pages':>6} {'KB':>8} {'new ms':>9} {'new acc':>8} {'old ms':>9} {'old acc':>8}")
+    for pages in (10, 50, 100, 250, 500):
+        doc, truth = make_key(pages)
+        joined = "".join(doc)
+        new_time, new_result = bench(parse_answer_key, doc)
+        old_time, old_result = bench(legacy_parse_answer_key, joined)
+        print(f"{pages:>6} {len(joined) / 1024:>8.0f} {new_time * 1000:>9.1f} "
+              f"{accuracy(new_result, truth):>8.1%} {old_time * 1000:>9.1f} {accuracy(old_result, truth):>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
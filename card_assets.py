@@ -0,0 +1,168 @@
+"""
+Card Assets for Questuza Discord Bot
+Disk cache of the images drawn on profile cards, revalidated with ETag / Last-Modified
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import ExitStack, asynccontextmanager, nullcontext
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from http_client import HTTPError, URLLocks, http_client
+from pdf_cache import DiskLRU
+
+CACHE_DIR = 'card_assets'
+ASSET_BUDGET_BYTES = 200 * 1024 * 1024
+ASSET_REVALIDATE_SECONDS = 3600  # trust a cached image this long before asking the host again
+MAX_ASSET_BYTES = 8 * 1024 * 1024
+FETCH_TIMEOUT = 10
+PALETTE_SUFFIX = '.palette.json'  # colours the card renderer extracted from an image
+
+
+class CardAsset(NamedTuple):
+    """A cached image file; `version` is its content hash, so it changes whenever the image does"""
+    path: str
+    version: str
+
+
+class AssetCache:
+    """Raw image bytes stored once per content hash under a total byte budget.
+
+    Layout: <root>/<sha256>.img, an optional <sha256>.img.palette.json written by
+    the renderer, plus urls.json mapping each URL to its ETag, Last-Modified,
+    content hash and when it was last checked.
+    """
+
+    def __init__(self, root: str = CACHE_DIR, budget: int = ASSET_BUDGET_BYTES):
+        self.root = root
+        self.files = DiskLRU(budget, on_evict=self._remove_palette)
+        self._urls: Dict[str, dict] = {}
+        self._index_path = os.path.join(root, 'urls.json')
+        self._url_locks = URLLocks()
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Rebuild the URL index and LRU order from what is already on disk"""
+        try:
+            with open(self._index_path) as f:
+                self._urls = json.load(f)
+        except (OSError, ValueError):
+            self._urls = {}
+
+        found = []
+        names = set(os.listdir(self.root))
+        for name in names:
+            path = os.path.join(self.root, name)
+            if name.endswith('.img'):
+                stat = os.stat(path)
+                found.append((stat.st_mtime, path, stat.st_size))
+            elif name.endswith(PALETTE_SUFFIX) and name[:-len(PALETTE_SUFFIX)] not in names:
+                # The image was evicted; its palette is no longer needed
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        for _, path, size in sorted(found):
+            self.files.add(path, size)
+
+    @staticmethod
+    def _remove_palette(path: str):
+        """Drop the palette the renderer stored next to an evicted image"""
+        try:
+            os.remove(path + PALETTE_SUFFIX)
+        except OSError:
+            pass
+
+    def _save_index(self):
+        tmp = self._index_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._urls, f)
+        os.replace(tmp, self._index_path)
+
+    def asset_path(self, digest: str) -> str:
+        return os.path.join(self.root, f'{digest}.img')
+
+    def lookup(self, url: str) -> Optional[dict]:
+        """Cached entry for a URL whose image is still on disk"""
+        entry = self._urls.get(url)
+        if entry and self.files.touch(self.asset_path(entry['hash'])):
+            return entry
+        return None
+
+    def _asset(self, entry: dict) -> CardAsset:
+        return CardAsset(self.asset_path(entry['hash']), entry['hash'])
+
+    def _store(self, url: str, data: bytes, etag: Optional[str], last_modified: Optional[str]) -> dict:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.asset_path(digest)
+        if not self.files.touch(path):
+            # Write atomically so render workers never read a partial file
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+            self.files.add(path, len(data))
+        entry = self._urls[url] = {
+            'hash': digest,
+            'etag': etag,
+            'last_modified': last_modified,
+            'checked_at': time.time(),
+        }
+        self._save_index()
+        return entry
+
+    async def fetch(self, url: str) -> Optional[CardAsset]:
+        """The cached image for `url`, downloading or revalidating it when needed"""
+        async with self._url_locks.hold(url):
+            entry = self.lookup(url)
+            if entry and time.time() - entry.get('checked_at', 0) < ASSET_REVALIDATE_SECONDS:
+                return self._asset(entry)
+
+            headers = {}
+            if entry and entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry and entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            try:
+                # The cached copy must survive the request in case the host answers 304
+                with self.files.pinned(self.asset_path(entry['hash'])) if entry else nullcontext():
+                    response = await http_client.get(url, max_bytes=MAX_ASSET_BYTES, headers=headers,
+                                                     timeout=FETCH_TIMEOUT)
+            except HTTPError as e:
+                logging.warning(f"Could not fetch card image {url}: {e}")
+                # A stale copy still beats a blank box on the card
+                return self._asset(entry) if entry else None
+
+            if response.status == 304 and entry:
+                entry['checked_at'] = time.time()
+                self._save_index()
+                return self._asset(entry)
+            if response.status != 200 or not response.body:
+                return self._asset(entry) if entry else None
+            return self._asset(self._store(url, response.body, response.headers.get('ETag'),
+                                           response.headers.get('Last-Modified')))
+
+    @asynccontextmanager
+    async def fetch_pinned(self, urls: Iterable[str]):
+        """Fetch several images concurrently and keep them on disk until the block exits.
+
+        Yields {url: CardAsset}; failures are simply left out. Each image is pinned
+        as soon as it arrives, so storing another one cannot evict it before the
+        render workers have read it.
+        """
+        urls = list(dict.fromkeys(urls))
+        with ExitStack() as pins:
+            async def fetch(url: str) -> Optional[CardAsset]:
+                asset = await self.fetch(url)
+                if asset is not None:
+                    pins.enter_context(self.files.pinned(asset.path))
+                return asset
+
+            assets = await asyncio.gather(*(fetch(url) for url in urls), return_exceptions=True)
+            yield {url: asset for url, asset in zip(urls, assets)
+                   if isinstance(asset, CardAsset)}
@@ -0,0 +1,92 @@
+"""
+Card Fonts for Questuza Discord Bot
+Finds the profile card font once and reuses loaded fonts and text measurements across renders
+"""
+
+import os
+from functools import lru_cache
+from typing import Iterable, Optional, Tuple
+
+from PIL import ImageFont
+
+# Try Anton first, then common system fonts.
+# Note: To use Anton font, place Anton-Regular.ttf in the 'fonts' directory or root directory
+# Download from: https://fonts.google.com/specimen/Anton
+FONT_PATHS = [
+    'fonts/Anton-Regular.ttf',
+    'Anton-Regular.ttf',
+    './fonts/Anton-Regular.ttf',
+    '/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf',
+    'C:/Windows/Fonts/arial.ttf',
+]
+DEFAULT_FONT_SIZE = 99  # 3x the original 33px, used when card_font_size is NULL
+DB_DEFAULT_FONT_SIZE = 33.0  # users.card_font_size column default (migration v9)
+MIN_FONT_SIZE = 5
+MAX_FONT_SIZE = 999
+ABOUT_FONT_RATIO = 0.73  # About me text is about 73% of the main size
+FONT_CACHE_SIZE = 32
+METRICS_CACHE_SIZE = 4096
+
+# Strings drawn on every card, measured when a render worker starts
+PRELOAD_STRINGS = (
+    ["Progress", "Abouts me", "]", "#-", "XP", "words", "messages", "vc", "quests"]
+    + [str(digit) for digit in range(10)]
+    + [f"#{rank}" for rank in range(1, 101)]
+    + [f"{tenths / 10:.1f}x" for tenths in range(10, 51)]
+)
+
+_font_path: Optional[str] = None
+_font_path_searched = False
+
+
+def find_font_path() -> Optional[str]:
+    """The first available card font, searched for once per process"""
+    global _font_path, _font_path_searched
+    if not _font_path_searched:
+        _font_path = next((path for path in FONT_PATHS if os.path.exists(path)), None)
+        _font_path_searched = True
+    return _font_path
+
+
+def card_font_sizes(card_font_size) -> Tuple[int, int]:
+    """(main, about me) font sizes for a user's card_font_size setting"""
+    if card_font_size is None:
+        main_size = DEFAULT_FONT_SIZE
+    else:
+        # User has set a custom size, use it directly (clamped 5-999)
+        main_size = int(max(MIN_FONT_SIZE, min(MAX_FONT_SIZE, card_font_size)))
+    return main_size, int(main_size * ABOUT_FONT_RATIO)
+
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def _load_font(path: Optional[str], size: int):
+    if path:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            pass
+    return ImageFont.load_default()
+
+
+def get_font(size: int):
+    """The card font at `size`, loaded once per process"""
+    return _load_font(find_font_path(), size)
+
+
+@lru_cache(maxsize=METRICS_CACHE_SIZE)
+def text_bbox(size: int, text: str) -> Tuple[int, int, int, int]:
+    """Bounding box of `text` drawn at the origin in the card font at `size`"""
+    return get_font(size).getbbox(text)
+
+
+def text_width(size: int, text: str) -> int:
+    left, _, right, _ = text_bbox(size, text)
+    return right - left
+
+
+def preload(card_font_size_settings: Iterable = (DB_DEFAULT_FONT_SIZE, None)):
+    """Load the fonts for each card_font_size setting and measure the strings every card draws"""
+    for setting in card_font_size_settings:
+        for size in card_font_sizes(setting):
+            for text in PRELOAD_STRINGS:
+                text_bbox(size, text)
@@ -0,0 +1,127 @@
+"""
+Check the shared HTTP client against a local stub server
+Starts an aiohttp.web server on localhost and verifies the size cap, the timeout
+and the per-host connection limit of http_client.HTTPClient, plus the
+per-URL locks shared by the PDF and card image caches.
+Run: python check_http_client.py
+"""
+
+import asyncio
+import sys
+
+from aiohttp import web
+
+from http_client import HTTPClient, HTTPError, ResponseTooLarge, URLLocks
+
+PER_HOST = 2
+BODY = b'x' * 4096
+
+
+async def start_stub():
+    state = {'active': 0, 'peak': 0}
+
+    async def small(request):
+        return web.Response(body=BODY)
+
+    async def large(request):
+        return web.Response(body=BODY * 64)
+
+    async def streamed(request):
+        # No Content-Length, so the cap has to trip while reading
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for _ in range(64):
+            await response.write(BODY)
+        await response.write_eof()
+        return response
+
+    async def slow(request):
+        await asyncio.sleep(5)
+        return web.Response(body=BODY)
+
+    async def busy(request):
+        state['active'] += 1
+        state['peak'] = max(state['peak'], state['active'])
+        await asyncio.sleep(0.2)
+        state['active'] -= 1
+        return web.Response(body=BODY)
+
+    async def not_modified(request):
+        return web.Response(status=304)
+
+    app = web.Application()
+    app.add_routes([web.get('/small', small), web.get('/large', large), web.get('/streamed', streamed),
+                    web.get('/slow', slow), web.get('/busy', busy), web.get('/not-modified', not_modified)])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}', state
+
+
+async def expect_error(error, request) -> bool:
+    try:
+        await request
+    except error:
+        return True
+    except HTTPError:
+        return False
+    return False
+
+
+async def check_url_locks():
+    locks = URLLocks()
+    state = {'active': 0, 'peak': 0}
+
+    async def fetch(url):
+        async with locks.hold(url):
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+            await asyncio.sleep(0.01)
+            state['active'] -= 1
+
+    await asyncio.gather(*(fetch(url) for url in ['a', 'a', 'a', 'b'] * 3))
+    return [("one fetch per URL at a time", state['peak'] == 2),
+            (f"URL locks are dropped once released ({len(locks)} left)", len(locks) == 0)]
+
+
+async def run_checks():
+    runner, base, state = await start_stub()
+    client = HTTPClient(per_host=PER_HOST, timeout=5)
+    results = []
+    try:
+        response = await client.get(f'{base}/small', max_bytes=len(BODY))
+        results.append(("body at the cap is returned", response.status == 200 and response.body == BODY))
+        results.append(("Content-Length over the cap is refused",
+                        await expect_error(ResponseTooLarge, client.get(f'{base}/large', max_bytes=len(BODY)))))
+        results.append(("streamed body over the cap is refused",
+                        await expect_error(ResponseTooLarge, client.get(f'{base}/streamed', max_bytes=len(BODY)))))
+        results.append(("slow response times out",
+                        await expect_error(HTTPError, client.get(f'{base}/slow', timeout=0.5))))
+        response = await client.get(f'{base}/not-modified')
+        results.append(("304 is returned, not raised", response.status == 304))
+
+        await asyncio.gather(*(client.get(f'{base}/busy') for _ in range(PER_HOST * 4)))
+        results.append((f"at most {PER_HOST} requests per host at once (saw {state['peak']})",
+                        state['peak'] == PER_HOST))
+        results.extend(await check_url_locks())
+    finally:
+        await client.close()
+        await runner.cleanup()
+    return results
+
+
+def main():
+    failures = 0
+    for name, passed in asyncio.run(run_checks()):
+        print(f"{'✅' if passed else '❌'} {name}")
+        failures += not passed
+    if failures:
+        print(f"\n❌ {failures} HTTP client checks failed")
+        sys.exit(1)
+    print("\n✅ HTTP client checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Check that every study query is served by an index
+Builds the study schema in memory (fresh and upgraded from the legacy layout),
+then runs EXPLAIN QUERY PLAN on each query in study_schema.STUDY_QUERIES.
+Run: python check_study_indexes.py
+"""
+
+import sqlite3
+import sys
+
+from study_rollup import create_rollup_table, create_streak_table
+from study_schema import STUDY_QUERIES, create_study_tables
+
+# The tables as older deployments created them: no keys, no indexes, no PDF columns
+LEGACY_TABLES = [
+    '''CREATE TABLE study_sessions (user_id INTEGER, guild_id INTEGER, session_id TEXT, study_type TEXT,
+       subject TEXT, mood TEXT, intended_duration INTEGER, start_time TEXT, last_activity TEXT)''',
+    '''CREATE TABLE study_history (user_id INTEGER, guild_id INTEGER, session_id TEXT, study_type TEXT,
+       subject TEXT, mood TEXT, intended_duration INTEGER, start_time TEXT, end_time TEXT,
+       actual_duration INTEGER, completed INTEGER)''',
+    '''CREATE TABLE study_answers (user_id INTEGER, guild_id INTEGER, session_id TEXT,
+       question_number INTEGER, answer TEXT, is_correct INTEGER, timestamp TEXT)''',
+    '''CREATE TABLE study_bookmarks (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,
+       guild_id INTEGER, title TEXT, url TEXT, category TEXT, created_at TEXT)''',
+]
+
+
+def build(legacy: bool) -> sqlite3.Cursor:
+    c = sqlite3.connect(':memory:').cursor()
+    if legacy:
+        for ddl in LEGACY_TABLES:
+            c.execute(ddl)
+    create_study_tables(c)
+    create_study_tables(c)  # migrations must be safe to re-run
+    create_rollup_table(c)
+    create_streak_table(c)
+    return c
+
+
+def check(c: sqlite3.Cursor, label: str) -> int:
+    failures = 0
+    for name, query, params in STUDY_QUERIES:
+        plan = [row[3] for row in c.execute(f'EXPLAIN QUERY PLAN {query}', params)]
+        # "SEARCH ... USING" is an index lookup; a bare "SCAN <table>" reads every row
+        scans = [step for step in plan if step.startswith('SCAN') and 'USING' not in step]
+        if scans:
+            failures += 1
+            print(f"❌ [{label}] {name}: {'; '.join(plan)}")
+        else:
+            print(f"✅ [{label}] {name}: {'; '.join(plan)}")
+    return failures
+
+
+def main():
+    failures = check(build(legacy=False), 'fresh') + check(build(legacy=True), 'upgraded')
+    if failures:
+        print(f"\n❌ {failures} study queries are not using an index")
+        sys.exit(1)
+    print("\n✅ All study queries use an index")
+
+
+if __name__ == "__main__":
+    main()
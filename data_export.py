@@ -0,0 +1,206 @@
+"""
+Data Export for Questuza Discord Bot
+Streams export rows from the database into compressed files sized for Discord
+"""
+
+import abc
+import csv
+import datetime
+import gzip
+import io
+import json
+import sqlite3
+import tempfile
+import zipfile
+from typing import Dict, Iterable, List, NamedTuple, Sequence
+
+FORMATS = ('ndjson', 'csv')
+DEFAULT_FORMAT = 'ndjson'
+DEFAULT_FILE_LIMIT = 10 * 1024 * 1024  # Discord's attachment limit without boosts
+SIZE_HEADROOM = 512 * 1024  # compressor buffers and archive trailers not yet on disk
+SPOOL_BYTES = 1024 * 1024  # parts larger than this are spooled to a temporary file
+FETCH_ROWS = 500
+
+
+def get_db_connection():
+    """Get database connection"""
+    conn = sqlite3.connect('questuza.db', check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class ExportSection(NamedTuple):
+    """One query whose rows become one section of the export"""
+    name: str
+    sql: str
+    params: Sequence
+    drop: Sequence[str] = ()
+
+
+class ExportPart(NamedTuple):
+    filename: str
+    file: io.IOBase
+    size: int
+
+
+class ExportResult(NamedTuple):
+    parts: List[ExportPart]
+    row_counts: Dict[str, int]
+
+
+class _Writer(abc.ABC):
+    """Writes records into numbered parts, starting a new part near the size limit"""
+
+    extension = ''
+
+    def __init__(self, basename: str, limit: int):
+        self.basename = basename
+        self.limit = max(limit - SIZE_HEADROOM, SIZE_HEADROOM)
+        self.parts: List[ExportPart] = []
+        self._raw = None
+
+    def _open_part(self):
+        self._raw = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+
+    def _close_part(self):
+        size = self._raw.tell()
+        self._raw.seek(0)
+        self.parts.append(ExportPart(f"{self.basename}.part{len(self.parts) + 1}{self.extension}",
+                                     self._raw, size))
+        self._raw = None
+
+    def _full(self) -> bool:
+        return self._raw.tell() >= self.limit
+
+    @abc.abstractmethod
+    def write(self, section: str, columns: List[str], row: Sequence):
+        """Append one row of `section` to the current part"""
+
+    def empty_section(self, section: str, columns: List[str]):
+        pass
+
+    def end_section(self, section: str):
+        pass
+
+    def finish(self) -> List[ExportPart]:
+        if self._raw is not None:
+            self._close_part()
+        if len(self.parts) == 1:
+            only = self.parts[0]
+            self.parts[0] = only._replace(filename=f"{self.basename}{self.extension}")
+        return self.parts
+
+
+class _NDJSONWriter(_Writer):
+    """One JSON object per line, tagged with its section, gzip-compressed"""
+
+    extension = '.ndjson.gz'
+
+    def __init__(self, basename: str, limit: int):
+        super().__init__(basename, limit)
+        self._gzip = None
+
+    def write(self, section: str, columns: List[str], row: Sequence):
+        if self._gzip is None:
+            self._open_part()
+            self._gzip = gzip.GzipFile(fileobj=self._raw, mode='wb')
+        record = {'section': section}
+        record.update(zip(columns, row))
+        self._gzip.write(json.dumps(record, default=str).encode('utf-8') + b'\n')
+        if self._full():
+            self._close_part()
+
+    def _close_part(self):
+        self._gzip.close()
+        self._gzip = None
+        super()._close_part()
+
+
+class _CSVWriter(_Writer):
+    """One CSV file per section inside a zip archive; a section split across parts repeats its header"""
+
+    extension = '.zip'
+
+    def __init__(self, basename: str, limit: int):
+        super().__init__(basename, limit)
+        self._zip = None
+        self._member = None
+        self._csv = None
+        self._section = None
+
+    def _open_member(self, section: str, columns: List[str]):
+        if self._zip is None:
+            self._open_part()
+            self._zip = zipfile.ZipFile(self._raw, mode='w', compression=zipfile.ZIP_DEFLATED)
+        self._member = io.TextIOWrapper(self._zip.open(f"{section}.csv", mode='w'),
+                                        encoding='utf-8', newline='')
+        self._csv = csv.writer(self._member)
+        self._csv.writerow(columns)
+        self._section = section
+
+    def _close_member(self):
+        self._member.close()
+        self._member = self._csv = self._section = None
+
+    def write(self, section: str, columns: List[str], row: Sequence):
+        if self._section != section:
+            self._open_member(section, columns)
+        self._csv.writerow(row)
+        if self._full():
+            self._close_part()
+
+    def empty_section(self, section: str, columns: List[str]):
+        self._open_member(section, columns)
+
+    def end_section(self, section: str):
+        if self._section == section:
+            self._close_member()
+
+    def _close_part(self):
+        if self._member is not None:
+            self._close_member()
+        self._zip.close()
+        self._zip = None
+        super()._close_part()
+
+
+_WRITERS = {'ndjson': _NDJSONWriter, 'csv': _CSVWriter}
+
+
+def export_rows(basename: str, header: Dict, sections: Iterable[ExportSection],
+                fmt: str = DEFAULT_FORMAT, limit: int = DEFAULT_FILE_LIMIT) -> ExportResult:
+    """Stream `sections` from the database into compressed parts no larger than `limit`.
+
+    Rows are read from the cursor in batches and written straight into the compressor,
+    so memory stays flat however much history a user has. Blocking; run it in a thread.
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    writer = _WRITERS[fmt](basename, limit)
+    header = dict(header, export_date=datetime.datetime.now().isoformat(), format=fmt)
+    writer.write('export', list(header), list(header.values()))
+    writer.end_section('export')
+
+    row_counts = {}
+    conn = get_db_connection()
+    try:
+        for section in sections:
+            c = conn.execute(section.sql, section.params)
+            names = [column[0] for column in c.description]
+            keep = [i for i, name in enumerate(names) if name not in section.drop]
+            columns = [names[i] for i in keep]
+            count = 0
+            while True:
+                rows = c.fetchmany(FETCH_ROWS)
+                if not rows:
+                    break
+                for row in rows:
+                    writer.write(section.name, columns, [row[i] for i in keep])
+                count += len(rows)
+            if not count:
+                writer.empty_section(section.name, columns)
+            writer.end_section(section.name)
+            row_counts[section.name] = count
+    finally:
+        conn.close()
+    return ExportResult(writer.finish(), row_counts)
@@ -0,0 +1,145 @@
+"""
+Async HTTP Client for Questuza Discord Bot
+One pooled aiohttp session for every outbound fetch, with per-host limits and size caps
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, List, Mapping, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+TOTAL_CONNECTIONS = 50
+PER_HOST_CONCURRENCY = 4
+DEFAULT_TIMEOUT = 15  # seconds for the whole request
+CONNECT_TIMEOUT = 5
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+USER_AGENT = "Questuza-Bot"
+
+
+class HTTPError(Exception):
+    """A fetch failed; the message is safe to show users"""
+
+
+class ResponseTooLarge(HTTPError):
+    pass
+
+
+class HTTPResponse(NamedTuple):
+    status: int
+    headers: Mapping[str, str]  # case-insensitive
+    body: bytes
+
+    @property
+    def content_type(self) -> str:
+        return self.headers.get('Content-Type', '').lower()
+
+
+class URLLocks:
+    """One asyncio.Lock per URL so concurrent requests for it share a single fetch.
+
+    A lock is dropped once nobody holds it or waits for it, so the table only
+    ever holds the URLs being fetched right now.
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, List] = {}  # url -> [lock, tasks holding or waiting]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, url: str):
+        slot = self._locks.setdefault(url, [asyncio.Lock(), 0])
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if not slot[1]:
+                del self._locks[url]
+
+
+class HTTPClient:
+    """Shared aiohttp session created on first use.
+
+    Each host gets its own semaphore so one slow server can only tie up
+    PER_HOST_CONCURRENCY requests, never the whole pool.
+    """
+
+    def __init__(self, total_connections: int = TOTAL_CONNECTIONS,
+                 per_host: int = PER_HOST_CONCURRENCY, timeout: float = DEFAULT_TIMEOUT):
+        self.total_connections = total_connections
+        self.per_host = per_host
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.total_connections,
+                                             limit_per_host=self.per_host, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout, sock_connect=CONNECT_TIMEOUT),
+                headers={'User-Agent': USER_AGENT})
+        return self._session
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        return self._host_limits[host]
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def head(self, url: str, timeout: Optional[float] = None) -> HTTPResponse:
+        """HEAD request, following redirects"""
+        try:
+            async with self._host_limit(url):
+                async with self._get_session().head(
+                        url, allow_redirects=True,
+                        timeout=aiohttp.ClientTimeout(total=timeout or self.timeout)) as response:
+                    return HTTPResponse(response.status, response.headers.copy(), b'')
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            raise HTTPError(f"Request to {url} failed: {e}")
+
+    async def get(self, url: str, max_bytes: int = DEFAULT_MAX_BYTES,
+                  headers: Optional[Dict[str, str]] = None,
+                  timeout: Optional[float] = None) -> HTTPResponse:
+        """GET the body in chunks, aborting as soon as it passes `max_bytes`.
+
+        Non-2xx statuses other than 304 raise HTTPError.
+        """
+        try:
+            async with self._host_limit(url):
+                async with self._get_session().get(
+                        url, headers=headers,
+                        timeout=aiohttp.ClientTimeout(total=timeout or self.timeout)) as response:
+                    if response.status == 304:
+                        return HTTPResponse(304, response.headers.copy(), b'')
+                    if response.status >= 400:
+                        raise HTTPError(f"{url} returned HTTP {response.status}")
+                    if (response.content_length or 0) > max_bytes:
+                        raise ResponseTooLarge(f"Response is larger than {max_bytes // 1024} KB")
+                    body = bytearray()
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        body.extend(chunk)
+                        if len(body) > max_bytes:
+                            raise ResponseTooLarge(f"Response is larger than {max_bytes // 1024} KB")
+                    return HTTPResponse(response.status, response.headers.copy(), bytes(body))
+        except HTTPError:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logging.warning(f"GET {url} failed: {e}")
+            raise HTTPError(f"Request to {url} failed: {e}")
+
+
+http_client = HTTPClient()
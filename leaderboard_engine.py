@@ -0,0 +1,370 @@
+"""
+Leaderboard Engine for Questuza Discord Bot
+Keeps per-guild sorted leaderboards in memory and updates them incrementally
+"""
+
+import sqlite3
+import logging
+import time
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Optional, Tuple
+
+# Category -> columns it is ordered by (all descending)
+CATEGORIES = {
+    'overall': ('level', 'xp'),
+    'words': ('unique_words',),
+    'vc': ('vc_seconds',),
+    'quests': ('quests_completed',),
+    'xp': ('xp',),
+}
+
+STAT_FIELDS = ('level', 'xp', 'unique_words', 'vc_seconds', 'quests_completed')
+
+# Snapshots hold the top rows of each category for %lb to answer from directly
+SNAPSHOT_SIZE = 100
+SNAPSHOT_MAX_AGE = 30  # seconds before a changed guild is re-snapshotted
+SNAPSHOT_DELTA_THRESHOLD = 25  # changes that force a refresh regardless of age
+
+
+def get_db_connection():
+    """Get database connection with proper settings"""
+    conn = sqlite3.connect('questuza.db', check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class SortedKeyList:
+    """Bucketed sorted list with O(log n) search and positional slicing"""
+
+    LOAD = 512
+
+    def __init__(self, keys=()):
+        keys = sorted(keys)
+        self._buckets = [keys[i:i + self.LOAD] for i in range(0, len(keys), self.LOAD)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._len = len(keys)
+        self._offsets = None
+
+    def __len__(self):
+        return self._len
+
+    def _index(self) -> List[int]:
+        """Starting position of each bucket, rebuilt lazily after mutations"""
+        if self._offsets is None:
+            offsets, total = [], 0
+            for bucket in self._buckets:
+                offsets.append(total)
+                total += len(bucket)
+            self._offsets = offsets
+        return self._offsets
+
+    def add(self, key):
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+        else:
+            i = bisect_left(self._maxes, key)
+            if i == len(self._maxes):
+                i -= 1
+            bucket = self._buckets[i]
+            insort(bucket, key)
+            self._maxes[i] = bucket[-1]
+            if len(bucket) > self.LOAD * 2:
+                self._buckets[i:i + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+                self._maxes[i:i + 1] = [bucket[self.LOAD - 1], bucket[-1]]
+        self._len += 1
+        self._offsets = None
+
+    def discard(self, key) -> bool:
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return False
+        bucket = self._buckets[i]
+        j = bisect_left(bucket, key)
+        if j == len(bucket) or bucket[j] != key:
+            return False
+        del bucket[j]
+        if bucket:
+            self._maxes[i] = bucket[-1]
+        else:
+            del self._buckets[i]
+            del self._maxes[i]
+        self._len -= 1
+        self._offsets = None
+        return True
+
+    def bisect_left(self, key) -> int:
+        """Number of keys strictly less than key"""
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return self._len
+        return self._index()[i] + bisect_left(self._buckets[i], key)
+
+    def bisect_right(self, key) -> int:
+        """Number of keys less than or equal to key"""
+        i = bisect_right(self._maxes, key)
+        if i == len(self._maxes):
+            return self._len
+        return self._index()[i] + bisect_right(self._buckets[i], key)
+
+    def slice(self, start: int, stop: int) -> list:
+        start, stop = max(start, 0), min(stop, self._len)
+        if start >= stop:
+            return []
+        offsets = self._index()
+        i = bisect_right(offsets, start) - 1
+        pos = start - offsets[i]
+        result = []
+        while len(result) < stop - start and i < len(self._buckets):
+            result.extend(self._buckets[i][pos:pos + (stop - start - len(result))])
+            i += 1
+            pos = 0
+        return result
+
+
+def _sort_key(category: str, user_id: int, stats: Tuple) -> Optional[tuple]:
+    """Ascending key for a category, or None when the user is not ranked in it"""
+    values = [stats[STAT_FIELDS.index(field)] or 0 for field in CATEGORIES[category]]
+    if category != 'overall' and values[0] <= 0:
+        return None
+    return tuple(-v for v in values) + (user_id,)
+
+
+def _cursor_key(row: Tuple) -> tuple:
+    user_id, values = row
+    return tuple(-v for v in values) + (user_id,)
+
+
+def _rows(keys: list) -> List[Tuple[int, Tuple]]:
+    return [(key[-1], tuple(-v for v in key[:-1])) for key in keys]
+
+
+class GuildLeaderboard:
+    """All category leaderboards for one guild"""
+
+    def __init__(self, guild_id: int, rows):
+        self.guild_id = guild_id
+        self.stats: Dict[int, Tuple] = {}
+        keys = {category: [] for category in CATEGORIES}
+        for row in rows:
+            stats = tuple(row[field] or 0 for field in STAT_FIELDS)
+            self.stats[row['user_id']] = stats
+            for category in CATEGORIES:
+                key = _sort_key(category, row['user_id'], stats)
+                if key is not None:
+                    keys[category].append(key)
+        self.boards = {category: SortedKeyList(keys[category]) for category in CATEGORIES}
+        self.version = 0
+
+    def update(self, user_id: int, stats: Tuple):
+        old = self.stats.get(user_id)
+        if old == stats:
+            return
+        self.version += 1
+        for category, board in self.boards.items():
+            if old is not None:
+                old_key = _sort_key(category, user_id, old)
+                if old_key is not None:
+                    board.discard(old_key)
+            new_key = _sort_key(category, user_id, stats)
+            if new_key is not None:
+                board.add(new_key)
+        self.stats[user_id] = stats
+
+    def remove(self, user_id: int):
+        old = self.stats.pop(user_id, None)
+        if old is None:
+            return
+        self.version += 1
+        for category, board in self.boards.items():
+            old_key = _sort_key(category, user_id, old)
+            if old_key is not None:
+                board.discard(old_key)
+
+    def count(self, category: str) -> int:
+        return len(self.boards[category])
+
+    def page(self, category: str, offset: int, limit: int) -> List[Tuple[int, Tuple]]:
+        """Rows as (user_id, values) in leaderboard order"""
+        return _rows(self.boards[category].slice(offset, offset + limit))
+
+    def window(self, category: str, after: Optional[Tuple] = None,
+               before: Optional[Tuple] = None, limit: int = 10) -> Tuple[int, List[Tuple[int, Tuple]]]:
+        """Keyset page next to a cursor row (user_id, values), returned with its offset"""
+        board = self.boards[category]
+        if before is not None:
+            start = max(0, board.bisect_left(_cursor_key(before)) - limit)
+        elif after is not None:
+            start = board.bisect_right(_cursor_key(after))
+        else:
+            start = 0
+        return start, _rows(board.slice(start, start + limit))
+
+    def rank(self, category: str, user_id: int) -> int:
+        """1-based rank counting users strictly ahead, or 0 when unranked"""
+        stats = self.stats.get(user_id)
+        if stats is None:
+            return 0
+        key = _sort_key(category, user_id, stats)
+        if key is None:
+            return 0
+        return self.boards[category].bisect_left(key[:-1]) + 1
+
+    def checksum(self) -> Tuple:
+        """Row count and column sums, comparable with the SQLite equivalent"""
+        sums = [0] * len(STAT_FIELDS)
+        for stats in self.stats.values():
+            for i, value in enumerate(stats):
+                sums[i] += value
+        return (len(self.stats), *sums)
+
+
+class LeaderboardSnapshot:
+    """Top rows and total of one category, frozen at build time"""
+
+    def __init__(self, board: GuildLeaderboard, category: str):
+        self.board = board
+        self.version = board.version
+        self.total = board.count(category)
+        self.rows = board.page(category, 0, SNAPSHOT_SIZE)
+        self.built_at = time.time()
+        self.verified_at = self.built_at  # last time the board was found unchanged
+        self._positions = {row[0]: i for i, row in enumerate(self.rows)}
+
+    @property
+    def age(self) -> int:
+        """Seconds since the snapshot was last known to match the board"""
+        return int(time.time() - self.verified_at)
+
+    def _covers(self, start: int, limit: int) -> bool:
+        return start + limit <= len(self.rows) or len(self.rows) == self.total
+
+    def page(self, offset: int, limit: int) -> Optional[List[Tuple[int, Tuple]]]:
+        """Rows for a page, or None when it lies beyond the snapshot"""
+        if not self._covers(offset, limit):
+            return None
+        return self.rows[offset:offset + limit]
+
+    def window(self, after: Optional[Tuple] = None, before: Optional[Tuple] = None,
+               limit: int = 10) -> Optional[Tuple[int, List[Tuple[int, Tuple]]]]:
+        """Same as GuildLeaderboard.window, or None when the cursor is not in the snapshot"""
+        cursor = before if before is not None else after
+        position = self._positions.get(cursor[0]) if cursor is not None else None
+        if position is None or self.rows[position] != cursor:
+            return None
+        start = max(0, position - limit) if before is not None else position + 1
+        if not self._covers(start, limit):
+            return None
+        return start, self.rows[start:start + limit]
+
+
+_guilds: Dict[int, GuildLeaderboard] = {}
+_snapshots: Dict[Tuple[int, str], LeaderboardSnapshot] = {}
+
+
+def _load_guild(guild_id: int) -> GuildLeaderboard:
+    conn = get_db_connection()
+    rows = conn.execute(
+        f'''SELECT user_id, {", ".join(STAT_FIELDS)} FROM users WHERE guild_id = ?''',
+        (guild_id,)).fetchall()
+    conn.close()
+    return GuildLeaderboard(guild_id, rows)
+
+
+def is_loaded(guild_id: int) -> bool:
+    """Whether the guild's leaderboard is already held in memory"""
+    return guild_id in _guilds
+
+
+def get_leaderboard(guild_id: int) -> GuildLeaderboard:
+    """Get a guild's leaderboard, loading it from SQLite on first use"""
+    board = _guilds.get(guild_id)
+    if board is None:
+        board = _guilds[guild_id] = _load_guild(guild_id)
+    return board
+
+
+def get_snapshot(guild_id: int, category: str) -> LeaderboardSnapshot:
+    """Get the latest snapshot of a category, building the first one on demand"""
+    snapshot = _snapshots.get((guild_id, category))
+    if snapshot is None:
+        snapshot = _snapshots[(guild_id, category)] = LeaderboardSnapshot(
+            get_leaderboard(guild_id), category)
+    return snapshot
+
+
+def refresh_snapshots() -> int:
+    """Rebuild snapshots that are stale by age or by number of changes"""
+    refreshed = 0
+    for (guild_id, category), snapshot in list(_snapshots.items()):
+        board = _guilds.get(guild_id)
+        if board is None:
+            del _snapshots[(guild_id, category)]
+            continue
+        changes = board.version - snapshot.version if board is snapshot.board else SNAPSHOT_DELTA_THRESHOLD
+        if changes >= SNAPSHOT_DELTA_THRESHOLD or (changes and snapshot.age >= SNAPSHOT_MAX_AGE):
+            _snapshots[(guild_id, category)] = LeaderboardSnapshot(board, category)
+            refreshed += 1
+        elif not changes:
+            # Nothing moved, so the snapshot is still current
+            snapshot.verified_at = time.time()
+    return refreshed
+
+
+def apply_user_update(user_data: Dict):
+    """Apply a written users row to the guild's leaderboard if it is loaded"""
+    board = _guilds.get(user_data['guild_id'])
+    if board is not None:
+        board.update(user_data['user_id'],
+                     tuple(user_data.get(field) or 0 for field in STAT_FIELDS))
+
+
+def refresh_users(guild_id: int, user_ids: List[int]):
+    """Re-read users changed by direct SQL writes"""
+    board = _guilds.get(guild_id)
+    if board is None or not user_ids:
+        return
+    conn = get_db_connection()
+    placeholders = ", ".join("?" * len(user_ids))
+    rows = conn.execute(
+        f'''SELECT user_id, {", ".join(STAT_FIELDS)} FROM users
+            WHERE guild_id = ? AND user_id IN ({placeholders})''',
+        (guild_id, *user_ids)).fetchall()
+    conn.close()
+    found = set()
+    for row in rows:
+        board.update(row['user_id'], tuple(row[field] or 0 for field in STAT_FIELDS))
+        found.add(row['user_id'])
+    for user_id in set(user_ids) - found:
+        board.remove(user_id)
+
+
+def invalidate(guild_id: Optional[int] = None):
+    """Drop cached leaderboards so they reload on next use"""
+    if guild_id is None:
+        _guilds.clear()
+        _snapshots.clear()
+    else:
+        _guilds.pop(guild_id, None)
+        for key in [key for key in _snapshots if key[0] == guild_id]:
+            del _snapshots[key]
+
+
+def verify_consistency() -> List[int]:
+    """Compare loaded guilds with SQLite and rebuild any that drifted"""
+    if not _guilds:
+        return []
+    conn = get_db_connection()
+    rows = conn.execute(
+        f'''SELECT guild_id, COUNT(*), {", ".join(f"COALESCE(SUM({f}), 0)" for f in STAT_FIELDS)}
+            FROM users GROUP BY guild_id''').fetchall()
+    conn.close()
+    expected = {row[0]: tuple(row[1:]) for row in rows}
+
+    rebuilt = []
+    for guild_id, board in list(_guilds.items()):
+        if board.checksum() != expected.get(guild_id, (0,) * (len(STAT_FIELDS) + 1)):
+            logging.warning(f"Leaderboard drift detected for guild {guild_id}, rebuilding")
+            _guilds[guild_id] = _load_guild(guild_id)
+            rebuilt.append(guild_id)
+    return rebuilt
@@ -20,10 +20,23 @@ from quest_system import (init_quest_tables, get_all_quests,
 from level_system import (LEVEL_REQUIREMENTS, UNIQUE_QUESTS, get_xp_for_level,
                           get_level_from_xp, get_unique_quest_for_level,
                           get_required_unique_quests_count)
-from PIL import Image, ImageDraw, ImageFont
-import requests
+import leaderboard_engine
+from pagination import keyset_page, cursor_of
+from member_names import NameResolver
+from voice_tracker import (VoiceTracker, VC_ACCRUAL_SECONDS, VC_MUTED, VC_DEAFENED,
+                           VC_AFK, VC_ALONE, VC_STATE_NAMES, close_orphaned_sessions)
+import study_scheduler
+from pdf_service import extract_pdf_text, extract_pdf_page_texts, render_pdf_page, shutdown as shutdown_pdf_workers
+from answer_key import parse_answer_key
+from answer_key_store import AnswerKeyStore
+from study_rollup import (create_rollup_table, rebuild_rollups, record_session,
+                          create_streak_table, rebuild_streaks, get_streak, active_streak_cutoff)
+from study_schema import create_study_tables
+from http_client import http_client, HTTPError
+from profile_card import CardInputs, CardRenderer, RendererBusy, CARD_FIELDS
+from card_assets import AssetCache
+from data_export import ExportSection, export_rows, FORMATS as EXPORT_FORMATS, DEFAULT_FORMAT as DEFAULT_EXPORT_FORMAT
 from io import BytesIO
-# import fitz  # PyMuPDF for PDF handling - Optional, install if needed: pip install PyMuPDF
 
 # Bot version - Update this when making changes
 VERSION = "6.1.4"
@@ -47,12 +60,22 @@ def run_flask():
     flask_app.run(host='0.0.0.0', port=8080, debug=False, use_reloader=False)
 
 
-# Start Flask in background — only once!
-Thread(target=run_flask, daemon=True).start()
+class QuestuzaBot(commands.Bot):
+    """Bot that also stops its worker pools and HTTP session when it closes"""
+
+    async def close(self):
+        await super().close()
+        card_renderer.shutdown()
+        shutdown_pdf_workers()
+        await http_client.close()
+
 
 # Bot configuration
 intents = discord.Intents.all()
-bot = commands.Bot(command_prefix='%', intents=intents, help_command=None)
+bot = QuestuzaBot(command_prefix='%', intents=intents, help_command=None)
+name_resolver = NameResolver(bot)
+voice_tracker = VoiceTracker()
+answer_keys = AnswerKeyStore()
 
 # Spam protection settings
 SPAM_CHANNEL_ID = 1158615333289086997  # channel where spam is allowed (very reduced XP)
@@ -332,8 +355,126 @@ def init_db():
                 else:
                     raise
 
+    # Version 11: Composite index for rank lookups
+    if current_version < 11:
+        print("📊 Adding leaderboard rank index...")
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_users_rank
+                     ON users(guild_id, level, xp)''')
+        print("✅ Added index: idx_users_rank")
+
+    # Version 12: Track credited VC time on open sessions for live accrual
+    if current_version < 12:
+        print("🎧 Adding VC accrual fields to voice sessions...")
+        columns_to_add = [
+            ('credited_seconds', 'INTEGER DEFAULT 0'),  # Seconds already credited to the user
+            ('last_credit_time', 'TEXT'),  # When the session was last credited
+        ]
+
+        for col_name, col_type in columns_to_add:
+            try:
+                c.execute(f'ALTER TABLE voice_sessions ADD COLUMN {col_name} {col_type}')
+                print(f"✅ Added column: {col_name}")
+            except sqlite3.OperationalError as e:
+                if "duplicate column" in str(e).lower():
+                    print(f"✅ Column {col_name} already exists, skipping...")
+                else:
+                    raise
+
+    # Version 13: Voice segments per channel/state and guild VC credit policy
+    if current_version < 13:
+        print("🎧 Adding voice segment tracking...")
+        c.execute('''CREATE TABLE IF NOT EXISTS voice_segments
+                     (user_id INTEGER, guild_id INTEGER, channel_id INTEGER,
+                      state INTEGER DEFAULT 0, start_time TEXT, seconds INTEGER DEFAULT 0)''')
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_voice_segments_user
+                     ON voice_segments(guild_id, user_id, start_time)''')
+        print("✅ Created table: voice_segments")
+        try:
+            c.execute('ALTER TABLE guild_settings ADD COLUMN vc_excluded_states INTEGER')
+            print("✅ Added column: vc_excluded_states")
+        except sqlite3.OperationalError as e:
+            if "duplicate column" in str(e).lower():
+                print("✅ Column vc_excluded_states already exists, skipping...")
+            else:
+                raise
+
+    # Version 14: Answer keys move from study_answers into study_answer_keys
+    if current_version < 14:
+        print("🔑 Moving answer keys into their own table...")
+        c.execute('''CREATE TABLE IF NOT EXISTS study_answer_keys
+                     (session_id TEXT NOT NULL, question_number INTEGER NOT NULL, answer TEXT NOT NULL,
+                      PRIMARY KEY (session_id, question_number)) WITHOUT ROWID''')
+        print("✅ Created table: study_answer_keys")
+        # Keys used to be stored as is_correct = 1 rows in study_answers, loaded by the
+        # session owner (who wrote the session's first such row). An owner row is a key
+        # when it is the first for its question, when it predates the session's first
+        # real attempt (a wrong answer or another member's answer), or when it differs
+        # from the row before it: a correct attempt always repeats the current key, a
+        # manual correction does not. The latest key wins, and every key row leaves
+        # study_answers so accuracy stats and the rollup backfill below count attempts only.
+        try:
+            c.execute('DROP TABLE IF EXISTS temp.legacy_key_rows')
+            c.execute('''CREATE TEMP TABLE legacy_key_rows AS
+                         WITH owners AS (
+                             SELECT session_id, user_id FROM study_answers
+                             WHERE rowid IN (SELECT MIN(rowid) FROM study_answers
+                                             WHERE is_correct = 1 AND session_id IS NOT NULL
+                                             GROUP BY session_id)),
+                         first_attempts AS (
+                             SELECT a.session_id, MIN(a.timestamp) AS first_attempt
+                             FROM study_answers a JOIN owners o ON o.session_id = a.session_id
+                             WHERE a.is_correct = 0 OR a.user_id != o.user_id
+                             GROUP BY a.session_id),
+                         owner_rows AS (
+                             SELECT a.rowid AS row_id, a.session_id, a.question_number, a.answer,
+                                    a.timestamp,
+                                    LAG(UPPER(a.answer)) OVER (PARTITION BY a.session_id, a.question_number
+                                                               ORDER BY a.rowid) AS previous
+                             FROM study_answers a JOIN owners o
+                                  ON o.session_id = a.session_id AND o.user_id = a.user_id
+                             WHERE a.is_correct = 1 AND a.question_number IS NOT NULL)
+                         SELECT r.row_id, r.session_id, r.question_number, r.answer
+                         FROM owner_rows r LEFT JOIN first_attempts f ON f.session_id = r.session_id
+                         WHERE r.previous IS NULL OR r.previous != UPPER(r.answer)
+                         OR r.timestamp < f.first_attempt''')
+            c.execute('''INSERT OR REPLACE INTO study_answer_keys (session_id, question_number, answer)
+                         SELECT session_id, question_number, UPPER(answer) FROM legacy_key_rows
+                         WHERE row_id IN (SELECT MAX(row_id) FROM legacy_key_rows
+                                          GROUP BY session_id, question_number)''')
+            print(f"✅ Copied {c.rowcount} existing answer key entries")
+            c.execute('DELETE FROM study_answers WHERE rowid IN (SELECT row_id FROM legacy_key_rows)')
+            print(f"✅ Removed {c.rowcount} answer key rows from study_answers")
+            c.execute('DROP TABLE legacy_key_rows')
+        except sqlite3.OperationalError:
+            print("✅ No study_answers table yet, nothing to copy")
+
+    # Version 15: Daily study rollups, backfilled from study history
+    if current_version < 15:
+        print("📊 Adding daily study rollups...")
+        create_rollup_table(c)
+        print("✅ Created table: study_daily_rollup")
+        try:
+            print(f"✅ Backfilled {rebuild_rollups(c)} rollup rows from study history")
+        except sqlite3.OperationalError:
+            print("✅ No study history yet, nothing to backfill")
+
+    # Version 16: Study tables and their indexes created in one place
+    if current_version < 16:
+        print("📚 Creating study tables and indexes...")
+        create_study_tables(c)
+        print("✅ Study tables ready: study_sessions, study_history, study_answers, study_bookmarks")
+
+    # Version 17: Study streaks, backfilled from the daily rollups
+    if current_version < 17:
+        print("🔥 Adding study streaks...")
+        create_streak_table(c)
+        try:
+            print(f"✅ Backfilled streaks for {rebuild_streaks(c)} users")
+        except sqlite3.OperationalError:
+            print("✅ No study rollups yet, nothing to backfill")
+
     # Insert/update version info
-    version_to_set = 10 if current_version < 10 else current_version
+    version_to_set = 17 if current_version < 17 else current_version
     c.execute('''INSERT OR REPLACE INTO db_version (version, updated_at)
                  VALUES (?, ?)''', (version_to_set, datetime.datetime.now().isoformat()))
 
@@ -342,29 +483,29 @@ def init_db():
     print("✅ Database initialized/updated successfully")
 
 
-# Initialize database with safety checks
-try:
-    init_db()
-    init_quest_tables()
-    print("✅ Quest system initialized")
-except Exception as e:
-    print(f"❌ Database initialization error: {e}")
-    # Try to restore from most recent backup
-    import os
-    import glob
+def init_database():
+    """Initialize database with safety checks, restoring the latest backup on failure"""
+    try:
+        init_db()
+        init_quest_tables()
+        print("✅ Quest system initialized")
+    except Exception as e:
+        print(f"❌ Database initialization error: {e}")
+        # Try to restore from most recent backup
+        import glob
+        import shutil
 
-    backup_files = glob.glob('backups/questuza_backup_*.db')
-    if backup_files:
-        latest_backup = max(backup_files, key=os.path.getctime)
-        try:
-            import shutil
-            shutil.copy2(latest_backup, 'questuza.db')
-            print(f"✅ Restored from backup: {latest_backup}")
-            init_db()  # Try initialization again
-        except Exception as restore_error:
-            print(f"❌ Backup restoration failed: {restore_error}")
-    else:
-        print("❌ No backup files found")
+        backup_files = glob.glob('backups/questuza_backup_*.db')
+        if backup_files:
+            latest_backup = max(backup_files, key=os.path.getctime)
+            try:
+                shutil.copy2(latest_backup, 'questuza.db')
+                print(f"✅ Restored from backup: {latest_backup}")
+                init_db()  # Try initialization again
+            except Exception as restore_error:
+                print(f"❌ Backup restoration failed: {restore_error}")
+        else:
+            print("❌ No backup files found")
 
 
 
@@ -531,6 +672,12 @@ def get_db_connection():
         raise Exception(f"Database connection error: {e}")
 
 
+# Counters the voice checkpoint adds to directly. update_user_data writes them as the
+# change since get_user_data read them, so a checkpoint in between is not overwritten.
+DELTA_COUNTERS = ('vc_seconds', 'xp')
+READ_COUNTERS = '_read_counters'
+
+
 def get_user_data(user_id: int, guild_id: int) -> Dict:
     """Get user data with error handling"""
     try:
@@ -542,7 +689,9 @@ def get_user_data(user_id: int, guild_id: int) -> Dict:
         conn.close()
 
         if result:
-            return dict(result)
+            user_data = dict(result)
+            user_data[READ_COUNTERS] = {field: user_data[field] for field in DELTA_COUNTERS}
+            return user_data
         return None
     except sqlite3.Error as e:
         logging.error(f"Error getting user data for {user_id}: {e}")
@@ -566,9 +715,18 @@ def update_user_data(user_data: Dict):
             exists = c.fetchone()
 
             if exists:
+                read = user_data.get(READ_COUNTERS)
+                if read is not None:
+                    counters = 'vc_seconds = MAX(0, vc_seconds + ?), level = ?, xp = MAX(0, xp + ?)'
+                    vc_seconds = (user_data['vc_seconds'] or 0) - (read['vc_seconds'] or 0)
+                    xp = (user_data['xp'] or 0) - (read['xp'] or 0)
+                else:
+                    # Built by hand rather than read, so there is nothing to diff against
+                    counters = 'vc_seconds = ?, level = ?, xp = ?'
+                    vc_seconds, xp = user_data['vc_seconds'], user_data['xp']
                 c.execute(
-                    '''UPDATE users SET
-                              unique_words = ?, vc_seconds = ?, level = ?, xp = ?,
+                    f'''UPDATE users SET
+                              unique_words = ?, {counters},
                               messages_sent = ?, images_sent = ?, channels_used = ?,
                               lifetime_words = ?, quests_completed = ?, custom_color = ?,
                               banner_url = ?, last_trivia_win = ?, xp_multiplier = ?,
@@ -576,8 +734,8 @@ def update_user_data(user_data: Dict):
                               daily_quests_completed = ?, weekly_quests_completed = ?,
                               last_daily_reset = ?, last_weekly_reset = ?
                               WHERE user_id = ? AND guild_id = ?''',
-                    (user_data['unique_words'], user_data['vc_seconds'],
-                     user_data['level'], user_data['xp'], user_data['messages_sent'],
+                    (user_data['unique_words'], vc_seconds,
+                     user_data['level'], xp, user_data['messages_sent'],
                      user_data['images_sent'], user_data['channels_used'],
                      user_data['lifetime_words'], user_data['quests_completed'],
                      user_data['custom_color'], user_data['banner_url'],
@@ -614,8 +772,15 @@ def update_user_data(user_data: Dict):
                      user_data.get('last_daily_reset'),
                      user_data.get('last_weekly_reset')))
 
+            # Pick up credits written since the read, and diff against them next time
+            c.execute('''SELECT vc_seconds, xp FROM users WHERE user_id = ? AND guild_id = ?''',
+                      (user_data['user_id'], user_data['guild_id']))
+            user_data.update(dict(c.fetchone()))
+            user_data[READ_COUNTERS] = {field: user_data[field] for field in DELTA_COUNTERS}
+
             conn.commit()
             conn.close()
+            leaderboard_engine.apply_user_update(user_data)
             return  # Success
 
         except sqlite3.OperationalError as e:
@@ -637,44 +802,28 @@ def update_user_data(user_data: Dict):
 
 def get_user_rank(user_id: int, guild_id: int) -> int:
     """Get user's rank in the overall leaderboard"""
+    if leaderboard_engine.is_loaded(guild_id):
+        return leaderboard_engine.get_leaderboard(guild_id).rank('overall', user_id)
+
     conn = get_db_connection()
     c = conn.cursor()
-    
-    # Get all users ordered by level DESC, xp DESC
-    c.execute('''SELECT user_id FROM users 
-                 WHERE guild_id = ? 
-                 ORDER BY level DESC, xp DESC''',
-              (guild_id,))
-    results = c.fetchall()
-    conn.close()
-    
-    # Find the rank (1-indexed)
-    for rank, (uid,) in enumerate(results, 1):
-        if uid == user_id:
-            return rank
-    
-    return 0  # User not found in leaderboard
 
+    c.execute('''SELECT level, xp FROM users
+                 WHERE user_id = ? AND guild_id = ?''',
+              (user_id, guild_id))
+    row = c.fetchone()
+    if not row:
+        conn.close()
+        return 0  # User not found in leaderboard
 
-def get_user_rank(user_id: int, guild_id: int) -> int:
-    """Get user's rank in the overall leaderboard"""
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Get all users ordered by level DESC, xp DESC
-    c.execute('''SELECT user_id FROM users 
-                 WHERE guild_id = ? 
-                 ORDER BY level DESC, xp DESC''',
-              (guild_id,))
-    results = c.fetchall()
+    # Count users strictly ahead; served from idx_users_rank without touching the table
+    c.execute('''SELECT COUNT(*) FROM users
+                 WHERE guild_id = ? AND (level, xp) > (?, ?)''',
+              (guild_id, row['level'], row['xp']))
+    ahead = c.fetchone()[0]
     conn.close()
-    
-    # Find the rank (1-indexed)
-    for rank, (uid,) in enumerate(results, 1):
-        if uid == user_id:
-            return rank
-    
-    return 0  # User not found in leaderboard
+
+    return ahead + 1
 
 
 def count_unique_words(text: str) -> int:
@@ -800,169 +949,19 @@ async def handle_study_session_recovery():
         logging.error(f"Error in handle_study_session_recovery: {e}")
 
 # Study system functions
-def validate_pdf_url(url):
+async def validate_pdf_url(url):
     """Validate if a URL points to a PDF"""
+    if not url.startswith(('http://', 'https://')):
+        return False
     try:
-        response = requests.head(url, timeout=10)
-        content_type = response.headers.get('content-type', '').lower()
-        return 'pdf' in content_type or url.lower().endswith('.pdf')
-    except:
+        response = await http_client.head(url, timeout=10)
+        return 'pdf' in response.content_type or url.lower().endswith('.pdf')
+    except HTTPError:
         return False
 
-# def extract_pdf_text(url):
-#     """Extract text from a PDF URL - Requires PyMuPDF (fitz)"""
-#     # try:
-#     #     response = requests.get(url, timeout=30)
-#     #     response.raise_for_status()
-#     #
-#     #     # Save to temporary file
-#     #     with open('temp_pdf.pdf', 'wb') as f:
-#     #         f.write(response.content)
-#     #
-#     #     # Extract text using PyMuPDF
-#     #     doc = fitz.open('temp_pdf.pdf')
-#     #     text = ""
-#     #     for page in doc:
-#     #         text += page.get_text()
-#     #     doc.close()
-#     #
-#     #     # Clean up
-#     #     import os
-#     #     os.remove('temp_pdf.pdf')
-#     #
-#     #     return text
-#     # except Exception as e:
-#     #     print(f"Error extracting PDF text: {e}")
-#     #     return None
-
-
-# def render_pdf_page(url, page_num=0, zoom=2.0):
-#     """Render a PDF page as an image - Requires PyMuPDF (fitz)"""
-#     # try:
-#     #     response = requests.get(url, timeout=30)
-#     #     response.raise_for_status()
-#     #
-#     #     # Save to temporary file
-#     #     with open('temp_pdf.pdf', 'wb') as f:
-#     #         f.write(response.content)
-#     #
-#     #     # Open PDF and render page
-#     #     doc = fitz.open('temp_pdf.pdf')
-#     #
-#     #     if page_num >= doc.page_count:
-#     #         doc.close()
-#     #         os.remove('temp_pdf.pdf')
-#     #         return None, f"Page {page_num + 1} does not exist. PDF has {doc.page_count} pages."
-#     #
-#     #     page = doc.load_page(page_num)
-#     #
-#     #     # Render page to image
-#     #     matrix = fitz.Matrix(zoom, zoom)  # Scale factor
-#     #     pix = page.get_pixmap(matrix=matrix)
-#     #
-#     #     # Save as PNG
-#     #     img_path = f'temp_page_{page_num}.png'
-#     #     pix.save(img_path)
-#     #
-#     #     doc.close()
-#     #     os.remove('temp_pdf.pdf')
-#     #
-#     #     return img_path, None
-# except Exception as e:
-#     print(f"Error rendering PDF page: {e}")
-#     # Clean up any temp files
-#     try:
-#         os.remove('temp_pdf.pdf')
-#     except:
-#         pass
-#     try:
-#         os.remove(f'temp_page_{page_num}.png')
-#     except:
-#         pass
-#     return None, str(e)
-
-# Stub functions for PDF support (require PyMuPDF to be installed)
-def extract_pdf_text(url):
-    """Stub: PDF text extraction requires PyMuPDF. Install with: pip install PyMuPDF"""
-    return None
-
-def render_pdf_page(url, page_num=0, zoom=2.0):
-    """Stub: PDF rendering requires PyMuPDF. Install with: pip install PyMuPDF"""
-    return None, "PDF support requires PyMuPDF. Install with: pip install PyMuPDF"
-
-def parse_answer_key(text, pattern=None):
-    """Parse answer key from PDF text using comprehensive patterns"""
-    answers = {}
-
-    if not pattern:
-        # Comprehensive patterns for answer keys
-        patterns = [
-            # Standard academic formats
-            r'Question\s*(\d+)[:\.\s]*[Aa]nswer[:\.\s]*([A-Z])',
-            r'(\d+)[\.\)]\s*[Aa]nswer[:\.\s]*([A-Z])',
-            r'Q(\d+)[:\.\s]*([A-Z])',
-            r'(\d+)\)\s*([A-Z])',
-            r'(\d+)[:\.\s]*([A-Z])',
-
-            # Alternative formats
-            r'(\d+)\s*=\s*([A-Z])',
-            r'(\d+)\s*-\s*([A-Z])',
-            r'(\d+)\s*\|\s*([A-Z])',
-            r'Item\s*(\d+)[:\.\s]*([A-Z])',
-
-            # Table-like formats
-            r'(\d+)\s+([A-Z])\s',
-            r'(\d{1,3})\s*\t\s*([A-Z])',
-
-            # Key/Answer key formats
-            r'[Aa]nswer\s+[Kk]ey[:\.\s]*(\d+)[:\.\s]*([A-Z])',
-            r'[Kk]ey[:\.\s]*(\d+)[:\.\s]*([A-Z])',
-
-            # Number-letter combinations
-            r'(\d{1,3})([A-Z])',
-        ]
-    else:
-        patterns = [pattern]
-
-    # Clean and normalize text
-    text = re.sub(r'\s+', ' ', text)  # Normalize whitespace
-
-    for pattern_regex in patterns:
-        matches = re.findall(pattern_regex, text, re.IGNORECASE)
-        for match in matches:
-            try:
-                if len(match) == 2:
-                    question_num = int(match[0])
-                    answer = match[1].upper().strip()
-                    # Validate answer is a single letter A-Z
-                    if len(answer) == 1 and answer.isalpha() and answer <= 'Z':
-                        answers[question_num] = answer
-            except (ValueError, IndexError):
-                continue
-
-    # Additional validation: remove obviously wrong matches
-    # (like if we have question 1000 with answer A, it's probably not valid)
-    max_reasonable_question = 200  # Most tests don't have more than 200 questions
-    answers = {q: a for q, a in answers.items() if q <= max_reasonable_question}
-
-    return answers
-
 def check_answer(session_id, question_num, user_answer):
     """Check if user's answer is correct"""
-    conn = get_db_connection()
-    c = conn.cursor()
-
-    # Get the correct answer for this session
-    c.execute('''SELECT answer FROM study_answers
-                 WHERE session_id = ? AND question_number = ? AND is_correct = 1''',
-             (session_id, question_num))
-    result = c.fetchone()
-    conn.close()
-
-    if result:
-        correct_answer = result[0].upper()
-        return user_answer.upper() == correct_answer, correct_answer
-    return False, None
+    return answer_keys.check(session_id, question_num, user_answer)
 
 # Bot events
 @bot.event
@@ -974,25 +973,48 @@ async def on_ready():
         await bot.change_presence(activity=discord.Activity(
             type=discord.ActivityType.watching, name="your quests | %help"))
 
-        # Handle offline VC tracking - catch up on missed time
+        try:
+            voice_tracker.load_policies()
+        except Exception as e:
+            logging.error(f"Error loading VC policies: {e}")
+
+        # Let card workers preload the font sizes most cards use
+        try:
+            conn = get_db_connection()
+            rows = conn.execute('''SELECT card_font_size FROM users GROUP BY card_font_size
+                                   ORDER BY COUNT(*) DESC LIMIT ?''', (COMMON_FONT_SIZES,)).fetchall()
+            conn.close()
+            card_renderer.preload_font_sizes = [row[0] for row in rows] or card_renderer.preload_font_sizes
+        except sqlite3.Error as e:
+            logging.error(f"Error loading common card font sizes: {e}")
+
+        # Reconcile VC sessions with who is in voice right now
         try:
             await handle_offline_vc_tracking()
         except Exception as e:
-            logging.error(f"Error during offline VC tracking catch-up: {e}")
+            logging.error(f"Error during VC session reconciliation: {e}")
 
         # Start the background tasks
         try:
             if not check_voice_sessions.is_running():
                 check_voice_sessions.start()
+            if not checkpoint_voice_sessions.is_running():
+                checkpoint_voice_sessions.start()
+            if not accrue_voice_time.is_running():
+                accrue_voice_time.start()
             if not send_keep_alive.is_running():
                 send_keep_alive.start()
                 print("💚 Keep-alive task started - sending messages every 2 minutes")
             if not schedule_trivia_questions.is_running():
                 schedule_trivia_questions.start()
                 print("🎯 Trivia auto-scheduler started - checking every 2 hours")
-            if not update_study_sessions.is_running():
-                update_study_sessions.start()
-                print("📚 Study session tracker started - updating every minute")
+            if not study_sessions_scheduler.is_running():
+                study_sessions_scheduler.start()
+                print("📚 Study session scheduler started - waking at the next deadline")
+            if not verify_leaderboards.is_running():
+                verify_leaderboards.start()
+            if not refresh_leaderboard_snapshots.is_running():
+                refresh_leaderboard_snapshots.start()
         except Exception as e:
             logging.error(f"Error starting background tasks: {e}")
 
@@ -1109,12 +1131,11 @@ async def on_resumed():
             except Exception as e:
                 print(f"❌ Failed to send recovery notification to {guild.name}: {e}")
 
-        # Handle offline VC tracking after reconnection
+        # Reconcile VC sessions after reconnection
         try:
             await handle_offline_vc_tracking()
-            print("✅ Offline VC tracking catch-up completed after reconnection")
         except Exception as e:
-            print(f"❌ Error during VC catch-up after reconnection: {e}")
+            print(f"❌ Error during VC reconciliation after reconnection: {e}")
 
     # Update bot status
     await bot.change_presence(activity=discord.Activity(
@@ -1247,6 +1268,7 @@ async def on_message(message):
             # Complete setup and start session
             session_id = f"{message.author.id}_{int(datetime.datetime.now().timestamp())}"
 
+            started_at = datetime.datetime.now()
             conn = get_db_connection()
             c = conn.cursor()
             c.execute('''INSERT INTO study_sessions
@@ -1256,10 +1278,12 @@ async def on_message(message):
                        (message.author.id, message.guild.id, session_id,
                         data.get('study_type'), data.get('subject'), data.get('mood'),
                         data.get('intended_duration'),
-                        datetime.datetime.now().isoformat(),
-                        datetime.datetime.now().isoformat()))
+                        started_at.isoformat(),
+                        started_at.isoformat()))
             conn.commit()
             conn.close()
+            schedule_study_session(message.author.id, message.guild.id, session_id,
+                                   data.get('study_type'), started_at, data.get('intended_duration'))
 
             # Clear setup state
             del study_setup_states[message.author.id]
@@ -1580,133 +1604,120 @@ async def on_message(message):
     await bot.process_commands(message)
 
 
-# SIMPLIFIED VC TRACKING - FIXED VERSION WITH 5-HOUR CAP
+# VC TRACKING - in-memory sessions, checkpointed to SQLite in batches with a 5-hour cap
+def get_voice_state_flags(member) -> int:
+    """Voice state bitmask for a member currently in a voice channel"""
+    voice = member.voice
+    flags = 0
+    if voice.self_mute or voice.mute:
+        flags |= VC_MUTED
+    if voice.self_deaf or voice.deaf:
+        flags |= VC_DEAFENED
+    if member.guild.afk_channel and voice.channel.id == member.guild.afk_channel.id:
+        flags |= VC_AFK
+    if sum(1 for m in voice.channel.members if not m.bot) <= 1:
+        flags |= VC_ALONE
+    return flags
+
+
 @bot.event
 async def on_voice_state_update(member, before, after):
     if member.bot:
         return
 
-    conn = get_db_connection()
-
-    # User joined VC
-    if before.channel is None and after.channel is not None:
-        print(f"🎧 {member} joined VC: {after.channel.name}")
-        # Remove any existing session for this user (cleanup)
-        conn.execute(
-            '''DELETE FROM voice_sessions
-                       WHERE user_id = ? AND guild_id = ?''',
-            (member.id, member.guild.id))
-        # Create new session
-        conn.execute(
-            '''INSERT INTO voice_sessions
-                       (user_id, guild_id, channel_id, join_time, leave_time)
-                       VALUES (?, ?, ?, ?, ?)''',
-            (member.id, member.guild.id, after.channel.id,
-             datetime.datetime.now().isoformat(), None))
-
     # User left VC
-    elif before.channel is not None and after.channel is None:
-        print(f"🎧 {member} left VC: {before.channel.name}")
-        # Find the active session
-        result = conn.execute(
-            '''SELECT join_time FROM voice_sessions
-                               WHERE user_id = ? AND guild_id = ? AND leave_time IS NULL''',
-            (member.id, member.guild.id)).fetchone()
+    if after.channel is None:
+        if before.channel is not None:
+            logging.debug(f"🎧 {member} left VC: {before.channel.name}")
+            credited = voice_tracker.leave(member.guild.id, member.id)
+            if credited is not None and credited >= 18000:
+                logging.info(f"⏱️ Capped VC session for {member} at 5 hours (18000s)")
+
+    # User joined, moved, or changed mute/deafen state
+    else:
+        if before.channel is None:
+            logging.debug(f"🎧 {member} joined VC: {after.channel.name}")
+        voice_tracker.update(member.guild.id, member.id, after.channel.id,
+                             get_voice_state_flags(member))
+
+    # Joins and leaves change whether the others in those channels are alone
+    for channel in {before.channel, after.channel}:
+        if channel is None:
+            continue
+        for other in channel.members:
+            if not other.bot and other.id != member.id and other.voice:
+                voice_tracker.update(member.guild.id, other.id, channel.id,
+                                     get_voice_state_flags(other))
 
-        if result:
-            join_time = result[0]
-            join_dt = datetime.datetime.fromisoformat(join_time)
-            session_duration = max(0, (datetime.datetime.now() -
-                                       join_dt).total_seconds())
-
-            # Apply 5-hour cap (18000 seconds) to individual sessions
-            capped_duration = min(session_duration, 18000)  # 5 hours max
-
-            if session_duration > 18000:
-                print(f"⏱️ Capped VC session for {member} from {int(session_duration)}s to 5 hours (18000s)")
-
-            # Update user VC time
-            user_data = get_user_data(member.id, member.guild.id)
-            if not user_data:
-                user_data = create_default_user(member.id, member.guild.id)
-
-            user_data['vc_seconds'] += int(capped_duration)
-            # Award XP for voice time: 60 XP per minute (consistent with guide)
-            vc_minutes = int(capped_duration) // 60
-            if vc_minutes > 0:
-                vc_award = vc_minutes * 60
-                user_data['xp'] = user_data.get('xp', 0) + vc_award
-            update_user_data(user_data)
-            print(f"⏱️ Added {int(capped_duration)}s VC time to {member}")
 
-            # Update quest stats for VC time
-            vc_minutes = int(capped_duration) // 60
-            if vc_minutes > 0:
-                update_daily_stats(member.id, member.guild.id, vc_minutes=vc_minutes)
-                update_weekly_stats(member.id, member.guild.id, vc_minutes=vc_minutes)
+@tasks.loop(seconds=VC_ACCRUAL_SECONDS)
+async def accrue_voice_time():
+    """Credit VC time, XP and quest minutes to everyone still connected"""
+    try:
+        voice_tracker.accrue()
+    except Exception as e:
+        print(f"❌ Error accruing VC time: {e}")
 
-            # Mark session as completed
-            conn.execute(
-                '''UPDATE voice_sessions SET leave_time = ?
-                         WHERE user_id = ? AND guild_id = ? AND leave_time IS NULL''',
-                (datetime.datetime.now().isoformat(), member.id,
-                 member.guild.id))
 
-    conn.commit()
-    conn.close()
+@tasks.loop(seconds=5)
+async def checkpoint_voice_sessions():
+    """Write queued voice joins, leaves and credits in one transaction"""
+    try:
+        changed = voice_tracker.flush()
+        for guild_id, user_id in changed:
+            leaderboard_engine.refresh_users(guild_id, [user_id])
+    except Exception as e:
+        print(f"❌ Error checkpointing VC sessions: {e}")
 
 
-# Optimized background task with indexed queries
+# Optimized background task with set-based cleanup
 @tasks.loop(minutes=5)
 async def check_voice_sessions():
     """Clean up VC sessions where users might have left without proper tracking"""
     try:
-        conn = get_db_connection()
+        # Queued leaves must land first, or their rows would look orphaned
+        voice_tracker.flush()
 
-        # Find sessions older than 1 hour without leave time
-        # Uses idx_voice_sessions_cleanup index
-        cutoff = (datetime.datetime.now() -
-                  datetime.timedelta(hours=1)).isoformat()
-        orphaned_sessions = conn.execute(
-            '''SELECT user_id, guild_id, join_time 
-                                          FROM voice_sessions 
-                                          WHERE leave_time IS NULL AND join_time < ?''',
-            (cutoff, )).fetchall()
-
-        if orphaned_sessions:
-            # Batch process sessions for efficiency
-            for session in orphaned_sessions:
-                user_id, guild_id, join_time = session
-                join_dt = datetime.datetime.fromisoformat(join_time)
-                session_duration = max(0, (datetime.datetime.now() -
-                                           join_dt).total_seconds())
-
-                # Update user data using optimized query
-                conn.execute(
-                    '''UPDATE users SET vc_seconds = vc_seconds + ?
-                             WHERE user_id = ? AND guild_id = ?''',
-                    (int(session_duration), user_id, guild_id))
-                
-                print(
-                    f"🧹 Cleaned orphaned VC session for user {user_id}: {int(session_duration)}s"
-                )
+        # Never close a session the gateway still shows in voice
+        live = set(voice_tracker.sessions)
+        for guild in bot.guilds:
+            for user_id, state in guild.voice_states.items():
+                if state.channel is not None:
+                    live.add((guild.id, user_id))
 
-                # Close the session
-                conn.execute(
-                    '''UPDATE voice_sessions SET leave_time = ?
-                             WHERE user_id = ? AND guild_id = ? AND leave_time IS NULL''',
-                    (datetime.datetime.now().isoformat(), user_id, guild_id))
+        closed = close_orphaned_sessions(live)
 
-            conn.commit()
-            print(f"✅ VC session cleanup completed - processed {len(orphaned_sessions)} sessions")
+        if closed:
+            for guild_id, user_id, credit in closed:
+                leaderboard_engine.refresh_users(guild_id, [user_id])
+            total = sum(credit for _, _, credit in closed)
+            print(f"🧹 VC session cleanup completed - closed {len(closed)} orphaned sessions ({total}s credited)")
         else:
             print("✅ VC session cleanup completed - no orphaned sessions found")
-        
-        conn.close()
     except Exception as e:
         print(f"❌ Error in VC session cleanup: {e}")
 
 
+@tasks.loop(minutes=10)
+async def verify_leaderboards():
+    """Rebuild in-memory leaderboards that drifted from the users table"""
+    try:
+        rebuilt = leaderboard_engine.verify_consistency()
+        if rebuilt:
+            print(f"🔁 Rebuilt leaderboards for {len(rebuilt)} guild(s) after drift check")
+    except Exception as e:
+        print(f"❌ Error in leaderboard consistency check: {e}")
+
+
+@tasks.loop(seconds=5)
+async def refresh_leaderboard_snapshots():
+    """Re-snapshot leaderboard top pages that changed enough or aged out"""
+    try:
+        leaderboard_engine.refresh_snapshots()
+    except Exception as e:
+        print(f"❌ Error refreshing leaderboard snapshots: {e}")
+
+
 # Keep-alive message counter
 keep_alive_counter = 0
 
@@ -1768,118 +1779,102 @@ async def schedule_trivia_questions():
         print(f"❌ Error in trivia auto-scheduler: {e}")
 
 
-# Study session background task
-@tasks.loop(seconds=30)
-async def update_study_sessions():
-    """Update study session durations and check for inactive sessions and expired test timers"""
+# Study session deadlines
+async def expire_study_session(user_id, guild_id, session_id, kind):
+    """End a study session whose test timer ran out or that went inactive"""
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         c = conn.cursor()
+        c.execute('''SELECT start_time, last_activity, intended_duration FROM study_sessions
+                     WHERE user_id = ? AND guild_id = ? AND session_id = ?''',
+                  (user_id, guild_id, session_id))
+        session = c.fetchone()
+        if not session:
+            return  # Already stopped by the user
+
+        start_time_str, last_activity_str, intended_duration = session
+        start_time = datetime.datetime.fromisoformat(start_time_str)
+        last_activity = datetime.datetime.fromisoformat(last_activity_str) if last_activity_str else start_time
+        now = datetime.datetime.now()
 
-        # Get all active study sessions
-        c.execute('''SELECT user_id, guild_id, session_id, start_time, last_activity, intended_duration, study_type
-                     FROM study_sessions''')
-        active_sessions = c.fetchall()
-
-        if active_sessions:
-            now = datetime.datetime.now()
-            inactive_threshold = 30 * 60  # 30 minutes of inactivity
+        if kind == study_scheduler.EXPIRE_TEST:
+            # Test timer has expired - end the test
+            end_time = now
+            actual_duration = int((now - start_time).total_seconds())
+            completed = 1
+        else:
+            # Session ends at the last real activity, not when we noticed
+            end_time = last_activity
+            actual_duration = int((last_activity - start_time).total_seconds())
+            completed = 0
 
-            for session in active_sessions:
-                user_id, guild_id, session_id, start_time_str, last_activity_str, intended_duration, study_type = session
+        # Move to history
+        c.execute('''INSERT INTO study_history
+                     (user_id, guild_id, session_id, study_type, subject, mood,
+                      intended_duration, start_time, end_time, actual_duration, completed,
+                      pdf_url, answer_key_url)
+                     SELECT user_id, guild_id, session_id, study_type, subject, mood,
+                            intended_duration, start_time, ?, ?, ?, pdf_url, answer_key_url
+                     FROM study_sessions
+                     WHERE user_id = ? AND guild_id = ?''',
+                  (end_time.isoformat(), actual_duration, completed, user_id, guild_id))
+        record_session(c, session_id)
 
-                start_time = datetime.datetime.fromisoformat(start_time_str)
-                last_activity = datetime.datetime.fromisoformat(last_activity_str) if last_activity_str else start_time
+        # Remove from active sessions
+        c.execute('''DELETE FROM study_sessions WHERE user_id = ? AND guild_id = ?''',
+                  (user_id, guild_id))
+        conn.commit()
+        answer_keys.forget(session_id)
 
-                session_duration = (now - start_time).total_seconds()
+        if kind != study_scheduler.EXPIRE_TEST:
+            print(f"📚 Ended inactive study session for user {user_id} (inactive {int((now - last_activity).total_seconds() / 60)}m)")
+            return
 
-                # Check for timed test expiration (MCQ Test type)
-                if study_type == "MCQ Test" and intended_duration and session_duration >= (intended_duration * 60):
-                    # Test timer has expired - end the test
-                    actual_duration = int(session_duration)
+        # Send notification to user if possible
+        try:
+            user = bot.get_user(user_id)
+            if user:
+                embed = discord.Embed(
+                    title="⏰ Test Time Expired!",
+                    description=f"Your MCQ test session has automatically ended after {intended_duration} minutes.",
+                    color=discord.Color.red()
+                )
+                embed.add_field(name="Session ID", value=f"`{session_id}`", inline=True)
+                embed.add_field(name="Actual Duration", value=f"{actual_duration//60}m {actual_duration%60}s", inline=True)
 
-                    # Move to history
-                    c.execute('''INSERT INTO study_history
-                                 (user_id, guild_id, session_id, study_type, subject, mood,
-                                  intended_duration, start_time, end_time, actual_duration, completed)
-                                 SELECT user_id, guild_id, session_id, study_type, subject, mood,
-                                        intended_duration, start_time, ?, ?, 1
-                                 FROM study_sessions
-                                 WHERE user_id = ? AND guild_id = ?''',
-                              (now.isoformat(), actual_duration, user_id, guild_id))
+                # Get test statistics
+                c.execute('''SELECT COUNT(*) FROM study_answers
+                             WHERE session_id = ? AND is_correct = 1''', (session_id,))
+                correct_answers = c.fetchone()[0]
 
-                    # Remove from active sessions
-                    c.execute('''DELETE FROM study_sessions WHERE user_id = ? AND guild_id = ?''',
-                              (user_id, guild_id))
+                c.execute('''SELECT COUNT(*) FROM study_answers
+                             WHERE session_id = ?''', (session_id,))
+                total_answers = c.fetchone()[0]
 
-                    # Send notification to user if possible
-                    try:
-                        user = bot.get_user(user_id)
-                        if user:
-                            embed = discord.Embed(
-                                title="⏰ Test Time Expired!",
-                                description=f"Your MCQ test session has automatically ended after {intended_duration} minutes.",
-                                color=discord.Color.red()
-                            )
-                            embed.add_field(name="Session ID", value=f"`{session_id}`", inline=True)
-                            embed.add_field(name="Actual Duration", value=f"{actual_duration//60}m {actual_duration%60}s", inline=True)
+                if total_answers > 0:
+                    accuracy = (correct_answers / total_answers) * 100
+                    embed.add_field(name="Test Results", value=f"{correct_answers}/{total_answers} correct ({accuracy:.1f}%)", inline=False)
 
-                            # Get test statistics
-                            c.execute('''SELECT COUNT(*) FROM study_answers
-                                         WHERE session_id = ? AND is_correct = 1''', (session_id,))
-                            correct_answers = c.fetchone()[0]
+                await user.send(embed=embed)
+                print(f"⏰ Sent test expiration notification to user {user_id}")
+        except Exception as e:
+            print(f"❌ Failed to send test expiration notification to user {user_id}: {e}")
 
-                            c.execute('''SELECT COUNT(*) FROM study_answers
-                                         WHERE session_id = ?''', (session_id,))
-                            total_answers = c.fetchone()[0]
+        print(f"⏰ Auto-ended timed test for user {user_id} (duration: {actual_duration//60}m)")
+    except Exception as e:
+        print(f"❌ Error expiring study session {session_id}: {e}")
+    finally:
+        conn.close()
 
-                            if total_answers > 0:
-                                accuracy = (correct_answers / total_answers) * 100
-                                embed.add_field(name="Test Results", value=f"{correct_answers}/{total_answers} correct ({accuracy:.1f}%)", inline=False)
 
-                            await user.send(embed=embed)
-                            print(f"⏰ Sent test expiration notification to user {user_id}")
-                    except Exception as e:
-                        print(f"❌ Failed to send test expiration notification to user {user_id}: {e}")
-
-                    print(f"⏰ Auto-ended timed test for user {user_id} (duration: {actual_duration//60}m)")
-
-                # Check if session has been inactive for too long (non-test sessions)
-                elif study_type != "MCQ Test":
-                    time_since_activity = (now - last_activity).total_seconds()
-                    if time_since_activity > inactive_threshold:
-                        # Mark session as completed due to inactivity
-                        actual_duration = int((last_activity - start_time).total_seconds())
-
-                        # Move to history
-                        c.execute('''INSERT INTO study_history
-                                     (user_id, guild_id, session_id, study_type, subject, mood,
-                                      intended_duration, start_time, end_time, actual_duration, completed)
-                                     SELECT user_id, guild_id, session_id, study_type, subject, mood,
-                                            intended_duration, start_time, ?, ?, 0
-                                     FROM study_sessions
-                                     WHERE user_id = ? AND guild_id = ?''',
-                                  (last_activity.isoformat(), actual_duration, user_id, guild_id))
-
-                        # Remove from active sessions
-                        c.execute('''DELETE FROM study_sessions WHERE user_id = ? AND guild_id = ?''',
-                                  (user_id, guild_id))
-
-                        print(f"📚 Ended inactive study session for user {user_id} (inactive {int(time_since_activity/60)}m)")
-                    else:
-                        # Update last_activity to current time for active tracking
-                        c.execute('''UPDATE study_sessions SET last_activity = ?
-                                     WHERE user_id = ? AND guild_id = ?''',
-                                  (now.isoformat(), user_id, guild_id))
+study_sessions_scheduler = study_scheduler.StudySessionScheduler(expire_study_session)
 
-            conn.commit()
-            print(f"📚 Updated {len(active_sessions)} active study sessions")
-        else:
-            print("📚 No active study sessions to update")
 
-        conn.close()
-    except Exception as e:
-        print(f"❌ Error in study session update task: {e}")
+def schedule_study_session(user_id, guild_id, session_id, study_type, start_time,
+                           intended_duration, last_activity=None):
+    """Register a newly started or resumed study session with the deadline scheduler"""
+    study_sessions_scheduler.schedule(user_id, guild_id, study_scheduler.ScheduledSession(
+        session_id, study_type, start_time, intended_duration, last_activity or start_time))
 
 
 async def handle_study_session_recovery():
@@ -2182,8 +2177,8 @@ async def trivia_cmd(ctx, action: str = None, *, args: str = None):
         conn = get_db_connection()
         c = conn.cursor()
 
-        c.execute('''INSERT OR REPLACE INTO guild_settings
-                     (guild_id, trivia_channel) VALUES (?, ?)''',
+        c.execute('''INSERT INTO guild_settings (guild_id, trivia_channel) VALUES (?, ?)
+                     ON CONFLICT(guild_id) DO UPDATE SET trivia_channel = excluded.trivia_channel''',
                   (ctx.guild.id, ctx.channel.id))
         conn.commit()
         conn.close()
@@ -2330,12 +2325,15 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
         # Insert into history
         c.execute('''INSERT INTO study_history
                      (user_id, guild_id, session_id, study_type, subject, mood,
-                      intended_duration, start_time, end_time, actual_duration, completed)
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)''',
+                      intended_duration, start_time, end_time, actual_duration, completed,
+                      pdf_url, answer_key_url)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?, ?)''',
                   (ctx.author.id, ctx.guild.id, session['session_id'],
                    session['study_type'], session['subject'], session['mood'],
                    session['intended_duration'], session['start_time'],
-                   end_time.isoformat(), duration_seconds))
+                   end_time.isoformat(), duration_seconds,
+                   session.get('pdf_url'), session.get('answer_key_url')))
+        record_session(c, session['session_id'])
 
         # Remove active session
         c.execute('''DELETE FROM study_sessions
@@ -2344,6 +2342,8 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
 
         conn.commit()
         conn.close()
+        study_sessions_scheduler.cancel(ctx.author.id, ctx.guild.id)
+        answer_keys.forget(session['session_id'])
 
         # Format duration
         hours = duration_seconds // 3600
@@ -2392,7 +2392,7 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
             page_num = int(args[2]) - 1 if len(args) > 2 and args[2].isdigit() else 0
 
             # Validate URL
-            if not validate_pdf_url(pdf_url):
+            if not await validate_pdf_url(pdf_url):
                 await ctx.send("❌ Invalid PDF URL! Please provide a valid PDF link.")
                 return
 
@@ -2408,25 +2408,19 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
             status_msg = await ctx.send(embed=embed)
 
             try:
-                img_path, error = render_pdf_page(pdf_url, page_num)
+                png_bytes, error = await render_pdf_page(pdf_url, page_num)
 
                 if error:
                     embed.add_field(name="Error", value=error, inline=False)
                     await status_msg.edit(embed=embed)
                     return
 
-                if img_path:
+                if png_bytes:
                     # Send the image
-                    file = discord.File(img_path, filename=f"page_{page_num + 1}.png")
+                    file = discord.File(io.BytesIO(png_bytes), filename=f"page_{page_num + 1}.png")
                     embed.set_image(url=f"attachment://page_{page_num + 1}.png")
                     await ctx.send(file=file, embed=embed)
 
-                    # Clean up
-                    try:
-                        os.remove(img_path)
-                    except:
-                        pass
-
                     # Delete status message
                     await status_msg.delete()
                 else:
@@ -2445,7 +2439,7 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
 
             pdf_url = args[1]
 
-            if not validate_pdf_url(pdf_url):
+            if not await validate_pdf_url(pdf_url):
                 await ctx.send("❌ Invalid PDF URL! Please provide a valid PDF link.")
                 return
 
@@ -2457,7 +2451,7 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
             status_msg = await ctx.send(embed=embed)
 
             try:
-                text = extract_pdf_text(pdf_url)
+                text = await extract_pdf_text(pdf_url)
 
                 if text:
                     # Split text into chunks if too long
@@ -2499,7 +2493,7 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
 
             pdf_url = args[1]
 
-            if not validate_pdf_url(pdf_url):
+            if not await validate_pdf_url(pdf_url):
                 await ctx.send("❌ Invalid PDF URL! Please provide a valid PDF link.")
                 return
 
@@ -2516,8 +2510,13 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
                 await ctx.send("❌ You don't have an active study session! Use `%study start` first.")
                 return
 
-            # Store PDF URL in session (we'll add a pdf_url column to study_sessions table)
-            # For now, just acknowledge
+            # Store PDF URL in session
+            conn = get_db_connection()
+            conn.execute('''UPDATE study_sessions SET pdf_url = ?
+                            WHERE user_id = ? AND guild_id = ?''',
+                         (pdf_url, ctx.author.id, ctx.guild.id))
+            conn.commit()
+            conn.close()
             embed = discord.Embed(
                 title="📄 PDF Loaded",
                 description="PDF has been loaded for your study session!",
@@ -2542,7 +2541,7 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
             pdf_url = args[1]
             custom_pattern = args[2] if len(args) > 2 else None
 
-            if not validate_pdf_url(pdf_url):
+            if not await validate_pdf_url(pdf_url):
                 await ctx.send("❌ Invalid PDF URL! Please provide a valid PDF link.")
                 return
 
@@ -2570,7 +2569,7 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
 
             try:
                 # Extract text from PDF
-                text = extract_pdf_text(pdf_url)
+                text = await extract_pdf_page_texts(pdf_url)
 
                 if not text:
                     embed.description = "Failed to extract text from PDF"
@@ -2583,14 +2582,7 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
 
                 if answers:
                     # Store answers in database
-                    for question_num, answer in answers.items():
-                        c.execute('''INSERT OR REPLACE INTO study_answers
-                                      (user_id, guild_id, session_id, question_number, answer, is_correct, timestamp)
-                                      VALUES (?, ?, ?, ?, ?, 1, ?)''',
-                                   (ctx.author.id, ctx.guild.id, session_id, question_num, answer,
-                                    datetime.datetime.now().isoformat()))
-
-                    conn.commit()
+                    answer_keys.load(session_id, answers, source_url=pdf_url)
 
                     embed.title = "✅ Answer Key Loaded"
                     embed.description = f"Successfully loaded {len(answers)} answers!"
@@ -2740,7 +2732,7 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
                 return
 
             # Validate PDF
-            if not validate_pdf_url(pdf_url):
+            if not await validate_pdf_url(pdf_url):
                 conn.close()
                 await ctx.send("❌ The provided URL doesn't appear to be a valid PDF. Please check the link.")
                 return
@@ -2770,13 +2762,13 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
                 return
 
             # Validate PDF
-            if not validate_pdf_url(answer_url):
+            if not await validate_pdf_url(answer_url):
                 conn.close()
                 await ctx.send("❌ The provided URL doesn't appear to be a valid PDF. Please check the link.")
                 return
 
             # Extract text and parse answers
-            pdf_text = extract_pdf_text(answer_url)
+            pdf_text = await extract_pdf_page_texts(answer_url)
             if not pdf_text:
                 conn.close()
                 await ctx.send("❌ Failed to extract text from the PDF. Please try a different PDF or manual entry.")
@@ -2800,15 +2792,8 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
                 return
 
             # Save answers to database
-            for question_num, answer in answers.items():
-                c.execute('''INSERT INTO study_answers
-                             (user_id, guild_id, session_id, question_number, answer, is_correct, timestamp)
-                             VALUES (?, ?, ?, ?, ?, 1, ?)''',
-                         (ctx.author.id, ctx.guild.id, session_id, question_num, answer,
-                          datetime.datetime.now().isoformat()))
-
-            conn.commit()
             conn.close()
+            answer_keys.load(session_id, answers, source_url=answer_url)
 
             embed = discord.Embed(
                 title="✅ Answer Key Loaded!",
@@ -2841,13 +2826,8 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
                 return
 
             # Save manual answer
-            c.execute('''INSERT OR REPLACE INTO study_answers
-                         (user_id, guild_id, session_id, question_number, answer, is_correct, timestamp)
-                         VALUES (?, ?, ?, ?, ?, 1, ?)''',
-                     (ctx.author.id, ctx.guild.id, session_id, question_num, answer,
-                      datetime.datetime.now().isoformat()))
-            conn.commit()
             conn.close()
+            answer_keys.set_answer(session_id, question_num, answer)
 
             embed = discord.Embed(
                 title="✅ Answer Set Manually",
@@ -2873,7 +2853,7 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
                 return
 
             # Validate PDF
-            if not validate_pdf_url(pdf_url):
+            if not await validate_pdf_url(pdf_url):
                 conn.close()
                 await ctx.send("❌ The provided URL doesn't appear to be a valid PDF. Please check the link.")
                 return
@@ -2886,7 +2866,7 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
             )
             status_msg = await ctx.send(embed=embed)
 
-            img_path, error = render_pdf_page(pdf_url, page_num)
+            png_bytes, error = await render_pdf_page(pdf_url, page_num)
 
             if error:
                 await status_msg.edit(embed=discord.Embed(
@@ -2896,7 +2876,7 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
                 ))
             else:
                 # Send the image
-                file = discord.File(img_path, filename=f'pdf_page_{page_num + 1}.png')
+                file = discord.File(io.BytesIO(png_bytes), filename=f'pdf_page_{page_num + 1}.png')
                 embed = discord.Embed(
                     title=f"📄 PDF Page {page_num + 1}",
                     description=f"From: {pdf_url}",
@@ -2905,13 +2885,6 @@ async def study_cmd(ctx, action: str = None, *, args: str = None):
                 embed.set_image(url=f'attachment://pdf_page_{page_num + 1}.png')
                 await ctx.send(file=file, embed=embed)
 
-                # Clean up the temporary file
-                try:
-                    import os
-                    os.remove(img_path)
-                except:
-                    pass
-
                 await status_msg.delete()
 
             conn.close()
@@ -3186,63 +3159,30 @@ async def check_level_up(user, guild):
 
 
 async def handle_offline_vc_tracking():
-    """Handle VC tracking when bot comes back online - catch up on missed time"""
-    print("🔄 Checking for offline VC sessions to catch up...")
-
-    conn = get_db_connection()
-    try:
-        # Find all active sessions (no leave_time)
-        active_sessions = conn.execute(
-            '''SELECT user_id, guild_id, join_time FROM voice_sessions
-                       WHERE leave_time IS NULL''').fetchall()
-
-        if not active_sessions:
-            print("✅ No active VC sessions found to catch up")
-            return
-
-        caught_up_count = 0
-        for session in active_sessions:
-            user_id, guild_id, join_time_str = session
-            join_time = datetime.datetime.fromisoformat(join_time_str)
-            now = datetime.datetime.now()
-
-            # Calculate missed time
-            missed_seconds = max(0, (now - join_time).total_seconds())
+    """Reconcile open VC sessions with who is actually in voice after (re)connecting"""
+    print("🔄 Reconciling VC sessions with live voice state...")
 
-            if missed_seconds > 0:
-                # Apply 5-hour cap even for offline sessions
-                capped_missed = min(missed_seconds, 18000)  # 5 hours max
-
-                # Update user VC time
-                user_data = get_user_data(user_id, guild_id)
-                if not user_data:
-                    user_data = create_default_user(user_id, guild_id)
-
-                user_data['vc_seconds'] += int(capped_missed)
-                update_user_data(user_data)
-
-                # Update quest stats
-                vc_minutes = int(capped_missed) // 60
-                if vc_minutes > 0:
-                    update_daily_stats(user_id, guild_id, vc_minutes=vc_minutes)
-                    update_weekly_stats(user_id, guild_id, vc_minutes=vc_minutes)
-
-                # Mark session as completed with current time
-                conn.execute(
-                    '''UPDATE voice_sessions SET leave_time = ?
-                             WHERE user_id = ? AND guild_id = ? AND leave_time IS NULL''',
-                    (now.isoformat(), user_id, guild_id))
+    kept_total = closed_total = opened_total = 0
+    for guild in bot.guilds:
+        live = {}
+        for channel in guild.voice_channels + guild.stage_channels:
+            for member in channel.members:
+                if not member.bot and member.voice:
+                    live[member.id] = (channel.id, get_voice_state_flags(member))
 
-                caught_up_count += 1
-                print(f"⏱️ Caught up {int(capped_missed)}s VC time for user {user_id}")
+        try:
+            kept, closed, opened = voice_tracker.reconcile(guild.id, live)
+        except Exception as e:
+            print(f"❌ Error reconciling VC sessions for {guild.name}: {e}")
+            continue
 
-        conn.commit()
-        print(f"✅ Offline VC tracking complete - caught up {caught_up_count} sessions")
+        if closed:
+            leaderboard_engine.invalidate(guild.id)
+        kept_total += kept
+        closed_total += closed
+        opened_total += opened
 
-    except Exception as e:
-        print(f"❌ Error in offline VC tracking: {e}")
-    finally:
-        conn.close()
+    print(f"✅ VC reconciliation complete - kept {kept_total}, closed {closed_total}, opened {opened_total} sessions")
 
 
 async def handle_study_session_recovery():
@@ -3253,7 +3193,8 @@ async def handle_study_session_recovery():
     try:
         # Find all active study sessions
         active_sessions = conn.execute(
-            '''SELECT user_id, guild_id, session_id, start_time FROM study_sessions''').fetchall()
+            '''SELECT user_id, guild_id, session_id, study_type, start_time, intended_duration
+                 FROM study_sessions''').fetchall()
 
         if not active_sessions:
             print("✅ No active study sessions found to resume")
@@ -3263,19 +3204,17 @@ async def handle_study_session_recovery():
         resumed_count = 0
 
         for session in active_sessions:
-            user_id, guild_id, session_id, start_time_str = session
+            user_id, guild_id, session_id, study_type, start_time_str, intended_duration = session
 
-            # Update last_activity to current time so sessions can continue
-            # This effectively "resumes" the session from the restart
-            conn.execute(
-                '''UPDATE study_sessions SET last_activity = ?
-                         WHERE user_id = ? AND guild_id = ?''',
-                (now.isoformat(), user_id, guild_id))
+            # The inactivity clock restarts from now so downtime doesn't end sessions,
+            # but the stored last_activity keeps the last real activity
+            schedule_study_session(user_id, guild_id, session_id, study_type,
+                                   datetime.datetime.fromisoformat(start_time_str),
+                                   intended_duration, last_activity=now)
 
             resumed_count += 1
             print(f"📚 Resumed study session for user {user_id}")
 
-        conn.commit()
         print(f"✅ Study session recovery complete - resumed {resumed_count} sessions")
 
     except Exception as e:
@@ -3485,474 +3424,36 @@ async def profile_cmd(ctx, member: discord.Member = None):
     await ctx.send(embed=embed)
 
 
-def generate_profile_card(user: discord.Member, user_data: Dict, guild: discord.Guild) -> BytesIO:
-    """Generate a profile card image based on the design specifications"""
-    import math
-    from collections import Counter
-    
-    # Image dimensions: Portrait orientation (8x11 inches at 150 DPI)
-    DPI = 150
-    CARD_WIDTH = int(8 * DPI)   # 1200 pixels (portrait width)
-    CARD_HEIGHT = int(11 * DPI) # 1650 pixels (portrait height)
-    
-    # Padding multiplier from user settings (default 3x = 1.2 inches base)
-    padding_multiplier = user_data.get('card_padding', 1.2) or 1.2
-    base_padding = 0.4  # Base padding in inches
-    
-    # Padding in inches, converted to pixels (3x default)
-    PADDING_LEFT = int(base_padding * padding_multiplier * DPI)
-    PADDING_RIGHT = int(base_padding * padding_multiplier * DPI)
-    PADDING_TOP = int(base_padding * padding_multiplier * DPI)
-    PADDING_BOTTOM = int(base_padding * padding_multiplier * DPI)
-    
-    # Content area
-    CONTENT_X = PADDING_LEFT
-    CONTENT_Y = PADDING_TOP
-    CONTENT_WIDTH = CARD_WIDTH - PADDING_LEFT - PADDING_RIGHT
-    CONTENT_HEIGHT = CARD_HEIGHT - PADDING_TOP - PADDING_BOTTOM
-    
-    # Default colors
-    DEFAULT_BG_COLOR = (128, 128, 128)  # Gray default
-    PROFILE_BOX_COLOR = (255, 0, 0)  # Red for profile picture
-    COUNTRY_BOX_COLOR = (118, 137, 131)  # #758983 default for country
-    GUILD_BOX_COLOR = (118, 137, 131)  # #758983 default for guild
-    DEFAULT_PROGRESS_BAR_BG = (84, 107, 81)  # #546b51 dark green (default)
-    DEFAULT_PROGRESS_BAR_FILL = (118, 137, 131)  # Ash green (default)
-    MULTIPLIER_BOX_COLOR = (84, 107, 81)  # #546b51 dark blue/green
-    MESSAGE_ICON_COLOR = (255, 255, 255)  # White
-    
-    # Helper function to extract dominant color from image
-    def get_dominant_color(img: Image.Image, k=3) -> tuple:
-        """Extract dominant color from image using k-means clustering approximation"""
-        try:
-            # Resize for faster processing
-            img_small = img.resize((100, 100), Image.Resampling.LANCZOS)
-            img_small = img_small.convert('RGB')
-            pixels = list(img_small.getdata())
-            
-            # Simple approach: get most common colors
-            color_counts = Counter(pixels)
-            # Get top color
-            dominant = color_counts.most_common(1)[0][0]
-            return dominant
-        except:
-            return DEFAULT_PROGRESS_BAR_FILL
-    
-    # Helper function to download image/GIF (extracts first frame for GIFs)
-    def download_image(url: str, size: tuple) -> Image.Image:
-        try:
-            response = requests.get(url, timeout=10, stream=True)
-            img_data = Image.open(BytesIO(response.content))
-            
-            # Handle GIFs - extract first frame
-            if hasattr(img_data, 'is_animated') and img_data.is_animated:
-                img_data.seek(0)  # Get first frame
-            
-            img_data = img_data.convert('RGB')
-            img_data = img_data.resize(size, Image.Resampling.LANCZOS)
-            return img_data
-        except:
-            return None
-    
-    # Get background color (use profile_card_bg_color, fallback to custom_color, default to gray)
-    bg_color_hex = user_data.get('profile_card_bg_color') or user_data.get('custom_color', '#808080')
-    if bg_color_hex.startswith('#'):
-        bg_color_hex = bg_color_hex[1:]
-    
-    try:
-        bg_r = int(bg_color_hex[0:2], 16)
-        bg_g = int(bg_color_hex[2:4], 16)
-        bg_b = int(bg_color_hex[4:6], 16)
-    except:
-        bg_r, bg_g, bg_b = DEFAULT_BG_COLOR
-    
-    # Calculate brightness for text color decision
-    bg_brightness = (bg_r * 299 + bg_g * 587 + bg_b * 114) / 1000
-    
-    # No default darkening (0%)
-    bg_color = (bg_r, bg_g, bg_b)
-    
-    # Determine text colors based on background brightness
-    # If background is very bright (white), use black text, otherwise white
-    is_light_bg = bg_brightness > 200
-    TEXT_COLOR = (0, 0, 0) if is_light_bg else (255, 255, 255)
-    TEXT_GRAY = (100, 100, 100) if is_light_bg else (180, 180, 180)  # About me text
-    
-    # Progress bar colors (will be updated if banner is set)
-    progress_bar_bg = DEFAULT_PROGRESS_BAR_BG
-    progress_bar_fill = DEFAULT_PROGRESS_BAR_FILL
-    
-    # Create base image
-    img = Image.new('RGB', (CARD_WIDTH, CARD_HEIGHT), bg_color)
-    draw = ImageDraw.Draw(img)
-    
-    # If background_url is set, try to overlay it (with user-defined darkening)
-    background_url = user_data.get('background_url')
-    banner_img = None
-    banner_brightness_value = user_data.get('banner_brightness', 0.0) or 0.0  # 0-100%
-    darken_factor = banner_brightness_value / 100.0  # Convert to 0.0-1.0
-    
-    if background_url:
-        try:
-            bg_img = download_image(background_url, (CARD_WIDTH, CARD_HEIGHT))
-            if bg_img:
-                banner_img = bg_img.copy()
-                # Calculate brightness from banner image
-                banner_brightness = sum(bg_img.convert('L').resize((10, 10)).getdata()) / 100
-                is_light_bg = banner_brightness > 200
-                TEXT_COLOR = (0, 0, 0) if is_light_bg else (255, 255, 255)
-                TEXT_GRAY = (100, 100, 100) if is_light_bg else (180, 180, 180)
-                
-                # Paste background image first
-                img.paste(bg_img, (0, 0))
-                # Apply user-defined darkening overlay (0-100%)
-                if darken_factor > 0:
-                    overlay = Image.new('RGB', (CARD_WIDTH, CARD_HEIGHT), (0, 0, 0))
-                    overlay_alpha = Image.new('L', (CARD_WIDTH, CARD_HEIGHT), int(255 * darken_factor))
-                    img = Image.composite(img, overlay, overlay_alpha)
-                draw = ImageDraw.Draw(img)
-                
-                # Extract dominant color from banner for progress bar
-                dominant_color = get_dominant_color(bg_img)
-                # Create a darker version for progress bar background
-                progress_bar_fill = dominant_color
-                # Darken the dominant color for the background
-                progress_bar_bg = tuple(max(0, int(c * 0.6)) for c in dominant_color)
-        except:
-            pass  # If background image fails, just use solid color
-    
-    # Try to load Anton font, fallback to default
-    # Note: To use Anton font, place Anton-Regular.ttf in the 'fonts' directory or root directory
-    # Download from: https://fonts.google.com/specimen/Anton
-    # Font sizes: Canva size 12 = ~16px, size 8 = ~11px (scaled for 150 DPI)
-    try:
-        font_paths = [
-            'fonts/Anton-Regular.ttf',
-            'Anton-Regular.ttf',
-            './fonts/Anton-Regular.ttf',
-            '/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf',
-            'C:/Windows/Fonts/arial.ttf',
-        ]
-        font_path_used = None
-        for path in font_paths:
-            try:
-                if os.path.exists(path):
-                    font_path_used = path
-                    break
-            except:
-                continue
-        
-        if font_path_used:
-            # Get user-defined font size (default 3x larger = 99px)
-            # If user hasn't set a custom size, use 3x default (99px)
-            custom_font_size = user_data.get('card_font_size')
-            if custom_font_size is None:
-                # Default: 3x larger than original (33px * 3 = 99px)
-                main_font_size = 99
-            else:
-                # User has set a custom size, use it directly (clamped 5-999)
-                main_font_size = int(max(5, min(999, custom_font_size)))
-            about_font_size = int(main_font_size * 0.73)  # About 73% of main size for about me
-            
-            title_font = ImageFont.truetype(font_path_used, main_font_size)
-            large_font = ImageFont.truetype(font_path_used, main_font_size)
-            medium_font = ImageFont.truetype(font_path_used, main_font_size)
-            small_font = ImageFont.truetype(font_path_used, main_font_size)
-            about_font = ImageFont.truetype(font_path_used, about_font_size)
-        else:
-            # Fallback to default font
-            title_font = ImageFont.load_default()
-            large_font = ImageFont.load_default()
-            medium_font = ImageFont.load_default()
-            small_font = ImageFont.load_default()
-            about_font = ImageFont.load_default()
-    except:
-        title_font = ImageFont.load_default()
-        large_font = ImageFont.load_default()
-        medium_font = ImageFont.load_default()
-        small_font = ImageFont.load_default()
-        about_font = ImageFont.load_default()
-    
-    # Draw profile picture box (red, large, rounded)
-    # Scale elements for new dimensions
-    scale_factor = CARD_WIDTH / 1000  # Scale from original 1000px width
-    pfp_size = int(140 * scale_factor)  # ~231px
-    pfp_x = CONTENT_X
-    pfp_y = CONTENT_Y
-    pfp_radius = int(20 * scale_factor)  # ~33px
-    
-    # Create rounded rectangle mask for profile picture
-    pfp_mask = Image.new('L', (pfp_size, pfp_size), 0)
-    pfp_mask_draw = ImageDraw.Draw(pfp_mask)
-    pfp_mask_draw.rounded_rectangle([(0, 0), (pfp_size, pfp_size)], radius=pfp_radius, fill=255)
-    
-    # Try to load profile picture (custom or default)
-    try:
-        custom_pfp_url = user_data.get('custom_pfp_url')
-        pfp_url = custom_pfp_url if custom_pfp_url else str(user.display_avatar.url)
-        pfp_img = download_image(pfp_url, (pfp_size, pfp_size))
-        if pfp_img:
-            img.paste(pfp_img, (pfp_x, pfp_y), pfp_mask)
-        else:
-            draw.rounded_rectangle([(pfp_x, pfp_y), (pfp_x + pfp_size, pfp_y + pfp_size)], 
-                                 radius=pfp_radius, fill=PROFILE_BOX_COLOR)
-    except:
-        draw.rounded_rectangle([(pfp_x, pfp_y), (pfp_x + pfp_size, pfp_y + pfp_size)], 
-                             radius=pfp_radius, fill=PROFILE_BOX_COLOR)
-    
-    # Draw country flag box (green, small, rounded)
-    flag_size = int(60 * scale_factor)  # ~99px
-    flag_x = pfp_x + pfp_size + int(25 * scale_factor)
-    flag_y = pfp_y
-    flag_radius = int(12 * scale_factor)  # ~20px
-    
-    # Check for country flag (not in DB yet, use default)
-    country_flag_url = user_data.get('country_flag_url')
-    if country_flag_url:
-        flag_img = download_image(country_flag_url, (flag_size, flag_size))
-        if flag_img:
-            flag_mask = Image.new('L', (flag_size, flag_size), 0)
-            flag_mask_draw = ImageDraw.Draw(flag_mask)
-            flag_mask_draw.rounded_rectangle([(0, 0), (flag_size, flag_size)], radius=flag_radius, fill=255)
-            img.paste(flag_img, (flag_x, flag_y), flag_mask)
-        else:
-            draw.rounded_rectangle([(flag_x, flag_y), (flag_x + flag_size, flag_y + flag_size)], 
-                                 radius=flag_radius, fill=COUNTRY_BOX_COLOR)
-    else:
-        draw.rounded_rectangle([(flag_x, flag_y), (flag_x + flag_size, flag_y + flag_size)], 
-                             radius=flag_radius, fill=COUNTRY_BOX_COLOR)
-    
-    # Draw guild logo box (blue, small, rounded)
-    guild_size = int(60 * scale_factor)  # ~99px
-    guild_x = flag_x + flag_size + int(15 * scale_factor)
-    guild_y = pfp_y
-    guild_radius = int(12 * scale_factor)  # ~20px
-    
-    # Check for guild logo
-    guild_icon_url = str(guild.icon.url) if guild.icon else None
-    if guild_icon_url:
-        guild_img = download_image(guild_icon_url, (guild_size, guild_size))
-        if guild_img:
-            guild_mask = Image.new('L', (guild_size, guild_size), 0)
-            guild_mask_draw = ImageDraw.Draw(guild_mask)
-            guild_mask_draw.rounded_rectangle([(0, 0), (guild_size, guild_size)], radius=guild_radius, fill=255)
-            img.paste(guild_img, (guild_x, guild_y), guild_mask)
-        else:
-            draw.rounded_rectangle([(guild_x, guild_y), (guild_x + guild_size, guild_y + guild_size)], 
-                                 radius=guild_radius, fill=GUILD_BOX_COLOR)
-    else:
-        draw.rounded_rectangle([(guild_x, guild_y), (guild_x + guild_size, guild_y + guild_size)], 
-                             radius=guild_radius, fill=GUILD_BOX_COLOR)
-    
-    # Draw level text (top left)
-    level = user_data.get('level', 0)
-    level_text = f"lvl {level}"
-    level_y = int(30 * scale_factor)
-    draw.text((CONTENT_X, level_y), level_text, fill=TEXT_COLOR, font=title_font)
-    
-    # Draw rank text (top right)
-    rank = get_user_rank(user.id, guild.id) or 0
-    rank_text = f"#{rank}" if rank > 0 else "#-"
-    rank_bbox = draw.textbbox((0, 0), rank_text, font=title_font)
-    rank_width = rank_bbox[2] - rank_bbox[0]
-    draw.text((CARD_WIDTH - rank_width - CONTENT_X, level_y), rank_text, fill=TEXT_COLOR, font=title_font)
-    
-    # Draw display name and username
-    display_name = user.display_name or "-"
-    username = user.name or "-"
-    
-    name_y = pfp_y + pfp_size + int(20 * scale_factor)
-    draw.text((pfp_x, name_y), display_name, fill=TEXT_COLOR, font=large_font)
-    draw.text((pfp_x, name_y + int(45 * scale_factor)), f"@{username}", fill=TEXT_GRAY, font=medium_font)
-    
-    # Calculate progress
-    current_level = user_data.get('level', 0)
-    next_level = current_level + 1
-    next_req = LevelSystem.get_level_requirements(next_level) if next_level <= 100 else None
-    
-    if next_req:
-        # Calculate progress percentage (average of all requirements)
-        words_progress = min(1.0, user_data.get('unique_words', 0) / max(1, next_req.get('words', 1)))
-        vc_progress = min(1.0, (user_data.get('vc_seconds', 0) / 60) / max(1, next_req.get('vc_minutes', 1)))
-        messages_progress = min(1.0, user_data.get('messages_sent', 0) / max(1, next_req.get('messages', 1)))
-        quests_progress = min(1.0, user_data.get('quests_completed', 0) / max(1, next_req.get('quests', 1)))
-        overall_progress = (words_progress + vc_progress + messages_progress + quests_progress) / 4.0
-    else:
-        overall_progress = 1.0
-    
-    # Draw progress bar
-    progress_y = name_y + int(100 * scale_factor)
-    progress_x = pfp_x
-    progress_width = int(700 * scale_factor)  # ~1155px
-    progress_height = int(35 * scale_factor)  # ~58px
-    progress_radius = int(10 * scale_factor)  # ~17px
-    
-    # Background bar (matches banner or default)
-    draw.rounded_rectangle([(progress_x, progress_y), (progress_x + progress_width, progress_y + progress_height)], 
-                         radius=progress_radius, fill=progress_bar_bg)
-    
-    # Filled bar (matches banner dominant color or default)
-    fill_width = int(progress_width * overall_progress)
-    if fill_width > 0:
-        draw.rounded_rectangle([(progress_x, progress_y), (progress_x + fill_width, progress_y + progress_height)], 
-                             radius=progress_radius, fill=progress_bar_fill)
-    
-    # Progress text (vertically centered)
-    progress_text_bbox = draw.textbbox((0, 0), "Progress", font=small_font)
-    progress_text_height = progress_text_bbox[3] - progress_text_bbox[1]
-    progress_text_y = progress_y + (progress_height - progress_text_height) // 2
-    draw.text((progress_x + int(15 * scale_factor), progress_text_y), "Progress", fill=TEXT_COLOR, font=small_font)
-    
-    # XP multiplier box
-    multiplier = user_data.get('xp_multiplier', 1.0)
-    # Calculate quest multipliers
-    daily_quests = user_data.get('daily_quests_completed', 0)
-    weekly_quests = user_data.get('weekly_quests_completed', 0)
-    quest_multiplier = 1.0
-    if daily_quests > 0:
-        quest_multiplier += 0.1
-    if weekly_quests > 0:
-        quest_multiplier += 0.25
-    total_multiplier = multiplier * quest_multiplier
-    
-    multiplier_text = f"{total_multiplier:.1f}x"
-    multiplier_box_width = int(90 * scale_factor)
-    multiplier_box_height = progress_height
-    multiplier_x = progress_x + progress_width + int(25 * scale_factor)
-    multiplier_y = progress_y
-    
-    draw.rounded_rectangle([(multiplier_x, multiplier_y), (multiplier_x + multiplier_box_width, multiplier_y + multiplier_box_height)], 
-                         radius=progress_radius, fill=MULTIPLIER_BOX_COLOR)
-    multiplier_bbox = draw.textbbox((0, 0), multiplier_text, font=small_font)
-    multiplier_text_width = multiplier_bbox[2] - multiplier_bbox[0]
-    multiplier_text_x = multiplier_x + (multiplier_box_width - multiplier_text_width) // 2
-    multiplier_text_y = multiplier_y + int(8 * scale_factor)
-    draw.text((multiplier_text_x, multiplier_text_y), multiplier_text, fill=TEXT_COLOR, font=small_font)
-    
-    # Draw stats section
-    stats_start_y = progress_y + progress_height + int(50 * scale_factor)
-    stats_x = pfp_x
-    stat_spacing = int(55 * scale_factor)
-    
-    stats_labels = ["XP", "words", "messages", "vc", "quests"]
-    
-    # Overall/lifetime stats (for middle column display)
-    overall_xp = user_data.get('xp', 0)
-    overall_words = user_data.get('lifetime_words', user_data.get('unique_words', 0))  # Use lifetime if available
-    overall_messages = user_data.get('messages_sent', 0)  # Current value (may be reset on level up)
-    overall_vc = user_data.get('vc_seconds', 0) // 60  # Current value (may be reset on level up)
-    overall_quests = user_data.get('quests_completed', 0)  # Current value (may be reset on level up)
-    
-    stats_values = [
-        f"{overall_xp:,}",
-        f"{overall_words:,}",
-        f"{overall_messages:,}",
-        f"{overall_vc:,}",
-        f"{overall_quests:,}"
+def get_card_image_urls(user: discord.Member, user_data: Dict, guild: discord.Guild) -> List[str]:
+    """Every remote image a profile card may draw"""
+    urls = [
+        user_data.get('background_url'),
+        user_data.get('custom_pfp_url') or str(user.display_avatar.url),
+        user_data.get('country_flag_url'),
+        str(guild.icon.url) if guild.icon else None,
     ]
-    
-    # Current progress values (for right column - progress towards next level)
-    # Note: These represent progress since last level up
-    current_words = user_data.get('unique_words', 0)
-    current_messages = user_data.get('messages_sent', 0)
-    current_vc = user_data.get('vc_seconds', 0) // 60
-    current_quests = user_data.get('quests_completed', 0)
-    
-    # Requirements for next level
-    if next_req:
-        # Calculate XP requirement (based on level requirements)
-        xp_req = next_req.get('words', 0) * 10  # Approximate XP from words
-        req_words = next_req.get('words', 0)
-        req_messages = next_req.get('messages', 0)
-        req_vc = next_req.get('vc_minutes', 0)
-        req_quests = next_req.get('quests', 0)
-        
-        # Current progress towards requirements (capped at requirement)
-        # Note: These are the values since last level up (for progress tracking)
-        # For XP, we'll use a simple calculation based on words progress
-        progress_xp = min(overall_xp, xp_req) if xp_req > 0 else overall_xp
-        progress_words = min(current_words, req_words) if req_words > 0 else current_words
-        progress_messages = min(current_messages, req_messages) if req_messages > 0 else current_messages
-        progress_vc = min(current_vc, req_vc) if req_vc > 0 else current_vc
-        progress_quests = min(current_quests, req_quests) if req_quests > 0 else current_quests
-        
-        stats_requirements = [
-            (f"{progress_xp:,}", f"{xp_req:,}"),
-            (f"{progress_words:,}", f"{req_words:,}"),
-            (f"{progress_messages:,}", f"{req_messages:,}"),
-            (f"{progress_vc:,}", f"{req_vc:,}"),
-            (f"{progress_quests:,}", f"{req_quests:,}")
-        ]
-    else:
-        # Max level reached
-        stats_requirements = [("-", "-")] * 5
-    
-    for i, (label, value, (progress, req)) in enumerate(zip(stats_labels, stats_values, stats_requirements)):
-        y_pos = stats_start_y + (i * stat_spacing)
-        
-        # Label
-        draw.text((stats_x, y_pos), label, fill=TEXT_COLOR, font=small_font)
-        
-        # Value (overall stat)
-        value_x = stats_x + int(150 * scale_factor)
-        draw.text((value_x, y_pos), value, fill=TEXT_COLOR, font=small_font)
-        
-        # Separator and requirement (progress / requirement)
-        req_x = value_x + int(150 * scale_factor)
-        draw.text((req_x, y_pos), "]", fill=TEXT_COLOR, font=small_font)
-        req_text = f"{progress} / {req}"
-        draw.text((req_x + int(25 * scale_factor), y_pos), req_text, fill=TEXT_COLOR, font=small_font)
-    
-    # Draw "About me" section
-    about_y = stats_start_y + (len(stats_labels) * stat_spacing) + int(40 * scale_factor)
-    about_x = pfp_x
-    
-    # Message icon (white/black rounded box based on background)
-    icon_size = int(35 * scale_factor)
-    icon_radius = int(6 * scale_factor)
-    icon_color = (0, 0, 0) if is_light_bg else (255, 255, 255)
-    draw.rounded_rectangle([(about_x, about_y), (about_x + icon_size, about_y + icon_size)], 
-                         radius=icon_radius, fill=icon_color)
-    
-    # "Abouts me" title
-    about_title_x = about_x + icon_size + int(12 * scale_factor)
-    draw.text((about_title_x, about_y), "Abouts me", fill=TEXT_COLOR, font=medium_font)
-    
-    # About me text
-    about_text = user_data.get('about_me', '') or ''
-    if about_text:
-        # Wrap text if too long
-        max_width = CONTENT_WIDTH - int(40 * scale_factor)
-        words = about_text.split()
-        lines = []
-        current_line = []
-        current_width = 0
-        
-        for word in words:
-            word_bbox = draw.textbbox((0, 0), word + " ", font=about_font)
-            word_width = word_bbox[2] - word_bbox[0]
-            if current_width + word_width > max_width and current_line:
-                lines.append(" ".join(current_line))
-                current_line = [word]
-                current_width = word_width
-            else:
-                current_line.append(word)
-                current_width += word_width
-        
-        if current_line:
-            lines.append(" ".join(current_line))
-        
-        about_text_y = about_y + int(40 * scale_factor)
-        line_height = int(28 * scale_factor)
-        for line in lines[:3]:  # Limit to 3 lines
-            draw.text((about_x, about_text_y), line, fill=TEXT_GRAY, font=about_font)
-            about_text_y += line_height
-    
-    # Convert to bytes
-    img_bytes = BytesIO()
-    img.save(img_bytes, format='PNG')
-    img_bytes.seek(0)
-    return img_bytes
+    return [url for url in urls if url]
+
+
+def get_card_inputs(user: discord.Member, user_data: Dict, guild: discord.Guild) -> CardInputs:
+    """Resolve everything a card render needs from Discord and the database up front"""
+    next_level = user_data.get('level', 0) + 1
+    return CardInputs(
+        user_data={field: user_data[field] for field in CARD_FIELDS if field in user_data},
+        display_name=user.display_name,
+        username=user.name,
+        rank=get_user_rank(user.id, guild.id) or 0,
+        avatar_url=str(user.display_avatar.url),
+        guild_icon_url=str(guild.icon.url) if guild.icon else None,
+        next_requirements=LevelSystem.get_level_requirements(next_level) if next_level <= 100 else None,
+    )
+
+
+card_renderer = CardRenderer()
+COMMON_FONT_SIZES = 5  # most used card_font_size settings preloaded by the card workers
+card_asset_cache = AssetCache()
+CARD_BUSY_MESSAGE = "⏳ Lots of profile cards are being drawn right now, here's your text profile instead. Try `%me` again in a moment!"
+CARD_QUEUED_MESSAGE = "🕒 Your profile card is queued behind a few others, it'll be here shortly!"
 
 
 @bot.command(name='me')
@@ -4163,9 +3664,18 @@ async def me_cmd(ctx, action: str = None, *, value: str = None):
     
     # Generate profile card
     try:
-        card_image = generate_profile_card(target, target_data, ctx.guild)
-        file = discord.File(card_image, filename='profile_card.png')
+        if card_renderer.is_queued() and not card_renderer.is_saturated():
+            await ctx.send(CARD_QUEUED_MESSAGE)
+        async with ctx.typing():
+            image_urls = get_card_image_urls(target, target_data, ctx.guild)
+            async with card_asset_cache.fetch_pinned(image_urls) as card_assets:
+                card_inputs = get_card_inputs(target, target_data, ctx.guild)
+                card_png = await card_renderer.render(card_inputs, card_assets)
+        file = discord.File(BytesIO(card_png), filename='profile_card.png')
         await ctx.send(file=file)
+    except RendererBusy:
+        await ctx.send(CARD_BUSY_MESSAGE)
+        await profile_cmd(ctx, target if target != ctx.author else None)
     except Exception as e:
         # Fallback to embed if image generation fails
         await ctx.send(f"❌ Error generating profile card: {str(e)}")
@@ -4204,11 +3714,54 @@ async def vc_test_cmd(ctx):
     embed.add_field(name="Active Sessions",
                     value=active_sessions,
                     inline=False)
+
+    session = voice_tracker.sessions.get((ctx.guild.id, ctx.author.id))
+    if session:
+        states = [name for flag, name in VC_STATE_NAMES.items() if session.state & flag]
+        embed.add_field(name="Current State",
+                        value=f"{', '.join(states) or 'active'} • "
+                              f"{'earning' if session.creditable else 'not earning'} VC time",
+                        inline=False)
     embed.set_footer(text="Join/leave a VC to test tracking")
 
     await ctx.send(embed=embed)
 
 
+@bot.command(name='vcpolicy')
+@commands.has_permissions(administrator=True)
+async def vc_policy_cmd(ctx, state: str = None, setting: str = None):
+    """Choose which voice states earn no VC time (Admin only) - Usage: %vcpolicy [afk/alone/deafened/muted] [on/off]"""
+    flags = {name: flag for flag, name in VC_STATE_NAMES.items()}
+    excluded = voice_tracker.excluded_states(ctx.guild.id)
+
+    if state is not None:
+        state = state.lower()
+        if state not in flags or (setting or "").lower() not in ("on", "off"):
+            await ctx.send("❌ Usage: `%vcpolicy [afk/alone/deafened/muted] [on/off]` (on = excluded from VC time)")
+            return
+
+        if setting.lower() == "on":
+            excluded |= flags[state]
+        else:
+            excluded &= ~flags[state]
+
+        conn = get_db_connection()
+        conn.execute('''INSERT INTO guild_settings (guild_id, vc_excluded_states) VALUES (?, ?)
+                        ON CONFLICT(guild_id) DO UPDATE SET vc_excluded_states = excluded.vc_excluded_states''',
+                     (ctx.guild.id, excluded))
+        conn.commit()
+        conn.close()
+        voice_tracker.policies[ctx.guild.id] = excluded
+
+    embed = discord.Embed(title="🎧 VC Time Policy", color=discord.Color.blue())
+    for flag, name in VC_STATE_NAMES.items():
+        embed.add_field(name=name.title(),
+                        value="❌ Not counted" if excluded & flag else "✅ Counted",
+                        inline=True)
+    embed.set_footer(text="Changes apply from each member's next voice state change")
+    await ctx.send(embed=embed)
+
+
 @bot.command(name='debug')
 async def debug_cmd(ctx):
     user_data = get_user_data(ctx.author.id, ctx.guild.id)
@@ -4318,6 +3871,55 @@ async def color_cmd(ctx, hex_color: str):
         await ctx.send(embed=embed)
 
 
+class CursorPageView(discord.ui.View):
+    """Previous/next buttons that page by cursor instead of re-running OFFSET queries"""
+
+    def __init__(self, fetch_page, render_page, page: int, total_pages: int,
+                 first_cursor, last_cursor, owner_id: int = None):
+        super().__init__(timeout=300)
+        self.owner_id = owner_id  # only this member may page personal data
+        self.fetch_page = fetch_page
+        self.render_page = render_page
+        self.page = page
+        self.total_pages = total_pages
+        self.first_cursor = first_cursor
+        self.last_cursor = last_cursor
+        self.update_buttons()
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if self.owner_id is not None and interaction.user.id != self.owner_id:
+            await interaction.response.send_message("❌ These buttons belong to someone else's command.",
+                                                    ephemeral=True)
+            return False
+        return True
+
+    def update_buttons(self):
+        self.prev_button.disabled = self.page <= 1
+        self.next_button.disabled = self.page >= self.total_pages
+
+    async def show(self, interaction: discord.Interaction, payload, first_cursor, last_cursor):
+        self.first_cursor, self.last_cursor = first_cursor, last_cursor
+        self.update_buttons()
+        await interaction.response.edit_message(embed=await self.render_page(payload, self.page), view=self)
+
+    @discord.ui.button(label="◀ Previous", style=discord.ButtonStyle.gray)
+    async def prev_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        payload, first_cursor, last_cursor = await self.fetch_page(before=self.first_cursor)
+        self.page = max(1, self.page - 1)
+        await self.show(interaction, payload, first_cursor, last_cursor)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.gray)
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        payload, first_cursor, last_cursor = await self.fetch_page(after=self.last_cursor)
+        if first_cursor is None:
+            self.total_pages = self.page
+            self.update_buttons()
+            await interaction.response.edit_message(view=self)
+            return
+        self.page = min(self.total_pages, self.page + 1)
+        await self.show(interaction, payload, first_cursor, last_cursor)
+
+
 @bot.command(name='leaderboard', aliases=['lb'])
 async def leaderboard_cmd(ctx, category: str = "overall", page: int = 1):
     """Optimized leaderboard with pagination - Usage: %leaderboard [category] [page]"""
@@ -4330,70 +3932,25 @@ async def leaderboard_cmd(ctx, category: str = "overall", page: int = 1):
     per_page = 10
     offset = (page - 1) * per_page
     
-    conn = get_db_connection()
-
-    # Get total count for the category
-    if category == "words":
-        # Uses idx_users_words index
-        total_count = conn.execute(
-            '''SELECT COUNT(*) FROM users WHERE guild_id = ? AND unique_words > 0''',
-            (ctx.guild.id,)).fetchone()[0]
-        results = conn.execute(
-            '''SELECT user_id, unique_words FROM users 
-                               WHERE guild_id = ? AND unique_words > 0
-                               ORDER BY unique_words DESC LIMIT ? OFFSET ?''',
-            (ctx.guild.id, per_page, offset)).fetchall()
-        title = "📊 Word Leaderboard"
-        value_key = "unique_words"
-    elif category == "vc":
-        # Uses idx_users_vc index
-        total_count = conn.execute(
-            '''SELECT COUNT(*) FROM users WHERE guild_id = ? AND vc_seconds > 0''',
-            (ctx.guild.id,)).fetchone()[0]
-        results = conn.execute(
-            '''SELECT user_id, vc_seconds FROM users 
-                               WHERE guild_id = ? AND vc_seconds > 0
-                               ORDER BY vc_seconds DESC LIMIT ? OFFSET ?''',
-            (ctx.guild.id, per_page, offset)).fetchall()
-        title = "🎧 VC Time Leaderboard"
-        value_key = "vc_seconds"
-    elif category == "quests":
-        # Uses idx_users_quests index
-        total_count = conn.execute(
-            '''SELECT COUNT(*) FROM users WHERE guild_id = ? AND quests_completed > 0''',
-            (ctx.guild.id,)).fetchone()[0]
-        results = conn.execute(
-            '''SELECT user_id, quests_completed FROM users 
-                               WHERE guild_id = ? AND quests_completed > 0
-                               ORDER BY quests_completed DESC LIMIT ? OFFSET ?''',
-            (ctx.guild.id, per_page, offset)).fetchall()
-        title = "🎯 Quests Leaderboard"
-        value_key = "quests_completed"
-    elif category == "xp":
-        # Uses idx_users_xp index
-        total_count = conn.execute(
-            '''SELECT COUNT(*) FROM users WHERE guild_id = ? AND xp > 0''',
-            (ctx.guild.id,)).fetchone()[0]
-        results = conn.execute(
-            '''SELECT user_id, xp FROM users 
-                               WHERE guild_id = ? AND xp > 0
-                               ORDER BY xp DESC LIMIT ? OFFSET ?''',
-            (ctx.guild.id, per_page, offset)).fetchall()
-        title = "⭐ XP Leaderboard"
-        value_key = "xp"
-    else:
-        # Uses idx_users_level index
-        total_count = conn.execute(
-            '''SELECT COUNT(*) FROM users WHERE guild_id = ?''',
-            (ctx.guild.id,)).fetchone()[0]
-        results = conn.execute(
-            '''SELECT user_id, level, xp FROM users 
-                               WHERE guild_id = ? ORDER BY level DESC, xp DESC LIMIT ? OFFSET ?''',
-            (ctx.guild.id, per_page, offset)).fetchall()
-        title = "🏆 Overall Leaderboard"
-        value_key = "level"
-
-    conn.close()
+    titles = {
+        "overall": ("🏆 Overall Leaderboard", "level"),
+        "words": ("📊 Word Leaderboard", "unique_words"),
+        "vc": ("🎧 VC Time Leaderboard", "vc_seconds"),
+        "quests": ("🎯 Quests Leaderboard", "quests_completed"),
+        "xp": ("⭐ XP Leaderboard", "xp"),
+    }
+    if category not in titles:
+        category = "overall"
+    title, value_key = titles[category]
+
+    # Top pages come from the periodically refreshed snapshot, deeper ones from the live engine
+    snapshot = leaderboard_engine.get_snapshot(ctx.guild.id, category)
+    total_count = snapshot.total
+    results = snapshot.page(offset, per_page)
+    snapshot_age = snapshot.age
+    if results is None:
+        results = leaderboard_engine.get_leaderboard(ctx.guild.id).page(category, offset, per_page)
+        snapshot_age = None
 
     if not results:
         await ctx.send("❌ No data available for this page!")
@@ -4401,22 +3958,34 @@ async def leaderboard_cmd(ctx, category: str = "overall", page: int = 1):
 
     # Calculate total pages
     total_pages = (total_count + per_page - 1) // per_page  # Ceiling division
-    
-    embed = discord.Embed(title=f"{title} - Page {page}/{total_pages}", color=discord.Color.gold())
 
-    leaderboard_text = ""
-    for i, row in enumerate(results):
-        # Calculate actual rank based on page
-        rank = offset + i + 1
-        
-        if category == "overall":
-            user_id, level_val, xp_val = row
-            value = level_val
-        else:
-            user_id, value = row
-        
-        user = ctx.guild.get_member(user_id)
-        if user:
+    async def fetch_page(after=None, before=None):
+        # Buttons move by cursor, so the total is never recounted while navigating
+        current = leaderboard_engine.get_snapshot(ctx.guild.id, category)
+        window = current.window(after=after, before=before, limit=per_page)
+        age = current.age
+        if window is None:
+            window = leaderboard_engine.get_leaderboard(ctx.guild.id).window(
+                category, after=after, before=before, limit=per_page)
+            age = None
+        start, rows = window
+        if not rows:
+            return (start, rows, age), None, None
+        return (start, rows, age), rows[0], rows[-1]
+
+    async def render_page(payload, page_num):
+        start, rows, age = payload
+        embed = discord.Embed(title=f"{title} - Page {page_num}/{total_pages}", color=discord.Color.gold())
+
+        names = await name_resolver.resolve(ctx.guild, [user_id for user_id, _ in rows],
+                                            fetch_departed=False)
+
+        leaderboard_text = ""
+        for i, (user_id, values) in enumerate(rows):
+            # Actual rank comes from the row's position in the leaderboard
+            rank = start + i + 1
+            value = values[0]
+
             if value_key == "vc_seconds":
                 display_value = f"{value//60}m"
             elif value_key == "xp":
@@ -4424,38 +3993,26 @@ async def leaderboard_cmd(ctx, category: str = "overall", page: int = 1):
             else:
                 display_value = str(value)
 
-            # Only show medals for top 3 on first page
-            if page == 1 and rank <= 3:
+            # Only show medals for the top 3
+            if rank <= 3:
                 medal = ["🥇", "🥈", "🥉"][rank - 1]
             else:
                 medal = f"{rank}."
-            
-            leaderboard_text += f"{medal} {user.mention} - `{display_value}`\n"
-        else:
-            # Handle users who left the server
-            if value_key == "vc_seconds":
-                display_value = f"{value//60}m"
-            elif value_key == "xp":
-                display_value = f"{value:,}"
-            else:
-                display_value = str(value)
-            
-            if page == 1 and rank <= 3:
-                medal = ["🥇", "🥈", "🥉"][rank - 1]
+
+            if names[user_id].is_member:
+                leaderboard_text += f"{medal} {names[user_id].mention} - `{display_value}`\n"
             else:
-                medal = f"{rank}."
-            
-            leaderboard_text += f"{medal} `[Left Server]` - `{display_value}`\n"
+                # Handle users who left the server
+                leaderboard_text += f"{medal} `[Left Server]` - `{display_value}`\n"
 
-    embed.description = leaderboard_text
-    
-    # Add navigation hints
-    footer_text = f"Use %leaderboard {category} [page] to navigate"
-    if page < total_pages:
-        footer_text += f" • Next: %lb {category} {page + 1}"
-    embed.set_footer(text=footer_text)
-    
-    await ctx.send(embed=embed)
+        embed.description = leaderboard_text
+        footer_text = f"Use the buttons or %leaderboard {category} [page] to navigate"
+        footer_text += f" • Snapshot age: {age}s" if age is not None else " • Live"
+        embed.set_footer(text=footer_text)
+        return embed
+
+    view = CursorPageView(fetch_page, render_page, page, total_pages, results[0], results[-1])
+    await ctx.send(embed=await render_page((offset, results, snapshot_age), page), view=view)
 
 
 @bot.command(name='version')
@@ -4512,7 +4069,7 @@ async def help_cmd(ctx):
         "%banner <url>": "Set profile banner for embed (Level 1+)",
         "%color <hex>": "Change profile color for embed",
         "%leaderboard [category] [page]": "View leaderboards (overall/words/vc/quests/xp)",
-        "%export [type]": "Export your data (study/user/all) as JSON",
+        "%export [type] [format]": "Export your data (study/user/all) as NDJSON or CSV",
         "%version": "Check bot version and changelog",
         "%guide": "Learn how the bot works",
         "%admin help": "View admin-only commands"
@@ -4856,6 +4413,7 @@ async def admin_cmd(ctx, action: str = None):
         "%forcemessages <user> <amount>": "Force add messages to a user (admin only)",
         "%forcequests <user> <amount>": "Force add quests completed to a user (admin only)",
         "%trivia <action>": "Manage trivia questions and sessions (admin only)",
+        "%vcpolicy [state] [on/off]": "Choose which voice states (afk/alone/deafened/muted) earn no VC time",
         "%testweekly [user]": "Test weekly quest reset (admin only)",
         "%testlevel [user]": "Test leveling system calculations (admin only)",
         "%testall [user]": "Run all tracker tests (admin only)",
@@ -5404,45 +4962,55 @@ async def delete_quest_cmd(ctx, quest_id: str):
 @commands.has_permissions(administrator=True)
 async def list_custom_quests_cmd(ctx, page: int = 1):
     """List all custom quests in this guild (Admin only) - Usage: %listcustomquests [page]"""
-    from quest_system import get_custom_quests
+    from quest_system import count_custom_quests, get_custom_quests_page, CUSTOM_QUEST_ORDER
 
-    quests = get_custom_quests(ctx.guild.id)
+    total_quests = count_custom_quests(ctx.guild.id)
 
-    if not quests:
+    if not total_quests:
         await ctx.send("❌ No custom quests found in this guild!")
         return
 
     # Pagination
     per_page = 5
-    total_pages = (len(quests) + per_page - 1) // per_page
+    total_pages = (total_quests + per_page - 1) // per_page
     if page < 1 or page > total_pages:
         page = 1
 
-    start_idx = (page - 1) * per_page
-    end_idx = start_idx + per_page
-    page_quests = quests[start_idx:end_idx]
+    page_quests = get_custom_quests_page(ctx.guild.id, limit=per_page, offset=(page - 1) * per_page)
 
-    embed = discord.Embed(
-        title=f"🎯 Custom Quests - Page {page}/{total_pages}",
-        description=f"Total custom quests: {len(quests)}",
-        color=discord.Color.purple()
-    )
+    async def fetch_page(after=None, before=None):
+        quests = get_custom_quests_page(ctx.guild.id, cursor=before or after, limit=per_page,
+                                        before=before is not None)
+        if not quests:
+            return quests, None, None
+        return quests, cursor_of(quests[0], CUSTOM_QUEST_ORDER), cursor_of(quests[-1], CUSTOM_QUEST_ORDER)
 
-    for quest in page_quests:
-        status = "✅ Enabled" if quest['enabled'] else "❌ Disabled"
-        embed.add_field(
-            name=f"{quest['emoji']} {quest['name']} ({status})",
-            value=f"**ID:** `{quest['quest_id']}`\n"
-                  f"**Type:** {quest['quest_type'].title()}\n"
-                  f"**XP:** {quest['xp_reward']:,}\n"
-                  f"**Description:** {quest['description'][:100]}{'...' if len(quest['description']) > 100 else ''}",
-            inline=False
+    async def render_page(quests, page_num):
+        embed = discord.Embed(
+            title=f"🎯 Custom Quests - Page {page_num}/{total_pages}",
+            description=f"Total custom quests: {total_quests}",
+            color=discord.Color.purple()
         )
 
-    if total_pages > 1:
-        embed.set_footer(text=f"Use %listcustomquests {page + 1} for next page")
+        for quest in quests:
+            status = "✅ Enabled" if quest['enabled'] else "❌ Disabled"
+            embed.add_field(
+                name=f"{quest['emoji']} {quest['name']} ({status})",
+                value=f"**ID:** `{quest['quest_id']}`\n"
+                      f"**Type:** {quest['quest_type'].title()}\n"
+                      f"**XP:** {quest['xp_reward']:,}\n"
+                      f"**Description:** {quest['description'][:100]}{'...' if len(quest['description']) > 100 else ''}",
+                inline=False
+            )
 
-    await ctx.send(embed=embed)
+        if total_pages > 1:
+            embed.set_footer(text="Use the buttons or %listcustomquests [page] to navigate")
+        return embed
+
+    view = CursorPageView(fetch_page, render_page, page, total_pages,
+                          cursor_of(page_quests[0], CUSTOM_QUEST_ORDER),
+                          cursor_of(page_quests[-1], CUSTOM_QUEST_ORDER))
+    await ctx.send(embed=await render_page(page_quests, page), view=view)
 
 
 @bot.command(name='backup')
@@ -6181,12 +5749,14 @@ async def study_stop(ctx):
     # Move to history
     c.execute('''INSERT INTO study_history
                   (user_id, guild_id, session_id, study_type, subject, mood,
-                   intended_duration, start_time, end_time, actual_duration, completed)
+                   intended_duration, start_time, end_time, actual_duration, completed,
+                   pdf_url, answer_key_url)
                   SELECT user_id, guild_id, session_id, study_type, subject, mood,
-                         intended_duration, start_time, ?, ?, 1
+                         intended_duration, start_time, ?, ?, 1, pdf_url, answer_key_url
                   FROM study_sessions
                   WHERE user_id = ? AND guild_id = ?''',
               (datetime.datetime.now().isoformat(), actual_duration, ctx.author.id, ctx.guild.id))
+    record_session(c, session_id)
 
     # Remove from active sessions
     c.execute('''DELETE FROM study_sessions WHERE user_id = ? AND guild_id = ?''',
@@ -6194,6 +5764,8 @@ async def study_stop(ctx):
 
     conn.commit()
     conn.close()
+    study_sessions_scheduler.cancel(ctx.author.id, ctx.guild.id)
+    answer_keys.forget(session_id)
 
     # Calculate duration display
     hours = actual_duration // 3600
@@ -6284,7 +5856,7 @@ async def study_status(ctx):
 async def study_pdf(ctx, url: str, page: int = 1):
     """Display a PDF page as an image - Usage: %study pdf <url> [page]"""
     # Validate URL
-    if not validate_pdf_url(url):
+    if not await validate_pdf_url(url):
         await ctx.send("❌ Invalid PDF URL. Please provide a valid PDF link.")
         return
 
@@ -6301,7 +5873,7 @@ async def study_pdf(ctx, url: str, page: int = 1):
 
     try:
         # Render PDF page
-        img_path, error = render_pdf_page(url, page - 1)  # 0-indexed
+        png_bytes, error = await render_pdf_page(url, page - 1)  # 0-indexed
 
         if error:
             embed = discord.Embed(
@@ -6313,7 +5885,7 @@ async def study_pdf(ctx, url: str, page: int = 1):
             return
 
         # Send the image
-        file = discord.File(img_path, filename=f"page_{page}.png")
+        file = discord.File(io.BytesIO(png_bytes), filename=f"page_{page}.png")
         embed = discord.Embed(
             title=f"📄 PDF Page {page}",
             description=f"From: {url}",
@@ -6323,10 +5895,6 @@ async def study_pdf(ctx, url: str, page: int = 1):
 
         await ctx.send(file=file, embed=embed)
 
-        # Clean up
-        import os
-        os.remove(img_path)
-
         # Delete status message
         await status_msg.delete()
 
@@ -6343,7 +5911,7 @@ async def study_pdf(ctx, url: str, page: int = 1):
 async def study_answers(ctx, url: str, pattern: str = None):
     """Process answer key from PDF - Usage: %study answers <url> [pattern]"""
     # Validate URL
-    if not validate_pdf_url(url):
+    if not await validate_pdf_url(url):
         await ctx.send("❌ Invalid PDF URL. Please provide a valid PDF link.")
         return
 
@@ -6356,7 +5924,7 @@ async def study_answers(ctx, url: str, pattern: str = None):
 
     try:
         # Extract text from PDF
-        pdf_text = extract_pdf_text(url)
+        pdf_text = await extract_pdf_page_texts(url)
 
         if not pdf_text:
             embed = discord.Embed(
@@ -6395,13 +5963,7 @@ async def study_answers(ctx, url: str, pattern: str = None):
         if session_check:
             session_id = session_check[0]
             # Store answers in database
-            for question_num, answer in answers.items():
-                c.execute('''INSERT OR REPLACE INTO study_answers
-                             (user_id, guild_id, session_id, question_number, answer, is_correct, timestamp)
-                             VALUES (?, ?, ?, ?, ?, 1, ?)''',
-                          (ctx.author.id, ctx.guild.id, session_id, question_num, answer,
-                           datetime.datetime.now().isoformat()))
-            conn.commit()
+            answer_keys.load(session_id, answers, source_url=url)
 
         conn.close()
 
@@ -6624,53 +6186,21 @@ async def study_analytics(ctx, period: str = "all"):
         color=discord.Color.purple()
     )
 
-    # Total study sessions
-    if start_date:
-        c.execute('''SELECT COUNT(*) FROM study_history
-                      WHERE user_id = ? AND guild_id = ? AND start_time >= ?''',
-                  (ctx.author.id, ctx.guild.id, start_date.isoformat()))
-    else:
-        c.execute('''SELECT COUNT(*) FROM study_history
-                      WHERE user_id = ? AND guild_id = ?''',
-                  (ctx.author.id, ctx.guild.id))
-    total_sessions = c.fetchone()[0]
-
-    # Total study time
-    if start_date:
-        c.execute('''SELECT SUM(actual_duration) FROM study_history
-                      WHERE user_id = ? AND guild_id = ? AND start_time >= ?''',
-                  (ctx.author.id, ctx.guild.id, start_date.isoformat()))
-    else:
-        c.execute('''SELECT SUM(actual_duration) FROM study_history
-                      WHERE user_id = ? AND guild_id = ?''',
-                  (ctx.author.id, ctx.guild.id))
-    total_duration = c.fetchone()[0] or 0
-
-    # Total answers and accuracy
-    if start_date:
-        c.execute('''SELECT COUNT(*), SUM(is_correct) FROM study_answers sa
-                      JOIN study_history sh ON sa.session_id = sh.session_id
-                      WHERE sa.user_id = ? AND sa.guild_id = ? AND sh.start_time >= ?''',
-                  (ctx.author.id, ctx.guild.id, start_date.isoformat()))
-    else:
-        c.execute('''SELECT COUNT(*), SUM(is_correct) FROM study_answers
-                      WHERE user_id = ? AND guild_id = ?''',
-                  (ctx.author.id, ctx.guild.id))
-    answer_stats = c.fetchone()
-    total_answers = answer_stats[0] or 0
-    correct_answers = answer_stats[1] or 0
+    # Sessions, time and answers come from the per-day rollup
+    start_day = start_date.date().isoformat() if start_date else ''
+    c.execute('''SELECT COALESCE(SUM(sessions), 0), COALESCE(SUM(total_duration), 0),
+                        COALESCE(SUM(answers), 0), COALESCE(SUM(correct_answers), 0)
+                  FROM study_daily_rollup
+                  WHERE user_id = ? AND guild_id = ? AND date >= ?''',
+              (ctx.author.id, ctx.guild.id, start_day))
+    total_sessions, total_duration, total_answers, correct_answers = c.fetchone()
     accuracy = (correct_answers / total_answers * 100) if total_answers > 0 else 0
 
     # Study types breakdown
-    if start_date:
-        c.execute('''SELECT study_type, COUNT(*) FROM study_history
-                      WHERE user_id = ? AND guild_id = ? AND start_time >= ?
-                      GROUP BY study_type''',
-                  (ctx.author.id, ctx.guild.id, start_date.isoformat()))
-    else:
-        c.execute('''SELECT study_type, COUNT(*) FROM study_history
-                      WHERE user_id = ? AND guild_id = ? GROUP BY study_type''',
-                  (ctx.author.id, ctx.guild.id))
+    c.execute('''SELECT study_type, SUM(sessions) FROM study_daily_rollup
+                  WHERE user_id = ? AND guild_id = ? AND date >= ?
+                  GROUP BY study_type''',
+              (ctx.author.id, ctx.guild.id, start_day))
     study_types = c.fetchall()
 
     # Bookmarks count
@@ -6683,9 +6213,9 @@ async def study_analytics(ctx, period: str = "all"):
     if start_date:
         # Previous period for comparison
         prev_start = start_date - (now - start_date)
-        c.execute('''SELECT COUNT(*), SUM(actual_duration) FROM study_history
-                      WHERE user_id = ? AND guild_id = ? AND start_time >= ? AND start_time < ?''',
-                  (ctx.author.id, ctx.guild.id, prev_start.isoformat(), start_date.isoformat()))
+        c.execute('''SELECT SUM(sessions), SUM(total_duration) FROM study_daily_rollup
+                      WHERE user_id = ? AND guild_id = ? AND date >= ? AND date < ?''',
+                  (ctx.author.id, ctx.guild.id, prev_start.date().isoformat(), start_day))
         prev_stats = c.fetchone()
         prev_sessions = prev_stats[0] or 0
         prev_duration = prev_stats[1] or 0
@@ -6720,24 +6250,17 @@ async def study_analytics(ctx, period: str = "all"):
     # Study streaks and consistency
     if start_date:
         # Calculate study streak (consecutive days with study sessions)
-        c.execute('''SELECT DISTINCT DATE(start_time) as study_date FROM study_history
-                      WHERE user_id = ? AND guild_id = ? AND start_time >= ?
-                      ORDER BY study_date DESC''',
-                  (ctx.author.id, ctx.guild.id, start_date.isoformat()))
+        c.execute('''SELECT DISTINCT date FROM study_daily_rollup
+                      WHERE user_id = ? AND guild_id = ? AND date >= ?
+                      ORDER BY date DESC''',
+                  (ctx.author.id, ctx.guild.id, start_day))
         study_dates = [row[0] for row in c.fetchall()]
 
         if study_dates:
-            # Calculate current streak
-            streak = 0
-            check_date = datetime.date.today()
-            while check_date.isoformat() in study_dates or (check_date - datetime.timedelta(days=1)).isoformat() in study_dates:
-                if check_date.isoformat() in study_dates:
-                    streak += 1
-                check_date -= datetime.timedelta(days=1)
-                if streak > 30:  # Prevent infinite loop
-                    break
-
+            # Streaks are kept up to date as sessions end
+            streak, longest_streak = get_streak(c, ctx.author.id, ctx.guild.id)
             embed.add_field(name="🔥 Current Streak", value=f"{streak} days", inline=True)
+            embed.add_field(name="🏆 Longest Streak", value=f"{longest_streak} days", inline=True)
 
             # Study frequency
             unique_days = len(set(study_dates))
@@ -6808,39 +6331,26 @@ async def study_leaderboard(ctx, metric: str = "time", period: str = "all"):
     )
 
     # Build query based on metric
+    start_day = start_date.date().isoformat() if start_date else ''
     if metric == 'time':
         # Total study time
-        if start_date:
-            c.execute('''SELECT u.user_id, SUM(sh.actual_duration) as total_time,
-                                COUNT(sh.session_id) as session_count
-                          FROM study_history sh
-                          JOIN users u ON sh.user_id = u.user_id AND sh.guild_id = u.guild_id
-                          WHERE sh.guild_id = ? AND sh.start_time >= ?
-                          GROUP BY sh.user_id
-                          ORDER BY total_time DESC LIMIT 10''',
-                      (ctx.guild.id, start_date.isoformat()))
-        else:
-            c.execute('''SELECT u.user_id, SUM(sh.actual_duration) as total_time,
-                                COUNT(sh.session_id) as session_count
-                          FROM study_history sh
-                          JOIN users u ON sh.user_id = u.user_id AND sh.guild_id = u.guild_id
-                          WHERE sh.guild_id = ?
-                          GROUP BY sh.user_id
-                          ORDER BY total_time DESC LIMIT 10''',
-                      (ctx.guild.id,))
+        c.execute('''SELECT user_id, SUM(total_duration) as total_time,
+                            SUM(sessions) as session_count
+                      FROM study_daily_rollup
+                      WHERE guild_id = ? AND date >= ?
+                      GROUP BY user_id
+                      ORDER BY total_time DESC LIMIT 10''',
+                  (ctx.guild.id, start_day))
 
         results = c.fetchall()
+        names = await name_resolver.resolve(ctx.guild, [row[0] for row in results])
 
         for rank, (user_id, total_time, session_count) in enumerate(results, 1):
             hours = total_time // 3600
             minutes = (total_time % 3600) // 60
             time_str = f"{hours}h {minutes}m" if hours > 0 else f"{minutes}m"
 
-            try:
-                user = bot.get_user(user_id) or await bot.fetch_user(user_id)
-                username = user.display_name
-            except:
-                username = f"User {user_id}"
+            username = names[user_id].display_name
 
             medal = {1: "🥇", 2: "🥈", 3: "🥉"}.get(rank, f"{rank}.")
             embed.add_field(
@@ -6851,33 +6361,21 @@ async def study_leaderboard(ctx, metric: str = "time", period: str = "all"):
 
     elif metric == 'sessions':
         # Number of study sessions
-        if start_date:
-            c.execute('''SELECT sh.user_id, COUNT(sh.session_id) as session_count,
-                                SUM(sh.actual_duration) as total_time
-                          FROM study_history sh
-                          WHERE sh.guild_id = ? AND sh.start_time >= ?
-                          GROUP BY sh.user_id
-                          ORDER BY session_count DESC LIMIT 10''',
-                      (ctx.guild.id, start_date.isoformat()))
-        else:
-            c.execute('''SELECT sh.user_id, COUNT(sh.session_id) as session_count,
-                                SUM(sh.actual_duration) as total_time
-                          FROM study_history sh
-                          WHERE sh.guild_id = ?
-                          GROUP BY sh.user_id
-                          ORDER BY session_count DESC LIMIT 10''',
-                      (ctx.guild.id,))
+        c.execute('''SELECT user_id, SUM(sessions) as session_count,
+                            SUM(total_duration) as total_time
+                      FROM study_daily_rollup
+                      WHERE guild_id = ? AND date >= ?
+                      GROUP BY user_id
+                      ORDER BY session_count DESC LIMIT 10''',
+                  (ctx.guild.id, start_day))
 
         results = c.fetchall()
+        names = await name_resolver.resolve(ctx.guild, [row[0] for row in results])
 
         for rank, (user_id, session_count, total_time) in enumerate(results, 1):
             avg_time = total_time // max(session_count, 1) // 60  # Average minutes per session
 
-            try:
-                user = bot.get_user(user_id) or await bot.fetch_user(user_id)
-                username = user.display_name
-            except:
-                username = f"User {user_id}"
+            username = names[user_id].display_name
 
             medal = {1: "🥇", 2: "🥈", 3: "🥉"}.get(rank, f"{rank}.")
             embed.add_field(
@@ -6888,39 +6386,23 @@ async def study_leaderboard(ctx, metric: str = "time", period: str = "all"):
 
     elif metric == 'accuracy':
         # Test accuracy (only for MCQ sessions)
-        if start_date:
-            c.execute('''SELECT sh.user_id,
-                                SUM(sa.is_correct) as correct_answers,
-                                COUNT(sa.question_number) as total_answers
-                          FROM study_answers sa
-                          JOIN study_history sh ON sa.session_id = sh.session_id
-                          WHERE sa.guild_id = ? AND sh.start_time >= ? AND sh.study_type IN ('MCQ Test', 'MCQ Practice')
-                          GROUP BY sh.user_id
-                          HAVING total_answers > 0
-                          ORDER BY (SUM(sa.is_correct) * 1.0 / COUNT(sa.question_number)) DESC LIMIT 10''',
-                      (ctx.guild.id, start_date.isoformat()))
-        else:
-            c.execute('''SELECT sh.user_id,
-                                SUM(sa.is_correct) as correct_answers,
-                                COUNT(sa.question_number) as total_answers
-                          FROM study_answers sa
-                          JOIN study_history sh ON sa.session_id = sh.session_id
-                          WHERE sa.guild_id = ? AND sh.study_type IN ('MCQ Test', 'MCQ Practice')
-                          GROUP BY sh.user_id
-                          HAVING total_answers > 0
-                          ORDER BY (SUM(sa.is_correct) * 1.0 / COUNT(sa.question_number)) DESC LIMIT 10''',
-                      (ctx.guild.id,))
+        c.execute('''SELECT user_id,
+                            SUM(correct_answers) as correct_answers,
+                            SUM(answers) as total_answers
+                      FROM study_daily_rollup
+                      WHERE guild_id = ? AND date >= ? AND study_type IN ('MCQ Test', 'MCQ Practice')
+                      GROUP BY user_id
+                      HAVING total_answers > 0
+                      ORDER BY (SUM(correct_answers) * 1.0 / SUM(answers)) DESC LIMIT 10''',
+                  (ctx.guild.id, start_day))
 
         results = c.fetchall()
+        names = await name_resolver.resolve(ctx.guild, [row[0] for row in results])
 
         for rank, (user_id, correct_answers, total_answers) in enumerate(results, 1):
             accuracy = (correct_answers / total_answers * 100)
 
-            try:
-                user = bot.get_user(user_id) or await bot.fetch_user(user_id)
-                username = user.display_name
-            except:
-                username = f"User {user_id}"
+            username = names[user_id].display_name
 
             medal = {1: "🥇", 2: "🥈", 3: "🥉"}.get(rank, f"{rank}.")
             embed.add_field(
@@ -6930,53 +6412,16 @@ async def study_leaderboard(ctx, metric: str = "time", period: str = "all"):
             )
 
     elif metric == 'streak':
-        # Current study streak (consecutive days)
-        # This is more complex - need to calculate streaks for each user
-        c.execute('''SELECT DISTINCT sh.user_id, DATE(sh.start_time) as study_date
-                      FROM study_history sh
-                      WHERE sh.guild_id = ?
-                      ORDER BY sh.user_id, study_date DESC''',
-                  (ctx.guild.id,))
-
-        user_dates = {}
-        for user_id, study_date in c.fetchall():
-            if user_id not in user_dates:
-                user_dates[user_id] = []
-            user_dates[user_id].append(study_date)
-
-        # Calculate streaks
-        streaks = []
-        for user_id, dates in user_dates.items():
-            if not dates:
-                continue
-
-            # Sort dates descending
-            dates.sort(reverse=True)
-            streak = 0
-            check_date = datetime.date.today()
-
-            for date_str in dates:
-                date_obj = datetime.datetime.fromisoformat(date_str).date()
-                if date_obj == check_date or date_obj == check_date - datetime.timedelta(days=1):
-                    if date_obj == check_date:
-                        streak += 1
-                    check_date = date_obj
-                else:
-                    break
-
-            if streak > 0:
-                streaks.append((user_id, streak))
-
-        # Sort by streak length
-        streaks.sort(key=lambda x: x[1], reverse=True)
-        streaks = streaks[:10]
+        # Current study streak (consecutive days), maintained as sessions end
+        c.execute('''SELECT user_id, current_streak FROM study_streaks
+                      WHERE guild_id = ? AND last_study_date >= ? AND current_streak > 0
+                      ORDER BY current_streak DESC LIMIT 10''',
+                  (ctx.guild.id, active_streak_cutoff()))
+        streaks = c.fetchall()
+        names = await name_resolver.resolve(ctx.guild, [user_id for user_id, _ in streaks])
 
         for rank, (user_id, streak_length) in enumerate(streaks, 1):
-            try:
-                user = bot.get_user(user_id) or await bot.fetch_user(user_id)
-                username = user.display_name
-            except:
-                username = f"User {user_id}"
+            username = names[user_id].display_name
 
             medal = {1: "🥇", 2: "🥈", 3: "🥉"}.get(rank, f"{rank}.")
             embed.add_field(
@@ -7059,62 +6504,75 @@ async def study_history(ctx, page: int = 1, session_type: str = "all"):
 
     offset = (page - 1) * per_page
 
-    # Get sessions for this page
-    c.execute(f'''SELECT session_id, study_type, subject, mood, intended_duration,
+    base_query = '''SELECT session_id, study_type, subject, mood, intended_duration,
                          actual_duration, start_time, end_time, completed
-                  FROM study_history
+                  FROM study_history'''
+    order_columns = ("start_time", "session_id")
+
+    # Only a direct jump pays for OFFSET; the buttons below page by cursor
+    c.execute(f'''{base_query}
                   WHERE {query_conditions}
-                  ORDER BY start_time DESC LIMIT ? OFFSET ?''',
+                  ORDER BY start_time DESC, session_id DESC LIMIT ? OFFSET ?''',
               params + [per_page, offset])
     sessions = c.fetchall()
 
     conn.close()
 
-    embed = discord.Embed(
-        title=f"📚 Study Session History - Page {page}/{total_pages}",
-        description=f"Total sessions: {total_sessions}",
-        color=discord.Color.blue()
-    )
+    async def fetch_page(after=None, before=None):
+        page_conn = get_db_connection()
+        rows = keyset_page(page_conn, base_query, query_conditions, params, order_columns,
+                           cursor=before or after, limit=per_page, before=before is not None)
+        page_conn.close()
+        if not rows:
+            return rows, None, None
+        return rows, cursor_of(rows[0], order_columns), cursor_of(rows[-1], order_columns)
 
-    if session_type.lower() != "all":
-        embed.add_field(
-            name="Filter",
-            value=f"Showing: {session_type.title()} sessions",
-            inline=False
+    async def render_page(rows, page_num):
+        embed = discord.Embed(
+            title=f"📚 Study Session History - Page {page_num}/{total_pages}",
+            description=f"Total sessions: {total_sessions}",
+            color=discord.Color.blue()
         )
 
-    for i, session in enumerate(sessions, 1):
-        session_id, study_type, subject, mood, intended, actual, start_time, end_time, completed = session
+        if session_type.lower() != "all":
+            embed.add_field(
+                name="Filter",
+                value=f"Showing: {session_type.title()} sessions",
+                inline=False
+            )
+
+        for i, session in enumerate(rows, 1):
+            session_id, study_type, subject, mood, intended, actual, start_time, end_time, completed = session
 
-        # Format duration
-        actual_hours = actual // 3600
-        actual_minutes = (actual % 3600) // 60
-        duration_str = f"{actual_hours}h {actual_minutes}m" if actual_hours > 0 else f"{actual_minutes}m"
+            # Format duration
+            actual_hours = actual // 3600
+            actual_minutes = (actual % 3600) // 60
+            duration_str = f"{actual_hours}h {actual_minutes}m" if actual_hours > 0 else f"{actual_minutes}m"
 
-        # Format date
-        start_dt = datetime.datetime.fromisoformat(start_time)
-        date_str = start_dt.strftime("%Y-%m-%d %H:%M")
+            # Format date
+            start_dt = datetime.datetime.fromisoformat(start_time)
+            date_str = start_dt.strftime("%Y-%m-%d %H:%M")
 
-        # Status
-        status = "✅ Completed" if completed else "⏰ Expired"
+            # Status
+            status = "✅ Completed" if completed else "⏰ Expired"
 
-        embed.add_field(
-            name=f"{i}. {study_type} - {date_str}",
-            value=f"**Subject:** {subject or 'Not specified'}\n"
-                  f"**Duration:** {duration_str}\n"
-                  f"**Mood:** {mood or 'Not specified'}\n"
-                  f"**Status:** {status}\n"
-                  f"**ID:** `{session_id}`",
-            inline=False
-        )
+            embed.add_field(
+                name=f"{i}. {study_type} - {date_str}",
+                value=f"**Subject:** {subject or 'Not specified'}\n"
+                      f"**Duration:** {duration_str}\n"
+                      f"**Mood:** {mood or 'Not specified'}\n"
+                      f"**Status:** {status}\n"
+                      f"**ID:** `{session_id}`",
+                inline=False
+            )
 
-    # Navigation
-    footer_text = f"Use %study history {page + 1} to see next page"
-    if page > 1:
-        footer_text += f" • %study history {page - 1} for previous"
-    embed.set_footer(text=footer_text)
+        embed.set_footer(text="Use the buttons or %study history [page] to navigate")
+        return embed
 
-    await ctx.send(embed=embed)
+    view = CursorPageView(fetch_page, render_page, page, total_pages,
+                          cursor_of(sessions[0], order_columns), cursor_of(sessions[-1], order_columns),
+                          owner_id=ctx.author.id)
+    await ctx.send(embed=await render_page(sessions, page), view=view)
 
 
 @study_cmd.command(name='sessiondetails')
@@ -7205,37 +6663,37 @@ async def study_trends(ctx, period: str = "month"):
     now = datetime.datetime.now()
     if period == 'week':
         start_date = now - datetime.timedelta(days=7)
-        group_by = "DATE(start_time)"
+        group_by = "date"
         period_name = "This Week"
     elif period == 'month':
         start_date = now - datetime.timedelta(days=30)
-        group_by = "DATE(start_time)"
+        group_by = "date"
         period_name = "This Month"
     else:  # year
         start_date = now - datetime.timedelta(days=365)
-        group_by = "strftime('%Y-%W', start_time)"  # Weekly grouping for year
+        group_by = "strftime('%Y-%W', date)"  # Weekly grouping for year
         period_name = "This Year"
 
-    # Get daily study time
+    # Get daily study time from the per-day rollup
     c.execute(f'''SELECT {group_by} as period,
-                         SUM(actual_duration) as total_duration,
-                         COUNT(*) as session_count,
-                         AVG(actual_duration) as avg_duration
-                  FROM study_history
-                  WHERE user_id = ? AND guild_id = ? AND start_time >= ?
+                         SUM(total_duration) as total_duration,
+                         SUM(sessions) as session_count,
+                         SUM(total_duration) / SUM(sessions) as avg_duration
+                  FROM study_daily_rollup
+                  WHERE user_id = ? AND guild_id = ? AND date >= ?
                   GROUP BY period
                   ORDER BY period''',
-              (ctx.author.id, ctx.guild.id, start_date.isoformat()))
+              (ctx.author.id, ctx.guild.id, start_date.date().isoformat()))
     trend_data = c.fetchall()
 
     # Get overall stats for the period
-    c.execute('''SELECT COUNT(*) as total_sessions,
-                         SUM(actual_duration) as total_duration,
-                         AVG(actual_duration) as avg_session,
-                         MAX(actual_duration) as longest_session
-                  FROM study_history
-                  WHERE user_id = ? AND guild_id = ? AND start_time >= ?''',
-              (ctx.author.id, ctx.guild.id, start_date.isoformat()))
+    c.execute('''SELECT SUM(sessions) as total_sessions,
+                         SUM(total_duration) as total_duration,
+                         SUM(total_duration) / SUM(sessions) as avg_session,
+                         MAX(max_duration) as longest_session
+                  FROM study_daily_rollup
+                  WHERE user_id = ? AND guild_id = ? AND date >= ?''',
+              (ctx.author.id, ctx.guild.id, start_date.date().isoformat()))
     overall_stats = c.fetchone()
 
     conn.close()
@@ -7312,102 +6770,60 @@ async def study_trends(ctx, period: str = "month"):
 
 
 @study_cmd.command(name='export')
-async def study_export(ctx, data_type: str = "all"):
-    """Export your study data as JSON - Usage: %study export [all/sessions/answers/bookmarks]"""
-    import json
-
+async def study_export(ctx, data_type: str = "all", fmt: str = DEFAULT_EXPORT_FORMAT):
+    """Export your study data - Usage: %study export [all/sessions/answers/bookmarks] [ndjson/csv]"""
     valid_types = ['all', 'sessions', 'answers', 'bookmarks']
     if data_type not in valid_types:
         await ctx.send(f"❌ Invalid data type! Valid types: {', '.join(valid_types)}")
         return
+    if fmt not in EXPORT_FORMATS:
+        await ctx.send(f"❌ Invalid format! Valid formats: {', '.join(EXPORT_FORMATS)}")
+        return
 
-    conn = get_db_connection()
-    c = conn.cursor()
+    owner = (ctx.author.id, ctx.guild.id)
+    sections = []
+    if data_type in ['all', 'sessions']:
+        sections.append(ExportSection('active_sessions', 'SELECT * FROM study_sessions WHERE user_id = ? AND guild_id = ?', owner))
+        sections.append(ExportSection('session_history', 'SELECT * FROM study_history WHERE user_id = ? AND guild_id = ? ORDER BY end_time DESC', owner))
+    if data_type in ['all', 'answers']:
+        sections.append(ExportSection('answers', 'SELECT * FROM study_answers WHERE user_id = ? AND guild_id = ? ORDER BY timestamp DESC', owner))
+    if data_type in ['all', 'bookmarks']:
+        sections.append(ExportSection('bookmarks', 'SELECT * FROM study_bookmarks WHERE user_id = ? AND guild_id = ? ORDER BY created_at DESC', owner))
 
-    export_data = {
-        'user_id': ctx.author.id,
-        'guild_id': ctx.guild.id,
-        'export_date': datetime.datetime.now().isoformat(),
-        'data_type': data_type
-    }
+    basename = f"study_data_{ctx.author.id}_{data_type}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    header = {'user_id': ctx.author.id, 'guild_id': ctx.guild.id, 'data_type': data_type}
 
     try:
-        if data_type in ['all', 'sessions']:
-            # Export study sessions
-            c.execute('''SELECT * FROM study_sessions WHERE user_id = ? AND guild_id = ?''',
-                      (ctx.author.id, ctx.guild.id))
-            active_sessions = [dict(row) for row in c.fetchall()]
-
-            c.execute('''SELECT * FROM study_history WHERE user_id = ? AND guild_id = ? ORDER BY end_time DESC''',
-                      (ctx.author.id, ctx.guild.id))
-            session_history = [dict(row) for row in c.fetchall()]
-
-            export_data['active_sessions'] = active_sessions
-            export_data['session_history'] = session_history
-
-        if data_type in ['all', 'answers']:
-            # Export study answers
-            c.execute('''SELECT * FROM study_answers WHERE user_id = ? AND guild_id = ? ORDER BY timestamp DESC''',
-                      (ctx.author.id, ctx.guild.id))
-            answers = [dict(row) for row in c.fetchall()]
-            export_data['answers'] = answers
-
-        if data_type in ['all', 'bookmarks']:
-            # Export bookmarks
-            c.execute('''SELECT * FROM study_bookmarks WHERE user_id = ? AND guild_id = ? ORDER BY created_at DESC''',
-                      (ctx.author.id, ctx.guild.id))
-            bookmarks = [dict(row) for row in c.fetchall()]
-            export_data['bookmarks'] = bookmarks
-
-        # Add summary statistics
-        if data_type == 'all':
-            # Calculate summary stats
-            total_sessions = len(session_history) if 'session_history' in export_data else 0
-            total_duration = sum(s.get('actual_duration', 0) for s in session_history) if 'session_history' in export_data else 0
-            total_answers = len(answers) if 'answers' in export_data else 0
-            correct_answers = sum(1 for a in answers if a.get('is_correct', 0) == 1) if 'answers' in export_data else 0
-            accuracy = (correct_answers / total_answers * 100) if total_answers > 0 else 0
-
-            export_data['summary'] = {
-                'total_sessions': total_sessions,
-                'total_study_time_seconds': total_duration,
-                'total_study_time_formatted': f"{total_duration//3600}h {(total_duration%3600)//60}m",
-                'total_answers': total_answers,
-                'correct_answers': correct_answers,
-                'accuracy_percentage': round(accuracy, 2),
-                'total_bookmarks': len(bookmarks) if 'bookmarks' in export_data else 0
-            }
-
-        conn.close()
-
-        # Convert to JSON
-        json_data = json.dumps(export_data, indent=2, default=str)
-
-        # Create file
-        filename = f"study_data_{ctx.author.id}_{data_type}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-
-        # Send as file attachment
-        file = discord.File(io.BytesIO(json_data.encode('utf-8')), filename=filename)
+        result = await asyncio.to_thread(export_rows, basename, header, sections, fmt, ctx.guild.filesize_limit)
 
         embed = discord.Embed(
             title="📤 Study Data Export Complete",
-            description=f"Your {data_type} study data has been exported as JSON.",
+            description=f"Your {data_type} study data has been exported as compressed {fmt.upper()}.",
             color=discord.Color.green()
         )
 
-        embed.add_field(name="File Name", value=f"`{filename}`", inline=False)
+        embed.add_field(name="File Name", value="\n".join(f"`{part.filename}`" for part in result.parts), inline=False)
         embed.add_field(name="Data Types Included", value=data_type.title(), inline=True)
 
-        if data_type == 'all' and 'summary' in export_data:
-            summary = export_data['summary']
-            embed.add_field(name="Summary", value=f"Sessions: {summary['total_sessions']}\nTime: {summary['total_study_time_formatted']}\nAccuracy: {summary['accuracy_percentage']}%", inline=True)
+        if data_type == 'all':
+            # Summary statistics come from aggregates rather than the exported rows
+            conn = get_db_connection()
+            c = conn.cursor()
+            c.execute('''SELECT COUNT(*), COALESCE(SUM(actual_duration), 0) FROM study_history
+                         WHERE user_id = ? AND guild_id = ?''', owner)
+            total_sessions, total_duration = c.fetchone()
+            c.execute('''SELECT COUNT(*), COALESCE(SUM(is_correct), 0) FROM study_answers
+                         WHERE user_id = ? AND guild_id = ?''', owner)
+            total_answers, correct_answers = c.fetchone()
+            conn.close()
+            accuracy = (correct_answers / total_answers * 100) if total_answers > 0 else 0
+            embed.add_field(name="Summary", value=f"Sessions: {total_sessions}\nTime: {total_duration//3600}h {(total_duration%3600)//60}m\nAccuracy: {round(accuracy, 2)}%", inline=True)
 
         embed.set_footer(text="Keep this file safe - it contains your study data")
 
-        await ctx.send(embed=embed, file=file)
+        await send_export(ctx, embed, result)
 
     except Exception as e:
-        conn.close()
         await ctx.send(f"❌ Error exporting data: {str(e)}")
 
 
@@ -7508,99 +6924,71 @@ async def study_test_summary(ctx, session_id: str = None):
     await ctx.send(embed=embed)
 
 
+async def send_export(ctx, embed, result):
+    """Send export parts one attachment per message, the first alongside the embed"""
+    total = len(result.parts)
+    try:
+        for number, part in enumerate(result.parts, 1):
+            file = discord.File(part.file, filename=part.filename)
+            if number == 1:
+                await ctx.send(embed=embed, file=file)
+            else:
+                await ctx.send(f"📦 Part {number}/{total}", file=file)
+    finally:
+        # A failed send must not leave the later parts' temp files open
+        for part in result.parts:
+            part.file.close()
+
+
 @bot.command(name='export')
-async def export_data(ctx, data_type: str = "all"):
-    """Export your data - Usage: %export [study/user/all]"""
+async def export_data(ctx, data_type: str = "all", fmt: str = DEFAULT_EXPORT_FORMAT):
+    """Export your data - Usage: %export [study/user/all] [ndjson/csv]"""
     if data_type not in ['study', 'user', 'all']:
         await ctx.send("❌ Invalid data type! Use: study, user, or all")
         return
+    if fmt not in EXPORT_FORMATS:
+        await ctx.send(f"❌ Invalid format! Use: {', '.join(EXPORT_FORMATS)}")
+        return
 
-    conn = get_db_connection()
-    c = conn.cursor()
-
-    export_data = {
-        'export_date': datetime.datetime.now().isoformat(),
-        'user_id': ctx.author.id,
-        'guild_id': ctx.guild.id,
-        'username': ctx.author.name,
-        'guild_name': ctx.guild.name
-    }
+    owner = (ctx.author.id, ctx.guild.id)
+    sections = []
 
     if data_type in ['user', 'all']:
-        # Export user data
-        c.execute('''SELECT * FROM users WHERE user_id = ? AND guild_id = ?''',
-                  (ctx.author.id, ctx.guild.id))
-        user_data = c.fetchone()
-
-        if user_data:
-            user_dict = dict(user_data)
-            # Remove sensitive data
-            user_dict.pop('user_id', None)
-            user_dict.pop('guild_id', None)
-            export_data['user_stats'] = user_dict
+        # Export user data, without the ids
+        sections.append(ExportSection('user_stats', 'SELECT * FROM users WHERE user_id = ? AND guild_id = ?',
+                                      owner, drop=('user_id', 'guild_id')))
 
         # Export daily stats (last 30 days)
         thirty_days_ago = (datetime.datetime.now() - datetime.timedelta(days=30)).isoformat()
-        c.execute('''SELECT * FROM daily_stats
-                      WHERE user_id = ? AND guild_id = ? AND date >= ?
-                      ORDER BY date''',
-                  (ctx.author.id, ctx.guild.id, thirty_days_ago))
-        daily_stats = c.fetchall()
-        export_data['daily_stats'] = [dict(row) for row in daily_stats]
+        sections.append(ExportSection('daily_stats', '''SELECT * FROM daily_stats
+                                      WHERE user_id = ? AND guild_id = ? AND date >= ?
+                                      ORDER BY date''', owner + (thirty_days_ago,)))
 
         # Export weekly stats (last 12 weeks)
         twelve_weeks_ago = (datetime.datetime.now() - datetime.timedelta(weeks=12)).isoformat()
-        c.execute('''SELECT * FROM weekly_stats
-                      WHERE user_id = ? AND guild_id = ? AND week_start >= ?
-                      ORDER BY week_start''',
-                  (ctx.author.id, ctx.guild.id, twelve_weeks_ago))
-        weekly_stats = c.fetchall()
-        export_data['weekly_stats'] = [dict(row) for row in weekly_stats]
+        sections.append(ExportSection('weekly_stats', '''SELECT * FROM weekly_stats
+                                      WHERE user_id = ? AND guild_id = ? AND week_start >= ?
+                                      ORDER BY week_start''', owner + (twelve_weeks_ago,)))
 
     if data_type in ['study', 'all']:
-        # Export study sessions
-        c.execute('''SELECT * FROM study_sessions WHERE user_id = ? AND guild_id = ?''',
-                  (ctx.author.id, ctx.guild.id))
-        active_sessions = c.fetchall()
-        export_data['active_study_sessions'] = [dict(row) for row in active_sessions]
-
-        # Export study history
-        c.execute('''SELECT * FROM study_history WHERE user_id = ? AND guild_id = ?
-                      ORDER BY start_time''',
-                  (ctx.author.id, ctx.guild.id))
-        study_history = c.fetchall()
-        export_data['study_history'] = [dict(row) for row in study_history]
-
-        # Export study answers
-        c.execute('''SELECT * FROM study_answers WHERE user_id = ? AND guild_id = ?
-                      ORDER BY timestamp''',
-                  (ctx.author.id, ctx.guild.id))
-        study_answers = c.fetchall()
-        export_data['study_answers'] = [dict(row) for row in study_answers]
-
-        # Export study bookmarks
-        c.execute('''SELECT * FROM study_bookmarks WHERE user_id = ? AND guild_id = ?
-                      ORDER BY created_at''',
-                  (ctx.author.id, ctx.guild.id))
-        bookmarks = c.fetchall()
-        export_data['study_bookmarks'] = [dict(row) for row in bookmarks]
-
-    conn.close()
-
-    # Create JSON file
-    import json
-    import io
-
-    json_data = json.dumps(export_data, indent=2, default=str)
-    json_file = io.BytesIO(json_data.encode('utf-8'))
-    json_file.seek(0)
-
-    # Create filename
+        sections.append(ExportSection('active_study_sessions', 'SELECT * FROM study_sessions WHERE user_id = ? AND guild_id = ?', owner))
+        sections.append(ExportSection('study_history', '''SELECT * FROM study_history WHERE user_id = ? AND guild_id = ?
+                                      ORDER BY start_time''', owner))
+        sections.append(ExportSection('study_answers', '''SELECT * FROM study_answers WHERE user_id = ? AND guild_id = ?
+                                      ORDER BY timestamp''', owner))
+        sections.append(ExportSection('study_bookmarks', '''SELECT * FROM study_bookmarks WHERE user_id = ? AND guild_id = ?
+                                      ORDER BY created_at''', owner))
+
+    # Rows stream from the database into compressed parts off the event loop
     timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f"questuza_data_{data_type}_{timestamp}.json"
-
-    # Send file
-    discord_file = discord.File(json_file, filename=filename)
+    header = {'user_id': ctx.author.id, 'guild_id': ctx.guild.id,
+              'username': ctx.author.name, 'guild_name': ctx.guild.name}
+    try:
+        result = await asyncio.to_thread(export_rows, f"questuza_data_{data_type}_{timestamp}",
+                                         header, sections, fmt, ctx.guild.filesize_limit)
+    except Exception as e:
+        await ctx.send(f"❌ Error exporting data: {str(e)}")
+        return
 
     embed = discord.Embed(
         title="📤 Data Export Complete",
@@ -7609,39 +6997,48 @@ async def export_data(ctx, data_type: str = "all"):
     )
 
     # Add summary
-    if 'user_stats' in export_data:
-        user_stats = export_data['user_stats']
-        embed.add_field(
-            name="📊 User Stats Summary",
-            value=f"Level: {user_stats.get('level', 0)}\n"
-                  f"XP: {user_stats.get('xp', 0):,}\n"
-                  f"Messages: {user_stats.get('messages_sent', 0):,}\n"
-                  f"VC Time: {user_stats.get('vc_seconds', 0)//3600}h",
-            inline=True
-        )
+    conn = get_db_connection()
+    c = conn.cursor()
+    if data_type in ['user', 'all']:
+        c.execute('''SELECT level, xp, messages_sent, vc_seconds FROM users
+                     WHERE user_id = ? AND guild_id = ?''', owner)
+        user_stats = c.fetchone()
+        if user_stats:
+            embed.add_field(
+                name="📊 User Stats Summary",
+                value=f"Level: {user_stats['level'] or 0}\n"
+                      f"XP: {user_stats['xp'] or 0:,}\n"
+                      f"Messages: {user_stats['messages_sent'] or 0:,}\n"
+                      f"VC Time: {(user_stats['vc_seconds'] or 0)//3600}h",
+                inline=True
+            )
 
-    if 'study_history' in export_data:
-        study_sessions = len(export_data['study_history'])
-        total_study_time = sum(session.get('actual_duration', 0) for session in export_data['study_history'])
+    if data_type in ['study', 'all']:
+        c.execute('''SELECT COUNT(*), COALESCE(SUM(actual_duration), 0),
+                            COALESCE(SUM(study_type = 'MCQ Test'), 0)
+                     FROM study_history WHERE user_id = ? AND guild_id = ?''', owner)
+        study_sessions, total_study_time, tests = c.fetchone()
         embed.add_field(
             name="📚 Study Stats Summary",
             value=f"Sessions: {study_sessions}\n"
                   f"Total Time: {total_study_time//3600}h {total_study_time%3600//60}m\n"
-                  f"Tests: {len([s for s in export_data['study_history'] if s.get('study_type') == 'MCQ Test'])}",
+                  f"Tests: {tests}",
             inline=True
         )
+    conn.close()
 
+    parts = len(result.parts)
     embed.add_field(
         name="📁 File Contents",
-        value=f"• {len(export_data)} main sections\n"
-              f"• JSON format for easy analysis\n"
-              f"• Includes all your {data_type} data",
+        value=f"• {len(result.row_counts)} main sections, {sum(result.row_counts.values()):,} rows\n"
+              f"• {'Gzipped NDJSON, one record per line' if fmt == 'ndjson' else 'Zipped CSV, one file per section'}\n"
+              f"• {parts} file{'s' if parts != 1 else ''}, split to fit Discord's upload limit",
         inline=False
     )
 
     embed.set_footer(text="Keep this file safe - it contains your personal data")
 
-    await ctx.send(embed=embed, file=discord_file)
+    await send_export(ctx, embed, result)
 
 
 # Fuzzy command matching helper
@@ -7788,6 +7185,7 @@ async def on_message(message):
             # Complete setup and start session
             session_id = f"{message.author.id}_{int(datetime.datetime.now().timestamp())}"
 
+            started_at = datetime.datetime.now()
             conn = get_db_connection()
             c = conn.cursor()
             c.execute('''INSERT INTO study_sessions
@@ -7797,10 +7195,12 @@ async def on_message(message):
                         (message.author.id, message.guild.id, session_id,
                          data.get('study_type'), data.get('subject'), data.get('mood'),
                          data.get('intended_duration'),
-                         datetime.datetime.now().isoformat(),
-                         datetime.datetime.now().isoformat()))
+                         started_at.isoformat(),
+                         started_at.isoformat()))
             conn.commit()
             conn.close()
+            schedule_study_session(message.author.id, message.guild.id, session_id,
+                                   data.get('study_type'), started_at, data.get('intended_duration'))
 
             # Clear setup state
             del study_setup_states[message.author.id]
@@ -7977,13 +7377,15 @@ async def on_message(message):
     is_reply = 1 if message.reference else 0
     # Use unique_words for quest progress reporting, but cap for XP was applied above
     # Update study session activity if user has active session
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('''UPDATE study_sessions SET last_activity = ?
-                 WHERE user_id = ? AND guild_id = ?''',
-              (datetime.datetime.now().isoformat(), message.author.id, message.guild.id))
-    conn.commit()
-    conn.close()
+    activity_time = datetime.datetime.now()
+    if study_sessions_scheduler.touch(message.author.id, message.guild.id, activity_time):
+        conn = get_db_connection()
+        c = conn.cursor()
+        c.execute('''UPDATE study_sessions SET last_activity = ?
+                     WHERE user_id = ? AND guild_id = ?''',
+                  (activity_time.isoformat(), message.author.id, message.guild.id))
+        conn.commit()
+        conn.close()
 
     update_daily_stats(message.author.id, message.guild.id,
                        messages=1, words=(len(set(re.findall(r'\b[a-zA-Z]{2,}\b', re.sub(r'http\S+', '', message.content or '').lower()))) if message.content else 0), replies=is_reply)
@@ -8101,8 +7503,16 @@ async def on_command_error(ctx, error):
         await ctx.send("❌ An error occurred while executing the command.")
 
 
-# Run the bot
-if __name__ == "__main__":
+def main():
+    """Start the health server, prepare the database and run the bot.
+
+    Kept out of module level because the PDF and card worker pools use spawn,
+    which re-imports this script in every worker.
+    """
+    # Start Flask in background — only once!
+    Thread(target=run_flask, daemon=True).start()
+    init_database()
+
     # Try multiple token environment variable names for compatibility
     token = os.getenv('DISCORD_TOKEN') or os.getenv('BOT_TOKEN') or os.getenv('TOKEN')
 
@@ -8123,3 +7533,8 @@ if __name__ == "__main__":
         exit(1)
     except Exception as e:
         print(f"❌ Bot failed to start: {e}")
+
+
+# Run the bot
+if __name__ == "__main__":
+    main()
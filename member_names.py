@@ -0,0 +1,100 @@
+"""
+Member Name Resolution for Questuza Discord Bot
+Resolves user IDs to display names for leaderboards with a TTL cache
+"""
+
+import asyncio
+import time
+import logging
+from typing import Dict, Iterable, NamedTuple, Tuple
+
+import discord
+
+NAME_CACHE_TTL = 600  # seconds
+MAX_CONCURRENT_FETCHES = 5
+QUERY_MEMBERS_LIMIT = 100  # Discord caps query_members at 100 user IDs
+
+
+class ResolvedName(NamedTuple):
+    user_id: int
+    display_name: str
+    is_member: bool
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.user_id}>"
+
+
+class NameResolver:
+    """Display names keyed by (guild_id, user_id), resolving misses in bulk"""
+
+    def __init__(self, bot: discord.Client, ttl: int = NAME_CACHE_TTL,
+                 max_concurrency: int = MAX_CONCURRENT_FETCHES):
+        self.bot = bot
+        self.ttl = ttl
+        self.max_concurrency = max_concurrency
+        self._cache: Dict[Tuple[int, int], Tuple[ResolvedName, float]] = {}
+
+    def _store(self, guild_id: int, resolved: ResolvedName):
+        self._cache[(guild_id, resolved.user_id)] = (resolved, time.monotonic() + self.ttl)
+
+    def invalidate(self, guild_id: int, user_id: int):
+        self._cache.pop((guild_id, user_id), None)
+
+    async def resolve(self, guild: discord.Guild, user_ids: Iterable[int],
+                      fetch_departed: bool = True) -> Dict[int, ResolvedName]:
+        """Resolve every user ID, costing at most one round trip per batch of misses"""
+        now = time.monotonic()
+        results: Dict[int, ResolvedName] = {}
+        misses = []
+
+        for user_id in dict.fromkeys(user_ids):
+            # The gateway member cache is authoritative and free, so it is checked first
+            member = guild.get_member(user_id)
+            if member:
+                results[user_id] = ResolvedName(user_id, member.display_name, True)
+                continue
+            cached = self._cache.get((guild.id, user_id))
+            if cached and cached[1] > now:
+                results[user_id] = cached[0]
+            else:
+                misses.append(user_id)
+
+        # Members missing from an unchunked cache come back over the gateway in one request
+        if misses and not guild.chunked:
+            try:
+                for i in range(0, len(misses), QUERY_MEMBERS_LIMIT):
+                    found = await guild.query_members(user_ids=misses[i:i + QUERY_MEMBERS_LIMIT],
+                                                      limit=QUERY_MEMBERS_LIMIT)
+                    for member in found:
+                        results[member.id] = ResolvedName(member.id, member.display_name, True)
+                        self._store(guild.id, results[member.id])
+                misses = [user_id for user_id in misses if user_id not in results]
+            except (asyncio.TimeoutError, discord.ClientException) as e:
+                logging.warning(f"query_members failed for guild {guild.id}: {e}")
+
+        if misses and not fetch_departed:
+            for user_id in misses:
+                results[user_id] = ResolvedName(user_id, f"User {user_id}", False)
+            return results
+
+        # Whoever is left has departed; fetch their names concurrently
+        if misses:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            async def fetch(user_id: int) -> ResolvedName:
+                user = self.bot.get_user(user_id)
+                if user is None:
+                    async with semaphore:
+                        try:
+                            user = await self.bot.fetch_user(user_id)
+                        except discord.HTTPException:
+                            user = None
+                name = user.display_name if user else f"User {user_id}"
+                return ResolvedName(user_id, name, False)
+
+            for resolved in await asyncio.gather(*(fetch(user_id) for user_id in misses)):
+                results[resolved.user_id] = resolved
+                self._store(guild.id, resolved)
+
+        return results
@@ -0,0 +1,43 @@
+"""
+Pagination helpers for Questuza Discord Bot
+Keyset (cursor) pagination so deep pages cost the same as the first one
+"""
+
+import sqlite3
+from typing import List, Optional, Sequence, Tuple
+
+
+def keyset_page(conn: sqlite3.Connection, query: str, where: str, params: Sequence,
+                order_columns: Sequence[str], cursor: Optional[Tuple] = None,
+                limit: int = 10, before: bool = False,
+                descending: bool = True) -> List[sqlite3.Row]:
+    """Fetch one page of `query` ordered by `order_columns`.
+
+    `cursor` holds the order column values of the boundary row: the last row of
+    the current page when moving forward, or the first row when `before` is set.
+    Rows are always returned in display order.
+    """
+    columns = ", ".join(order_columns)
+    # Walking backwards flips both the comparison and the scan direction
+    reverse = descending != before
+    direction = "DESC" if reverse else "ASC"
+
+    conditions = where
+    args = list(params)
+    if cursor is not None:
+        placeholders = ", ".join("?" * len(order_columns))
+        comparison = "<" if reverse else ">"
+        conditions = f"({where}) AND ({columns}) {comparison} ({placeholders})"
+        args.extend(cursor)
+
+    order = ", ".join(f"{column} {direction}" for column in order_columns)
+    rows = conn.execute(f"{query} WHERE {conditions} ORDER BY {order} LIMIT ?",
+                        args + [limit]).fetchall()
+    if before:
+        rows.reverse()
+    return rows
+
+
+def cursor_of(row, order_columns: Sequence[str]) -> Tuple:
+    """Extract the cursor values of a row returned by keyset_page"""
+    return tuple(row[column] for column in order_columns)
@@ -0,0 +1,236 @@
+"""
+PDF Cache for Questuza Discord Bot
+Content-addressed disk cache for PDFs, their page text and rendered pages
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+CACHE_DIR = 'pdf_cache'
+URL_REVALIDATE_SECONDS = 3600  # trust a cached URL this long before asking the host again
+DOCUMENT_BUDGET_BYTES = 500 * 1024 * 1024
+PAGE_BUDGET_BYTES = 200 * 1024 * 1024
+
+
+class DiskLRU:
+    """Byte-budgeted LRU over files on disk; evicting deletes the file.
+
+    Pinned files are skipped by eviction until every pin is released.
+    """
+
+    def __init__(self, budget: int, on_evict: Optional[Callable[[str], None]] = None):
+        self.budget = budget
+        self.on_evict = on_evict  # cleans up files derived from an evicted one
+        self.total = 0
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._pins: Dict[str, int] = {}
+
+    def add(self, path: str, size: int):
+        self.total += size - self._files.pop(path, 0)
+        self._files[path] = size
+        self._evict()
+
+    def touch(self, path: str) -> bool:
+        """Mark a file as used; False if the cache no longer holds it"""
+        if path not in self._files:
+            return False
+        if not os.path.exists(path):
+            self.total -= self._files.pop(path)
+            return False
+        self._files.move_to_end(path)
+        return True
+
+    @contextmanager
+    def pinned(self, path: str):
+        """Keep `path` on disk for the duration of the block"""
+        self._pins[path] = self._pins.get(path, 0) + 1
+        try:
+            yield
+        finally:
+            self._pins[path] -= 1
+            if not self._pins[path]:
+                # Anything held over budget goes on the next add
+                del self._pins[path]
+
+    def _evict(self):
+        # The newest file always stays, even when it alone is over budget
+        for path in list(self._files)[:-1]:
+            if self.total <= self.budget:
+                break
+            if path in self._pins:
+                continue
+            self.total -= self._files.pop(path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            if self.on_evict is not None:
+                self.on_evict(path)
+
+
+class PDFCache:
+    """Raw PDFs stored once per content hash, with lazily filled page text and PNGs.
+
+    Layout: <root>/<sha256>/source.pdf, text/<page>.txt, pages/<page>_<zoom>.png,
+    plus urls.json mapping each URL to its ETag, Last-Modified and content hash.
+    """
+
+    def __init__(self, root: str = CACHE_DIR, document_budget: int = DOCUMENT_BUDGET_BYTES,
+                 page_budget: int = PAGE_BUDGET_BYTES):
+        self.root = root
+        self.documents = DiskLRU(document_budget)
+        self.pages = DiskLRU(page_budget)
+        self._urls: Dict[str, dict] = {}
+        self._index_path = os.path.join(root, 'urls.json')
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Rebuild the URL index and LRU order from what is already on disk"""
+        try:
+            with open(self._index_path) as f:
+                self._urls = json.load(f)
+        except (OSError, ValueError):
+            self._urls = {}
+
+        found = []
+        for digest in os.listdir(self.root):
+            doc_dir = os.path.join(self.root, digest)
+            if not os.path.isdir(doc_dir):
+                continue
+            for dirpath, _, filenames in os.walk(doc_dir):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    stat = os.stat(path)
+                    found.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(found):
+            (self.pages if path.endswith('.png') else self.documents).add(path, size)
+
+    def _save_index(self):
+        tmp = self._index_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._urls, f)
+        os.replace(tmp, self._index_path)
+
+    def _write(self, path: str, data: bytes):
+        """Write atomically so readers never see a partial file"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def source_path(self, digest: str) -> str:
+        return os.path.join(self.root, digest, 'source.pdf')
+
+    def pinned_source(self, digest: str):
+        """Keep a source PDF on disk while a worker reads it"""
+        return self.documents.pinned(self.source_path(digest))
+
+    def text_path(self, digest: str, page_num: int) -> str:
+        return os.path.join(self.root, digest, 'text', f'{page_num}.txt')
+
+    def page_path(self, digest: str, page_num: int, zoom: float) -> str:
+        return os.path.join(self.root, digest, 'pages', f'{page_num}_{zoom:g}.png')
+
+    # URL index
+
+    def lookup(self, url: str) -> Optional[dict]:
+        """Cached entry for a URL whose source PDF is still on disk"""
+        entry = self._urls.get(url)
+        if entry and self.documents.touch(self.source_path(entry['hash'])):
+            return entry
+        return None
+
+    def is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry.get('checked_at', 0) < URL_REVALIDATE_SECONDS
+
+    def validators(self, url: str) -> Dict[str, str]:
+        """Conditional request headers for revalidating a cached URL"""
+        entry = self.lookup(url)
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def mark_checked(self, url: str):
+        """The host confirmed the cached copy is current (304)"""
+        self._urls[url]['checked_at'] = time.time()
+        self._save_index()
+
+    def write_source(self, data: bytes) -> str:
+        """Hash a downloaded PDF and write it unless that content is already on disk.
+
+        Only touches files, never the index, so it can run in a thread.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.source_path(digest)
+        if not os.path.exists(path):
+            self._write(path, data)
+        return digest
+
+    def store(self, url: str, digest: str, size: int, etag: Optional[str] = None,
+              last_modified: Optional[str] = None) -> str:
+        """Record a PDF saved by write_source; identical content shares one copy across URLs"""
+        path = self.source_path(digest)
+        if not self.documents.touch(path):
+            self.documents.add(path, size)
+        self._urls[url] = {
+            'hash': digest,
+            'etag': etag,
+            'last_modified': last_modified,
+            'checked_at': time.time(),
+        }
+        self._save_index()
+        return digest
+
+    # Page text
+
+    def page_count(self, digest: str) -> Optional[int]:
+        try:
+            with open(os.path.join(self.root, digest, 'meta.json')) as f:
+                return json.load(f)['page_count']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set_page_count(self, digest: str, page_count: int):
+        self._write(os.path.join(self.root, digest, 'meta.json'),
+                    json.dumps({'page_count': page_count}).encode())
+
+    def get_text(self, digest: str, page_num: int) -> Optional[str]:
+        path = self.text_path(digest, page_num)
+        if not self.documents.touch(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+
+    def put_text(self, digest: str, page_num: int, text: str):
+        data = text.encode('utf-8')
+        path = self.text_path(digest, page_num)
+        self._write(path, data)
+        self.documents.add(path, len(data))
+
+    # Rendered pages
+
+    def get_page(self, digest: str, page_num: int, zoom: float) -> Optional[bytes]:
+        path = self.page_path(digest, page_num, zoom)
+        if not self.pages.touch(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def put_page(self, digest: str, page_num: int, zoom: float, png: bytes):
+        path = self.page_path(digest, page_num, zoom)
+        self._write(path, png)
+        self.pages.add(path, len(png))
+
+    def stats(self) -> Tuple[int, int]:
+        """Bytes held for documents and for rendered pages"""
+        return self.documents.total, self.pages.total
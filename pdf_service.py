@@ -0,0 +1,218 @@
+"""
+PDF Service for Questuza Discord Bot
+Extracts text and renders pages in worker processes, backed by a content-addressed cache
+"""
+
+import asyncio
+import logging
+import multiprocessing
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from http_client import HTTPError, HTTPResponse, ResponseTooLarge, URLLocks, http_client
+from pdf_cache import PDFCache
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+PDF_WORKERS = 2
+MAX_PDF_BYTES = 25 * 1024 * 1024
+DOWNLOAD_TIMEOUT = 30
+DEFAULT_ZOOM = 2.0
+MAX_ZOOM = 4.0
+
+MISSING_PYMUPDF = "PDF support requires PyMuPDF. Install with: pip install PyMuPDF"
+
+_executor: Optional[ProcessPoolExecutor] = None
+_cache: Optional[PDFCache] = None
+_url_locks = URLLocks()
+
+
+class PDFError(Exception):
+    """A PDF could not be downloaded or read; the message is safe to show users"""
+
+
+# Worker side - these run in the process pool and read the cached source file
+
+def _page_texts(path: str, pages: Optional[List[int]]) -> Tuple[int, Dict[int, str]]:
+    """Page count plus the text of the requested pages (all pages when None)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        wanted = range(doc.page_count) if pages is None else [p for p in pages if p < doc.page_count]
+        return doc.page_count, {p: doc.load_page(p).get_text() for p in wanted}
+
+
+def _render_page(path: str, page_num: int, zoom: float) -> Tuple[Optional[bytes], Optional[str]]:
+    """PNG bytes of a single page, or an error message"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        if page_num < 0 or page_num >= doc.page_count:
+            return None, f"Page {page_num + 1} does not exist. PDF has {doc.page_count} pages."
+        # Only the requested page is loaded and rasterised
+        pix = doc.load_page(page_num).get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        return pix.tobytes("png"), None
+
+
+# Bot side
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn keeps workers free of the bot's event loop and gateway threads
+        _executor = ProcessPoolExecutor(max_workers=PDF_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def shutdown():
+    """Stop the worker processes"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _run(func, *args):
+    global _executor
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_executor(), func, *args)
+    except BrokenProcessPool:
+        # A worker crashed on a malformed file; start a fresh pool for the next request
+        logging.error("PDF worker pool broke, restarting it")
+        _executor = None
+        raise PDFError("The PDF could not be processed.")
+
+
+def _get_cache() -> PDFCache:
+    global _cache
+    if _cache is None:
+        _cache = PDFCache()
+    return _cache
+
+
+async def _download(url: str, headers: Dict[str, str]) -> HTTPResponse:
+    """Read a PDF into memory, refusing anything over MAX_PDF_BYTES"""
+    try:
+        return await http_client.get(url, max_bytes=MAX_PDF_BYTES, headers=headers,
+                                     timeout=DOWNLOAD_TIMEOUT)
+    except ResponseTooLarge:
+        raise PDFError(f"PDF is larger than {MAX_PDF_BYTES // (1024 * 1024)} MB.")
+
+
+async def fetch_pdf(url: str) -> str:
+    """Make sure the PDF at `url` is cached and return its content hash.
+
+    Recently checked URLs are served from disk; older ones are revalidated
+    with their ETag / Last-Modified so unchanged files are not downloaded again.
+    """
+    cache = _get_cache()
+    async with _url_locks.hold(url):
+        entry = cache.lookup(url)
+        if entry and cache.is_fresh(entry):
+            return entry['hash']
+        try:
+            # The cached copy must survive the download in case the host answers 304
+            with cache.pinned_source(entry['hash']) if entry else nullcontext():
+                response = await _download(url, cache.validators(url))
+        except HTTPError as e:
+            if entry:
+                # The host is unreachable but we still hold a copy
+                return entry['hash']
+            raise PDFError(f"Could not download PDF: {e}")
+        if response.status == 304 and entry:
+            cache.mark_checked(url)
+            return entry['hash']
+        # Hashing and writing up to MAX_PDF_BYTES would stall the event loop
+        digest = await asyncio.to_thread(cache.write_source, response.body)
+        return cache.store(url, digest, len(response.body), response.headers.get('ETag'),
+                           response.headers.get('Last-Modified'))
+
+
+async def extract_pdf_pages(url: str, pages: Optional[Iterable[int]] = None) -> List[str]:
+    """Text of the given pages (every page by default) of the PDF at `url`.
+
+    Page text is extracted on first use and cached per page, so later calls
+    only send pages that were never read to a worker.
+    """
+    if fitz is None:
+        raise PDFError(MISSING_PYMUPDF)
+    cache = _get_cache()
+    digest = await fetch_pdf(url)
+    page_count = cache.page_count(digest)
+
+    wanted = list(range(page_count)) if pages is None and page_count is not None else pages
+    texts = {}
+    missing = None
+    if wanted is not None:
+        wanted = [p for p in wanted if page_count is None or 0 <= p < page_count]
+        for page_num in wanted:
+            text = cache.get_text(digest, page_num)
+            if text is not None:
+                texts[page_num] = text
+        missing = [p for p in wanted if p not in texts]
+
+    if missing is None or missing:
+        try:
+            with cache.pinned_source(digest):
+                page_count, extracted = await _run(_page_texts, cache.source_path(digest), missing)
+        except PDFError:
+            raise
+        except Exception as e:
+            raise PDFError(f"Could not read PDF: {e}")
+        cache.set_page_count(digest, page_count)
+        for page_num, text in extracted.items():
+            cache.put_text(digest, page_num, text)
+        texts.update(extracted)
+        if wanted is None:
+            wanted = range(page_count)
+
+    return [texts[p] for p in wanted if p in texts]
+
+
+async def extract_pdf_text(url: str) -> Optional[str]:
+    """Extract text from a PDF URL, or None when that fails"""
+    try:
+        return "".join(await extract_pdf_pages(url))
+    except PDFError as e:
+        print(f"Error extracting PDF text: {e}")
+        return None
+
+
+async def extract_pdf_page_texts(url: str) -> Optional[List[str]]:
+    """Extract the text of each page of a PDF URL, or None when that fails"""
+    try:
+        return await extract_pdf_pages(url)
+    except PDFError as e:
+        print(f"Error extracting PDF text: {e}")
+        return None
+
+
+async def render_pdf_page(url: str, page_num: int = 0,
+                          zoom: float = DEFAULT_ZOOM) -> Tuple[Optional[bytes], Optional[str]]:
+    """Render a PDF page as PNG bytes; returns (png, None) or (None, error)"""
+    if fitz is None:
+        return None, MISSING_PYMUPDF
+    zoom = min(zoom, MAX_ZOOM)
+    try:
+        cache = _get_cache()
+        digest = await fetch_pdf(url)
+        png = cache.get_page(digest, page_num, zoom)
+        if png is not None:
+            return png, None
+        with cache.pinned_source(digest):
+            png, error = await _run(_render_page, cache.source_path(digest), page_num, zoom)
+        if png is not None:
+            cache.put_page(digest, page_num, zoom, png)
+        return png, error
+    except PDFError as e:
+        return None, str(e)
+    except Exception as e:
+        print(f"Error rendering PDF page: {e}")
+        return None, str(e)
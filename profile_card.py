@@ -0,0 +1,653 @@
+"""
+Profile Card Renderer for Questuza Discord Bot
+Draws profile cards in worker processes from plain, picklable inputs
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from PIL import Image, ImageDraw
+
+from card_assets import PALETTE_SUFFIX, CardAsset
+from card_fonts import (DB_DEFAULT_FONT_SIZE, card_font_sizes, find_font_path, get_font, preload,
+                        text_bbox, text_width)
+
+CARD_WORKERS = 2
+MAX_PENDING_CARDS = 8  # renders running or waiting before new requests are turned away
+DECODED_PIXEL_BUDGET = 16 * 1024 * 1024  # per worker; a full-card background is about 2M pixels
+PALETTE_COLORS = 6
+PALETTE_SAMPLE_SIZE = (64, 64)
+ACCENT_MIN_SHARE = 0.05  # an accent must cover at least this much of the image
+RENDERED_CARD_TTL = 10 * 60
+RENDERED_CARD_MAX = 256
+RENDERED_CARD_BUDGET_BYTES = 64 * 1024 * 1024
+RENDER_VERSION = 2  # bump when the card layout changes so cached cards are not reused
+
+# The user_data fields a card is drawn from; nothing else reaches the renderer or the fingerprint
+CARD_FIELDS = (
+    'level', 'xp', 'unique_words', 'lifetime_words', 'messages_sent', 'vc_seconds',
+    'quests_completed', 'daily_quests_completed', 'weekly_quests_completed', 'xp_multiplier',
+    'about_me', 'background_url', 'custom_pfp_url', 'country_flag_url', 'profile_card_bg_color',
+    'custom_color', 'banner_brightness', 'card_padding', 'card_font_size',
+)
+
+
+class CardInputs(NamedTuple):
+    """Everything a card render reads besides image bytes, resolved on the bot side"""
+    user_data: Dict
+    display_name: str
+    username: str
+    rank: int
+    avatar_url: str
+    guild_icon_url: Optional[str]
+    next_requirements: Optional[Dict]
+
+
+class RendererBusy(Exception):
+    """Too many cards are already being rendered"""
+
+
+def card_fingerprint(card: CardInputs, assets: Dict[str, CardAsset]) -> str:
+    """Hash of everything that affects the rendered image, including each asset's content version"""
+    payload = {
+        'render_version': RENDER_VERSION,
+        'font': find_font_path(),
+        'card': card._asdict(),
+        'assets': {url: asset.version for url, asset in assets.items()},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class RenderedCardCache:
+    """Encoded cards by fingerprint, with LRU eviction under a count and byte budget plus a TTL"""
+
+    def __init__(self, ttl: float = RENDERED_CARD_TTL, max_entries: int = RENDERED_CARD_MAX,
+                 budget: int = RENDERED_CARD_BUDGET_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.budget = budget
+        self.total = 0
+        self._cards: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+
+    def get(self, fingerprint: str) -> Optional[bytes]:
+        entry = self._cards.get(fingerprint)
+        if entry is None:
+            return None
+        png, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl:
+            self._remove(fingerprint)
+            return None
+        self._cards.move_to_end(fingerprint)
+        return png
+
+    def put(self, fingerprint: str, png: bytes):
+        if fingerprint in self._cards:
+            self._remove(fingerprint)
+        self._cards[fingerprint] = (png, time.monotonic())
+        self.total += len(png)
+        while self._cards and (len(self._cards) > self.max_entries or self.total > self.budget):
+            self._remove(next(iter(self._cards)))
+
+    def _remove(self, fingerprint: str):
+        png, _ = self._cards.pop(fingerprint)
+        self.total -= len(png)
+
+
+class ImageLRU:
+    """Decoded, resized images keyed by (content version, size), bounded by total pixels"""
+
+    def __init__(self, pixel_budget: int = DECODED_PIXEL_BUDGET):
+        self.pixel_budget = pixel_budget
+        self.pixels = 0
+        self._images: "OrderedDict[Tuple[str, Tuple[int, int]], Image.Image]" = OrderedDict()
+
+    def get(self, key) -> Optional[Image.Image]:
+        img = self._images.get(key)
+        if img is not None:
+            self._images.move_to_end(key)
+        return img
+
+    def put(self, key, img: Image.Image):
+        old = self._images.pop(key, None)
+        if old is not None:
+            self.pixels -= old.width * old.height
+        self._images[key] = img
+        self.pixels += img.width * img.height
+        while self.pixels > self.pixel_budget and len(self._images) > 1:
+            _, evicted = self._images.popitem(last=False)
+            self.pixels -= evicted.width * evicted.height
+
+
+# Lives in each render worker, so repeat renders skip decoding and resizing
+_decoded = ImageLRU()
+
+
+def load_image(asset: CardAsset, size: Tuple[int, int]) -> Optional[Image.Image]:
+    """A cached image decoded to RGB at `size` (first frame for GIFs); treat it as read-only"""
+    key = (asset.version, tuple(size))
+    img = _decoded.get(key)
+    if img is None:
+        try:
+            with Image.open(asset.path) as source:
+                # Handle GIFs - extract first frame
+                if getattr(source, 'is_animated', False):
+                    source.seek(0)
+                img = source.convert('RGB').resize(size, Image.Resampling.LANCZOS)
+        except Exception:
+            return None
+        _decoded.put(key, img)
+    return img
+
+
+def extract_palette(img: Image.Image) -> Tuple[Tuple[int, int, int], Tuple[int, int, int]]:
+    """(dominant, accent) colours of an image.
+
+    The image is shrunk to a thumbnail and quantized to a small palette, so noise
+    and gradients fold into a few representative colours. The accent is the most
+    saturated of the remaining colours that still covers a meaningful share.
+    """
+    sample = img.convert('RGB').resize(PALETTE_SAMPLE_SIZE, Image.Resampling.BOX)
+    quantized = sample.quantize(colors=PALETTE_COLORS, method=Image.Quantize.MEDIANCUT)
+    palette = quantized.getpalette()
+    counts = sorted(quantized.getcolors(), reverse=True)  # [(pixels, palette index)]
+    colors = [(count, tuple(palette[index * 3:index * 3 + 3])) for count, index in counts]
+
+    dominant = colors[0][1]
+    total = sum(count for count, _ in colors)
+    accents = [color for count, color in colors[1:] if count >= total * ACCENT_MIN_SHARE]
+    accent = max(accents, key=lambda c: max(c) - min(c), default=dominant)
+    return dominant, accent
+
+
+def background_palette(asset: CardAsset, img: Image.Image) -> Tuple[Tuple[int, int, int], Tuple[int, int, int]]:
+    """Palette of a background, stored next to the cached image so it is extracted once"""
+    sidecar = asset.path + PALETTE_SUFFIX
+    try:
+        with open(sidecar) as f:
+            data = json.load(f)
+        return tuple(data['dominant']), tuple(data['accent'])
+    except (OSError, ValueError, KeyError):
+        pass
+    dominant, accent = extract_palette(img)
+    try:
+        tmp = f"{sidecar}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'dominant': dominant, 'accent': accent}, f)
+        os.replace(tmp, sidecar)
+    except OSError:
+        pass
+    return dominant, accent
+
+
+def render_profile_card(card: CardInputs, assets: Dict[str, CardAsset] = None) -> bytes:
+    """Generate a profile card image based on the design specifications"""
+    user_data = card.user_data
+    
+    # Image dimensions: Portrait orientation (8x11 inches at 150 DPI)
+    DPI = 150
+    CARD_WIDTH = int(8 * DPI)   # 1200 pixels (portrait width)
+    CARD_HEIGHT = int(11 * DPI) # 1650 pixels (portrait height)
+    
+    # Padding multiplier from user settings (default 3x = 1.2 inches base)
+    padding_multiplier = user_data.get('card_padding', 1.2) or 1.2
+    base_padding = 0.4  # Base padding in inches
+    
+    # Padding in inches, converted to pixels (3x default)
+    PADDING_LEFT = int(base_padding * padding_multiplier * DPI)
+    PADDING_RIGHT = int(base_padding * padding_multiplier * DPI)
+    PADDING_TOP = int(base_padding * padding_multiplier * DPI)
+    PADDING_BOTTOM = int(base_padding * padding_multiplier * DPI)
+    
+    # Content area
+    CONTENT_X = PADDING_LEFT
+    CONTENT_Y = PADDING_TOP
+    CONTENT_WIDTH = CARD_WIDTH - PADDING_LEFT - PADDING_RIGHT
+    CONTENT_HEIGHT = CARD_HEIGHT - PADDING_TOP - PADDING_BOTTOM
+    
+    # Default colors
+    DEFAULT_BG_COLOR = (128, 128, 128)  # Gray default
+    PROFILE_BOX_COLOR = (255, 0, 0)  # Red for profile picture
+    COUNTRY_BOX_COLOR = (118, 137, 131)  # #758983 default for country
+    GUILD_BOX_COLOR = (118, 137, 131)  # #758983 default for guild
+    DEFAULT_PROGRESS_BAR_BG = (84, 107, 81)  # #546b51 dark green (default)
+    DEFAULT_PROGRESS_BAR_FILL = (118, 137, 131)  # Ash green (default)
+    MULTIPLIER_BOX_COLOR = (84, 107, 81)  # #546b51 dark blue/green
+    MESSAGE_ICON_COLOR = (255, 255, 255)  # White
+    
+    # Helper function to get a cached image at the size it is drawn (decoded images are reused across renders)
+    def download_image(url: str, size: tuple) -> Image.Image:
+        asset = (assets or {}).get(url)
+        return load_image(asset, size) if asset else None
+    
+    # Get background color (use profile_card_bg_color, fallback to custom_color, default to gray)
+    bg_color_hex = user_data.get('profile_card_bg_color') or user_data.get('custom_color', '#808080')
+    if bg_color_hex.startswith('#'):
+        bg_color_hex = bg_color_hex[1:]
+    
+    try:
+        bg_r = int(bg_color_hex[0:2], 16)
+        bg_g = int(bg_color_hex[2:4], 16)
+        bg_b = int(bg_color_hex[4:6], 16)
+    except:
+        bg_r, bg_g, bg_b = DEFAULT_BG_COLOR
+    
+    # Calculate brightness for text color decision
+    bg_brightness = (bg_r * 299 + bg_g * 587 + bg_b * 114) / 1000
+    
+    # No default darkening (0%)
+    bg_color = (bg_r, bg_g, bg_b)
+    
+    # Determine text colors based on background brightness
+    # If background is very bright (white), use black text, otherwise white
+    is_light_bg = bg_brightness > 200
+    TEXT_COLOR = (0, 0, 0) if is_light_bg else (255, 255, 255)
+    TEXT_GRAY = (100, 100, 100) if is_light_bg else (180, 180, 180)  # About me text
+    
+    # Progress bar colors (will be updated if banner is set)
+    progress_bar_bg = DEFAULT_PROGRESS_BAR_BG
+    progress_bar_fill = DEFAULT_PROGRESS_BAR_FILL
+    multiplier_box_color = MULTIPLIER_BOX_COLOR
+    
+    # Create base image
+    img = Image.new('RGB', (CARD_WIDTH, CARD_HEIGHT), bg_color)
+    draw = ImageDraw.Draw(img)
+    
+    # If background_url is set, try to overlay it (with user-defined darkening)
+    background_url = user_data.get('background_url')
+    banner_img = None
+    banner_brightness_value = user_data.get('banner_brightness', 0.0) or 0.0  # 0-100%
+    darken_factor = banner_brightness_value / 100.0  # Convert to 0.0-1.0
+    
+    if background_url:
+        try:
+            bg_img = download_image(background_url, (CARD_WIDTH, CARD_HEIGHT))
+            if bg_img:
+                banner_img = bg_img.copy()
+                # Calculate brightness from banner image
+                banner_brightness = sum(bg_img.convert('L').resize((10, 10)).getdata()) / 100
+                is_light_bg = banner_brightness > 200
+                TEXT_COLOR = (0, 0, 0) if is_light_bg else (255, 255, 255)
+                TEXT_GRAY = (100, 100, 100) if is_light_bg else (180, 180, 180)
+                
+                # Paste background image first
+                img.paste(bg_img, (0, 0))
+                # Apply user-defined darkening overlay (0-100%)
+                if darken_factor > 0:
+                    overlay = Image.new('RGB', (CARD_WIDTH, CARD_HEIGHT), (0, 0, 0))
+                    overlay_alpha = Image.new('L', (CARD_WIDTH, CARD_HEIGHT), int(255 * darken_factor))
+                    img = Image.composite(img, overlay, overlay_alpha)
+                draw = ImageDraw.Draw(img)
+                
+                # Banner palette (computed once per image) for the progress bar and multiplier box
+                dominant_color, accent_color = background_palette(assets[background_url], bg_img)
+                progress_bar_fill = dominant_color
+                # Darken the dominant color for the background
+                progress_bar_bg = tuple(max(0, int(c * 0.6)) for c in dominant_color)
+                multiplier_box_color = accent_color
+        except:
+            pass  # If background image fails, just use solid color
+    
+    # Fonts are discovered and loaded once per worker (see card_fonts)
+    # Font sizes: Canva size 12 = ~16px, size 8 = ~11px (scaled for 150 DPI)
+    main_font_size, about_font_size = card_font_sizes(user_data.get('card_font_size'))
+    title_font = large_font = medium_font = small_font = get_font(main_font_size)
+    about_font = get_font(about_font_size)
+    
+    # Draw profile picture box (red, large, rounded)
+    # Scale elements for new dimensions
+    scale_factor = CARD_WIDTH / 1000  # Scale from original 1000px width
+    pfp_size = int(140 * scale_factor)  # ~231px
+    pfp_x = CONTENT_X
+    pfp_y = CONTENT_Y
+    pfp_radius = int(20 * scale_factor)  # ~33px
+    
+    # Create rounded rectangle mask for profile picture
+    pfp_mask = Image.new('L', (pfp_size, pfp_size), 0)
+    pfp_mask_draw = ImageDraw.Draw(pfp_mask)
+    pfp_mask_draw.rounded_rectangle([(0, 0), (pfp_size, pfp_size)], radius=pfp_radius, fill=255)
+    
+    # Try to load profile picture (custom or default)
+    try:
+        custom_pfp_url = user_data.get('custom_pfp_url')
+        pfp_url = custom_pfp_url if custom_pfp_url else card.avatar_url
+        pfp_img = download_image(pfp_url, (pfp_size, pfp_size))
+        if pfp_img:
+            img.paste(pfp_img, (pfp_x, pfp_y), pfp_mask)
+        else:
+            draw.rounded_rectangle([(pfp_x, pfp_y), (pfp_x + pfp_size, pfp_y + pfp_size)], 
+                                 radius=pfp_radius, fill=PROFILE_BOX_COLOR)
+    except:
+        draw.rounded_rectangle([(pfp_x, pfp_y), (pfp_x + pfp_size, pfp_y + pfp_size)], 
+                             radius=pfp_radius, fill=PROFILE_BOX_COLOR)
+    
+    # Draw country flag box (green, small, rounded)
+    flag_size = int(60 * scale_factor)  # ~99px
+    flag_x = pfp_x + pfp_size + int(25 * scale_factor)
+    flag_y = pfp_y
+    flag_radius = int(12 * scale_factor)  # ~20px
+    
+    # Check for country flag (not in DB yet, use default)
+    country_flag_url = user_data.get('country_flag_url')
+    if country_flag_url:
+        flag_img = download_image(country_flag_url, (flag_size, flag_size))
+        if flag_img:
+            flag_mask = Image.new('L', (flag_size, flag_size), 0)
+            flag_mask_draw = ImageDraw.Draw(flag_mask)
+            flag_mask_draw.rounded_rectangle([(0, 0), (flag_size, flag_size)], radius=flag_radius, fill=255)
+            img.paste(flag_img, (flag_x, flag_y), flag_mask)
+        else:
+            draw.rounded_rectangle([(flag_x, flag_y), (flag_x + flag_size, flag_y + flag_size)], 
+                                 radius=flag_radius, fill=COUNTRY_BOX_COLOR)
+    else:
+        draw.rounded_rectangle([(flag_x, flag_y), (flag_x + flag_size, flag_y + flag_size)], 
+                             radius=flag_radius, fill=COUNTRY_BOX_COLOR)
+    
+    # Draw guild logo box (blue, small, rounded)
+    guild_size = int(60 * scale_factor)  # ~99px
+    guild_x = flag_x + flag_size + int(15 * scale_factor)
+    guild_y = pfp_y
+    guild_radius = int(12 * scale_factor)  # ~20px
+    
+    # Check for guild logo
+    guild_icon_url = card.guild_icon_url
+    if guild_icon_url:
+        guild_img = download_image(guild_icon_url, (guild_size, guild_size))
+        if guild_img:
+            guild_mask = Image.new('L', (guild_size, guild_size), 0)
+            guild_mask_draw = ImageDraw.Draw(guild_mask)
+            guild_mask_draw.rounded_rectangle([(0, 0), (guild_size, guild_size)], radius=guild_radius, fill=255)
+            img.paste(guild_img, (guild_x, guild_y), guild_mask)
+        else:
+            draw.rounded_rectangle([(guild_x, guild_y), (guild_x + guild_size, guild_y + guild_size)], 
+                                 radius=guild_radius, fill=GUILD_BOX_COLOR)
+    else:
+        draw.rounded_rectangle([(guild_x, guild_y), (guild_x + guild_size, guild_y + guild_size)], 
+                             radius=guild_radius, fill=GUILD_BOX_COLOR)
+    
+    # Draw level text (top left)
+    level = user_data.get('level', 0)
+    level_text = f"lvl {level}"
+    level_y = int(30 * scale_factor)
+    draw.text((CONTENT_X, level_y), level_text, fill=TEXT_COLOR, font=title_font)
+    
+    # Draw rank text (top right)
+    rank = card.rank or 0
+    rank_text = f"#{rank}" if rank > 0 else "#-"
+    rank_width = text_width(main_font_size, rank_text)
+    draw.text((CARD_WIDTH - rank_width - CONTENT_X, level_y), rank_text, fill=TEXT_COLOR, font=title_font)
+    
+    # Draw display name and username
+    display_name = card.display_name or "-"
+    username = card.username or "-"
+    
+    name_y = pfp_y + pfp_size + int(20 * scale_factor)
+    draw.text((pfp_x, name_y), display_name, fill=TEXT_COLOR, font=large_font)
+    draw.text((pfp_x, name_y + int(45 * scale_factor)), f"@{username}", fill=TEXT_GRAY, font=medium_font)
+    
+    # Calculate progress
+    next_req = card.next_requirements
+    
+    if next_req:
+        # Calculate progress percentage (average of all requirements)
+        words_progress = min(1.0, user_data.get('unique_words', 0) / max(1, next_req.get('words', 1)))
+        vc_progress = min(1.0, (user_data.get('vc_seconds', 0) / 60) / max(1, next_req.get('vc_minutes', 1)))
+        messages_progress = min(1.0, user_data.get('messages_sent', 0) / max(1, next_req.get('messages', 1)))
+        quests_progress = min(1.0, user_data.get('quests_completed', 0) / max(1, next_req.get('quests', 1)))
+        overall_progress = (words_progress + vc_progress + messages_progress + quests_progress) / 4.0
+    else:
+        overall_progress = 1.0
+    
+    # Draw progress bar
+    progress_y = name_y + int(100 * scale_factor)
+    progress_x = pfp_x
+    progress_width = int(700 * scale_factor)  # ~1155px
+    progress_height = int(35 * scale_factor)  # ~58px
+    progress_radius = int(10 * scale_factor)  # ~17px
+    
+    # Background bar (matches banner or default)
+    draw.rounded_rectangle([(progress_x, progress_y), (progress_x + progress_width, progress_y + progress_height)], 
+                         radius=progress_radius, fill=progress_bar_bg)
+    
+    # Filled bar (matches banner dominant color or default)
+    fill_width = int(progress_width * overall_progress)
+    if fill_width > 0:
+        draw.rounded_rectangle([(progress_x, progress_y), (progress_x + fill_width, progress_y + progress_height)], 
+                             radius=progress_radius, fill=progress_bar_fill)
+    
+    # Progress text (vertically centered)
+    progress_text_bbox = text_bbox(main_font_size, "Progress")
+    progress_text_height = progress_text_bbox[3] - progress_text_bbox[1]
+    progress_text_y = progress_y + (progress_height - progress_text_height) // 2
+    draw.text((progress_x + int(15 * scale_factor), progress_text_y), "Progress", fill=TEXT_COLOR, font=small_font)
+    
+    # XP multiplier box
+    multiplier = user_data.get('xp_multiplier', 1.0)
+    # Calculate quest multipliers
+    daily_quests = user_data.get('daily_quests_completed', 0)
+    weekly_quests = user_data.get('weekly_quests_completed', 0)
+    quest_multiplier = 1.0
+    if daily_quests > 0:
+        quest_multiplier += 0.1
+    if weekly_quests > 0:
+        quest_multiplier += 0.25
+    total_multiplier = multiplier * quest_multiplier
+    
+    multiplier_text = f"{total_multiplier:.1f}x"
+    multiplier_box_width = int(90 * scale_factor)
+    multiplier_box_height = progress_height
+    multiplier_x = progress_x + progress_width + int(25 * scale_factor)
+    multiplier_y = progress_y
+    
+    draw.rounded_rectangle([(multiplier_x, multiplier_y), (multiplier_x + multiplier_box_width, multiplier_y + multiplier_box_height)], 
+                         radius=progress_radius, fill=multiplier_box_color)
+    multiplier_text_width = text_width(main_font_size, multiplier_text)
+    multiplier_text_x = multiplier_x + (multiplier_box_width - multiplier_text_width) // 2
+    multiplier_text_y = multiplier_y + int(8 * scale_factor)
+    draw.text((multiplier_text_x, multiplier_text_y), multiplier_text, fill=TEXT_COLOR, font=small_font)
+    
+    # Draw stats section
+    stats_start_y = progress_y + progress_height + int(50 * scale_factor)
+    stats_x = pfp_x
+    stat_spacing = int(55 * scale_factor)
+    
+    stats_labels = ["XP", "words", "messages", "vc", "quests"]
+    
+    # Overall/lifetime stats (for middle column display)
+    overall_xp = user_data.get('xp', 0)
+    overall_words = user_data.get('lifetime_words', user_data.get('unique_words', 0))  # Use lifetime if available
+    overall_messages = user_data.get('messages_sent', 0)  # Current value (may be reset on level up)
+    overall_vc = user_data.get('vc_seconds', 0) // 60  # Current value (may be reset on level up)
+    overall_quests = user_data.get('quests_completed', 0)  # Current value (may be reset on level up)
+    
+    stats_values = [
+        f"{overall_xp:,}",
+        f"{overall_words:,}",
+        f"{overall_messages:,}",
+        f"{overall_vc:,}",
+        f"{overall_quests:,}"
+    ]
+    
+    # Current progress values (for right column - progress towards next level)
+    # Note: These represent progress since last level up
+    current_words = user_data.get('unique_words', 0)
+    current_messages = user_data.get('messages_sent', 0)
+    current_vc = user_data.get('vc_seconds', 0) // 60
+    current_quests = user_data.get('quests_completed', 0)
+    
+    # Requirements for next level
+    if next_req:
+        # Calculate XP requirement (based on level requirements)
+        xp_req = next_req.get('words', 0) * 10  # Approximate XP from words
+        req_words = next_req.get('words', 0)
+        req_messages = next_req.get('messages', 0)
+        req_vc = next_req.get('vc_minutes', 0)
+        req_quests = next_req.get('quests', 0)
+        
+        # Current progress towards requirements (capped at requirement)
+        # Note: These are the values since last level up (for progress tracking)
+        # For XP, we'll use a simple calculation based on words progress
+        progress_xp = min(overall_xp, xp_req) if xp_req > 0 else overall_xp
+        progress_words = min(current_words, req_words) if req_words > 0 else current_words
+        progress_messages = min(current_messages, req_messages) if req_messages > 0 else current_messages
+        progress_vc = min(current_vc, req_vc) if req_vc > 0 else current_vc
+        progress_quests = min(current_quests, req_quests) if req_quests > 0 else current_quests
+        
+        stats_requirements = [
+            (f"{progress_xp:,}", f"{xp_req:,}"),
+            (f"{progress_words:,}", f"{req_words:,}"),
+            (f"{progress_messages:,}", f"{req_messages:,}"),
+            (f"{progress_vc:,}", f"{req_vc:,}"),
+            (f"{progress_quests:,}", f"{req_quests:,}")
+        ]
+    else:
+        # Max level reached
+        stats_requirements = [("-", "-")] * 5
+    
+    for i, (label, value, (progress, req)) in enumerate(zip(stats_labels, stats_values, stats_requirements)):
+        y_pos = stats_start_y + (i * stat_spacing)
+        
+        # Label
+        draw.text((stats_x, y_pos), label, fill=TEXT_COLOR, font=small_font)
+        
+        # Value (overall stat)
+        value_x = stats_x + int(150 * scale_factor)
+        draw.text((value_x, y_pos), value, fill=TEXT_COLOR, font=small_font)
+        
+        # Separator and requirement (progress / requirement)
+        req_x = value_x + int(150 * scale_factor)
+        draw.text((req_x, y_pos), "]", fill=TEXT_COLOR, font=small_font)
+        req_text = f"{progress} / {req}"
+        draw.text((req_x + int(25 * scale_factor), y_pos), req_text, fill=TEXT_COLOR, font=small_font)
+    
+    # Draw "About me" section
+    about_y = stats_start_y + (len(stats_labels) * stat_spacing) + int(40 * scale_factor)
+    about_x = pfp_x
+    
+    # Message icon (white/black rounded box based on background)
+    icon_size = int(35 * scale_factor)
+    icon_radius = int(6 * scale_factor)
+    icon_color = (0, 0, 0) if is_light_bg else (255, 255, 255)
+    draw.rounded_rectangle([(about_x, about_y), (about_x + icon_size, about_y + icon_size)], 
+                         radius=icon_radius, fill=icon_color)
+    
+    # "Abouts me" title
+    about_title_x = about_x + icon_size + int(12 * scale_factor)
+    draw.text((about_title_x, about_y), "Abouts me", fill=TEXT_COLOR, font=medium_font)
+    
+    # About me text
+    about_text = user_data.get('about_me', '') or ''
+    if about_text:
+        # Wrap text if too long
+        max_width = CONTENT_WIDTH - int(40 * scale_factor)
+        words = about_text.split()
+        lines = []
+        current_line = []
+        current_width = 0
+        
+        for word in words:
+            word_width = text_width(about_font_size, word + " ")
+            if current_width + word_width > max_width and current_line:
+                lines.append(" ".join(current_line))
+                current_line = [word]
+                current_width = word_width
+            else:
+                current_line.append(word)
+                current_width += word_width
+        
+        if current_line:
+            lines.append(" ".join(current_line))
+        
+        about_text_y = about_y + int(40 * scale_factor)
+        line_height = int(28 * scale_factor)
+        for line in lines[:3]:  # Limit to 3 lines
+            draw.text((about_x, about_text_y), line, fill=TEXT_GRAY, font=about_font)
+            about_text_y += line_height
+    
+    # Convert to bytes
+    img_bytes = BytesIO()
+    img.save(img_bytes, format='PNG')
+    return img_bytes.getvalue()
+
+
+class CardRenderer:
+    """Process pool for card renders with a bounded number of pending jobs"""
+
+    def __init__(self, workers: int = CARD_WORKERS, max_pending: int = MAX_PENDING_CARDS):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        # card_font_size settings whose fonts each worker loads at startup
+        self.preload_font_sizes = [DB_DEFAULT_FONT_SIZE, None]
+        self.cards = RenderedCardCache()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn keeps workers free of the bot's event loop and gateway threads.
+            # Each worker re-imports the bot script, so its startup work (health
+            # server, database init and restore) has to stay inside main.main().
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=preload,
+                                                 initargs=(tuple(self.preload_font_sizes),))
+        return self._executor
+
+    def is_saturated(self) -> bool:
+        return self.pending >= self.max_pending
+
+    def is_queued(self) -> bool:
+        """Whether a new render would wait behind others instead of starting at once"""
+        return self.pending >= self.workers
+
+    async def render(self, card: CardInputs, assets: Dict[str, CardAsset]) -> bytes:
+        """PNG bytes of the card; raises RendererBusy instead of growing the queue.
+
+        An unchanged card is served from the rendered-card cache, and identical
+        requests that arrive while it is being drawn share one render.
+        """
+        fingerprint = card_fingerprint(card, assets)
+        png = self.cards.get(fingerprint)
+        if png is not None:
+            return png
+        if fingerprint in self._in_flight:
+            return await asyncio.shield(self._in_flight[fingerprint])
+        if self.is_saturated():
+            raise RendererBusy()
+
+        loop = asyncio.get_running_loop()
+        future = self._in_flight[fingerprint] = loop.create_future()
+        self.pending += 1
+        try:
+            png = await loop.run_in_executor(self._get_executor(), render_profile_card, card, assets)
+            self.cards.put(fingerprint, png)
+            future.set_result(png)
+            return png
+        except BaseException as e:
+            if isinstance(e, BrokenProcessPool):
+                # A worker died mid-render; start a fresh pool for the next request
+                logging.error("Card worker pool broke, restarting it")
+                self._executor = None
+            future.set_exception(e)
+            # Retrieve it so a render nobody else was waiting on does not log a warning
+            future.exception()
+            raise
+        finally:
+            self.pending -= 1
+            self._in_flight.pop(fingerprint, None)
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
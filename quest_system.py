@@ -9,6 +9,7 @@ import datetime
 import json
 from typing import Dict, List, Optional
 from enum import Enum
+from pagination import keyset_page
 
 
 class QuestType(Enum):
@@ -439,6 +440,10 @@ SPECIAL_QUESTS = [
 ]
 
 
+# Order used when paging custom quests
+CUSTOM_QUEST_ORDER = ("created_at", "id")
+
+
 def get_db_connection():
     """Get database connection with proper settings"""
     conn = sqlite3.connect('questuza.db', check_same_thread=False)
@@ -504,6 +509,8 @@ def init_quest_tables():
                  ON daily_channels(user_id, guild_id, date)''')
     c.execute('''CREATE INDEX IF NOT EXISTS idx_custom_quests_guild
                  ON custom_quests(guild_id, enabled)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_custom_quests_created
+                 ON custom_quests(guild_id, created_at, id)''')
 
     conn.commit()
     conn.close()
@@ -654,6 +661,39 @@ def update_weekly_stats(user_id: int, guild_id: int, messages: int = 0,
     conn.close()
 
 
+def add_vc_minutes(c: sqlite3.Cursor, credits: List[tuple]):
+    """Bulk-add VC minutes to daily and weekly stats on an open cursor
+
+    credits holds (user_id, guild_id, date, minutes) tuples; the caller commits.
+    """
+    if not credits:
+        return
+
+    c.executemany('''INSERT INTO daily_stats (user_id, guild_id, date, vc_minutes)
+                     VALUES (?, ?, ?, ?)
+                     ON CONFLICT(user_id, guild_id, date) DO UPDATE SET
+                     vc_minutes = vc_minutes + excluded.vc_minutes''',
+                  credits)
+
+    weekly = []
+    for user_id, guild_id, date, minutes in credits:
+        day = datetime.date.fromisoformat(date)
+        week_start = (day - datetime.timedelta(days=day.weekday())).isoformat()
+        weekly.append((user_id, guild_id, week_start, minutes,
+                       user_id, guild_id, week_start, week_start))
+
+    c.executemany('''INSERT INTO weekly_stats
+                     (user_id, guild_id, week_start, vc_minutes, active_days)
+                     VALUES (?, ?, ?, ?,
+                             (SELECT COUNT(DISTINCT date) FROM daily_stats
+                              WHERE user_id = ? AND guild_id = ?
+                              AND date >= ? AND date < date(?, '+7 days')))
+                     ON CONFLICT(user_id, guild_id, week_start) DO UPDATE SET
+                     vc_minutes = vc_minutes + excluded.vc_minutes,
+                     active_days = excluded.active_days''',
+                  weekly)
+
+
 def check_and_complete_quests(user_id: int, guild_id: int, user_data: Dict) -> List[Quest]:
     """Check all quests and return newly completed ones"""
     completed_quests = []
@@ -943,6 +983,32 @@ def get_custom_quests(guild_id: int) -> List[Dict]:
     return quests
 
 
+def count_custom_quests(guild_id: int) -> int:
+    """Count custom quests for a guild"""
+    conn = get_db_connection()
+    count = conn.execute('''SELECT COUNT(*) FROM custom_quests WHERE guild_id = ?''',
+                         (guild_id,)).fetchone()[0]
+    conn.close()
+    return count
+
+
+def get_custom_quests_page(guild_id: int, cursor: Optional[tuple] = None, limit: int = 5,
+                           before: bool = False, offset: int = 0) -> List[Dict]:
+    """Get one page of custom quests, newest first, paged by (created_at, id) cursor"""
+    conn = get_db_connection()
+    if cursor is None and offset:
+        rows = conn.execute('''SELECT * FROM custom_quests WHERE guild_id = ?
+                               ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?''',
+                            (guild_id, limit, offset)).fetchall()
+    else:
+        rows = keyset_page(conn, "SELECT * FROM custom_quests", "guild_id = ?", [guild_id],
+                           CUSTOM_QUEST_ORDER, cursor=cursor, limit=limit, before=before)
+    quests = [dict(row) for row in rows]
+    conn.close()
+
+    return quests
+
+
 def parse_requirements_string(requirements_str: str) -> Dict:
     """Parse requirements string like 'daily_messages:20,words:50' into dict"""
     requirements = {}
@@ -0,0 +1,133 @@
+"""
+Study Rollups for Questuza Discord Bot
+Per-user, per-day, per-type study totals and study streaks maintained as sessions finish
+"""
+
+import datetime
+import sqlite3
+from typing import Tuple
+
+UNSPECIFIED_TYPE = 'Unspecified'
+
+# One history row (plus the answers given during it) folded into its day.
+# The caller supplies the session_id and owns the transaction.
+_ADD_SESSION = f'''
+    INSERT INTO study_daily_rollup
+        (user_id, guild_id, date, study_type, sessions, total_duration, max_duration,
+         answers, correct_answers)
+    SELECT sh.user_id, sh.guild_id, DATE(sh.start_time), COALESCE(sh.study_type, '{UNSPECIFIED_TYPE}'),
+           1, COALESCE(sh.actual_duration, 0), COALESCE(sh.actual_duration, 0),
+           (SELECT COUNT(*) FROM study_answers sa WHERE sa.session_id = sh.session_id),
+           (SELECT COALESCE(SUM(sa.is_correct), 0) FROM study_answers sa WHERE sa.session_id = sh.session_id)
+    FROM study_history sh
+    WHERE sh.session_id = ?
+    ON CONFLICT(user_id, guild_id, date, study_type) DO UPDATE SET
+        sessions = sessions + excluded.sessions,
+        total_duration = total_duration + excluded.total_duration,
+        max_duration = MAX(max_duration, excluded.max_duration),
+        answers = answers + excluded.answers,
+        correct_answers = correct_answers + excluded.correct_answers
+'''
+
+# A new study day extends the streak when it is the day after the last one,
+# restarts it after a gap, and leaves it alone when it is not newer.
+_NEXT_STREAK = '''CASE
+        WHEN excluded.last_study_date = DATE(last_study_date, '+1 day') THEN current_streak + 1
+        WHEN excluded.last_study_date > last_study_date THEN 1
+        ELSE current_streak END'''
+
+_ADD_STREAK_DAY = f'''
+    INSERT INTO study_streaks (user_id, guild_id, current_streak, longest_streak, last_study_date)
+    SELECT user_id, guild_id, 1, 1, DATE(start_time)
+    FROM study_history
+    WHERE session_id = ?
+    ON CONFLICT(user_id, guild_id) DO UPDATE SET
+        current_streak = {_NEXT_STREAK},
+        longest_streak = MAX(longest_streak, {_NEXT_STREAK}),
+        last_study_date = MAX(last_study_date, excluded.last_study_date)
+'''
+
+
+def create_rollup_table(c: sqlite3.Cursor):
+    c.execute('''CREATE TABLE IF NOT EXISTS study_daily_rollup
+                 (user_id INTEGER NOT NULL, guild_id INTEGER NOT NULL, date TEXT NOT NULL,
+                  study_type TEXT NOT NULL, sessions INTEGER DEFAULT 0,
+                  total_duration INTEGER DEFAULT 0, max_duration INTEGER DEFAULT 0,
+                  answers INTEGER DEFAULT 0, correct_answers INTEGER DEFAULT 0,
+                  PRIMARY KEY (user_id, guild_id, date, study_type)) WITHOUT ROWID''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_study_rollup_guild_date
+                 ON study_daily_rollup(guild_id, date)''')
+
+
+def create_streak_table(c: sqlite3.Cursor):
+    c.execute('''CREATE TABLE IF NOT EXISTS study_streaks
+                 (user_id INTEGER NOT NULL, guild_id INTEGER NOT NULL,
+                  current_streak INTEGER DEFAULT 0, longest_streak INTEGER DEFAULT 0,
+                  last_study_date TEXT, PRIMARY KEY (user_id, guild_id))''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_study_streaks_guild
+                 ON study_streaks(guild_id, current_streak DESC)''')
+
+
+def record_session(c: sqlite3.Cursor, session_id: str):
+    """Fold a session that was just moved to study_history into its daily rollup and streak"""
+    c.execute(_ADD_SESSION, (session_id,))
+    c.execute(_ADD_STREAK_DAY, (session_id,))
+
+
+def active_streak_cutoff() -> str:
+    """Streaks whose last study day is before this date have lapsed"""
+    return (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+
+
+def get_streak(c: sqlite3.Cursor, user_id: int, guild_id: int) -> Tuple[int, int]:
+    """(current, longest) streak in days; a streak survives until a full day is missed"""
+    row = c.execute('''SELECT CASE WHEN last_study_date >= ? THEN current_streak ELSE 0 END,
+                               longest_streak
+                        FROM study_streaks WHERE user_id = ? AND guild_id = ?''',
+                    (active_streak_cutoff(), user_id, guild_id)).fetchone()
+    return (row[0], row[1]) if row else (0, 0)
+
+
+def rebuild_streaks(c: sqlite3.Cursor) -> int:
+    """Recompute every streak from the rollup days (gaps-and-islands)"""
+    c.execute('DELETE FROM study_streaks')
+    c.execute('''WITH days AS (
+                      SELECT DISTINCT user_id, guild_id, date FROM study_daily_rollup),
+                  islands AS (
+                      SELECT user_id, guild_id, date,
+                             julianday(date) - ROW_NUMBER() OVER (
+                                 PARTITION BY user_id, guild_id ORDER BY date) AS island
+                      FROM days),
+                  runs AS (
+                      SELECT user_id, guild_id, COUNT(*) AS length, MAX(date) AS end_date
+                      FROM islands GROUP BY user_id, guild_id, island),
+                  ranked AS (
+                      SELECT user_id, guild_id, length, end_date,
+                             FIRST_VALUE(length) OVER (
+                                 PARTITION BY user_id, guild_id ORDER BY end_date DESC) AS latest_length
+                      FROM runs)
+                  INSERT INTO study_streaks (user_id, guild_id, current_streak, longest_streak, last_study_date)
+                  SELECT user_id, guild_id, MAX(latest_length), MAX(length), MAX(end_date)
+                  FROM ranked GROUP BY user_id, guild_id''')
+    return c.rowcount
+
+
+def rebuild_rollups(c: sqlite3.Cursor) -> int:
+    """Recompute every rollup row from study_history and study_answers"""
+    c.execute('DELETE FROM study_daily_rollup')
+    c.execute(f'''INSERT INTO study_daily_rollup
+                      (user_id, guild_id, date, study_type, sessions, total_duration, max_duration,
+                       answers, correct_answers)
+                  SELECT sh.user_id, sh.guild_id, DATE(sh.start_time),
+                         COALESCE(sh.study_type, '{UNSPECIFIED_TYPE}'),
+                         COUNT(*), COALESCE(SUM(sh.actual_duration), 0),
+                         COALESCE(MAX(sh.actual_duration), 0),
+                         COALESCE(SUM(a.answers), 0), COALESCE(SUM(a.correct), 0)
+                  FROM study_history sh
+                  LEFT JOIN (SELECT session_id, COUNT(*) AS answers, SUM(is_correct) AS correct
+                             FROM study_answers GROUP BY session_id) a
+                         ON a.session_id = sh.session_id
+                  WHERE sh.start_time IS NOT NULL
+                  GROUP BY sh.user_id, sh.guild_id, DATE(sh.start_time),
+                           COALESCE(sh.study_type, '{UNSPECIFIED_TYPE}')''')
+    return c.rowcount
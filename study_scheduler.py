@@ -0,0 +1,126 @@
+"""
+Study Session Scheduler for Questuza Discord Bot
+Sleeps until the next study deadline (test expiry or inactivity) instead of polling
+"""
+
+import asyncio
+import datetime
+import heapq
+import itertools
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+INACTIVITY_TIMEOUT = 30 * 60  # seconds without activity before a session ends
+
+EXPIRE_TEST = "test_expired"
+EXPIRE_INACTIVE = "inactive"
+
+
+class ScheduledSession:
+    """What the scheduler needs to know about one active study session"""
+
+    def __init__(self, session_id: str, study_type: str, start_time: datetime.datetime,
+                 intended_duration: Optional[int], last_activity: datetime.datetime):
+        self.session_id = session_id
+        self.study_type = study_type
+        self.start_time = start_time
+        self.intended_duration = intended_duration
+        self.last_activity = last_activity
+
+    def deadline(self) -> Optional[Tuple[datetime.datetime, str]]:
+        """When and why the session ends on its own; None for tests without a time limit"""
+        if self.study_type == "MCQ Test":
+            if not self.intended_duration:
+                return None  # untimed tests run until the user stops them
+            return self.start_time + datetime.timedelta(minutes=self.intended_duration), EXPIRE_TEST
+        return self.last_activity + datetime.timedelta(seconds=INACTIVITY_TIMEOUT), EXPIRE_INACTIVE
+
+
+class StudySessionScheduler:
+    """Min-heap of study session deadlines with a single sleeping worker"""
+
+    def __init__(self, on_expire: Callable[[int, int, str, str], Awaitable[None]]):
+        self.on_expire = on_expire
+        self.sessions: Dict[Tuple[int, int], ScheduledSession] = {}
+        self._heap: List[Tuple[datetime.datetime, int, int, int]] = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.is_running():
+            self._task = asyncio.create_task(self._run())
+
+    def schedule(self, user_id: int, guild_id: int, session: ScheduledSession):
+        """Track a session, replacing any session the user already had"""
+        self.sessions[(user_id, guild_id)] = session
+        self._push(user_id, guild_id, session)
+
+    def touch(self, user_id: int, guild_id: int, when: Optional[datetime.datetime] = None) -> bool:
+        """Record real activity; returns False when the user has no active session.
+
+        Only the in-memory timestamp moves here. The heap entry is re-pushed
+        lazily when the old deadline comes up, so chatty users cost O(1).
+        """
+        session = self.sessions.get((user_id, guild_id))
+        if session is None:
+            return False
+        session.last_activity = when or datetime.datetime.now()
+        return True
+
+    def cancel(self, user_id: int, guild_id: int):
+        """Forget a session that ended some other way; its heap entries go stale"""
+        self.sessions.pop((user_id, guild_id), None)
+
+    def _push(self, user_id: int, guild_id: int, session: ScheduledSession):
+        due = session.deadline()
+        if due is None:
+            return
+        deadline, _ = due
+        if not self._heap or deadline < self._heap[0][0]:
+            self._wakeup.set()  # the worker is sleeping towards a later deadline
+        heapq.heappush(self._heap, (deadline, next(self._counter), user_id, guild_id))
+
+    async def _run(self):
+        while True:
+            try:
+                if not self._heap:
+                    timeout = None
+                else:
+                    timeout = max(0.0, (self._heap[0][0] - datetime.datetime.now()).total_seconds())
+                if timeout is None or timeout > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._fire_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Error in study session scheduler: {e}")
+                await asyncio.sleep(1)
+
+    async def _fire_due(self):
+        now = datetime.datetime.now()
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, user_id, guild_id = heapq.heappop(self._heap)
+            session = self.sessions.get((user_id, guild_id))
+            due = session.deadline() if session is not None else None
+            if due is None:
+                continue  # cancelled, or replaced by an untimed test
+            current, kind = due
+            if current > now:
+                # Activity or a newer session moved the deadline; keep one entry per move
+                if current != deadline:
+                    heapq.heappush(self._heap, (current, next(self._counter), user_id, guild_id))
+                continue
+            del self.sessions[(user_id, guild_id)]
+            try:
+                await self.on_expire(user_id, guild_id, session.session_id, kind)
+            except Exception as e:
+                logging.error(f"Failed to expire study session {session.session_id}: {e}")
@@ -0,0 +1,109 @@
+"""
+Study Schema for Questuza Discord Bot
+Tables and indexes behind the study system, plus the queries they must serve
+"""
+
+import sqlite3
+
+STUDY_TABLES = {
+    'study_sessions': '''CREATE TABLE IF NOT EXISTS study_sessions
+        (user_id INTEGER NOT NULL, guild_id INTEGER NOT NULL, session_id TEXT NOT NULL,
+         study_type TEXT, subject TEXT, mood TEXT, intended_duration INTEGER,
+         start_time TEXT, last_activity TEXT, pdf_url TEXT, answer_key_url TEXT,
+         PRIMARY KEY (user_id, guild_id))''',
+    'study_history': '''CREATE TABLE IF NOT EXISTS study_history
+        (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, guild_id INTEGER NOT NULL,
+         session_id TEXT NOT NULL, study_type TEXT, subject TEXT, mood TEXT,
+         intended_duration INTEGER, start_time TEXT, end_time TEXT, actual_duration INTEGER DEFAULT 0,
+         completed INTEGER DEFAULT 0, pdf_url TEXT, answer_key_url TEXT)''',
+    'study_answers': '''CREATE TABLE IF NOT EXISTS study_answers
+        (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, guild_id INTEGER NOT NULL,
+         session_id TEXT NOT NULL, question_number INTEGER, answer TEXT,
+         is_correct INTEGER DEFAULT 0, timestamp TEXT)''',
+    'study_bookmarks': '''CREATE TABLE IF NOT EXISTS study_bookmarks
+        (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, guild_id INTEGER NOT NULL,
+         title TEXT, url TEXT, category TEXT, created_at TEXT)''',
+}
+
+# Columns added after the first deployments; older databases get them through ALTER TABLE
+ADDED_COLUMNS = [
+    ('study_sessions', 'pdf_url', 'TEXT'),
+    ('study_sessions', 'answer_key_url', 'TEXT'),
+    ('study_history', 'pdf_url', 'TEXT'),
+    ('study_history', 'answer_key_url', 'TEXT'),
+]
+
+STUDY_INDEXES = [
+    # Active sessions are found by owner or by session_id; tables created before the
+    # primary key existed need the owner index spelled out
+    'CREATE INDEX IF NOT EXISTS idx_study_sessions_user ON study_sessions(user_id, guild_id)',
+    'CREATE INDEX IF NOT EXISTS idx_study_sessions_session ON study_sessions(session_id)',
+    # History pages, exports and "latest test" lookups per user
+    '''CREATE INDEX IF NOT EXISTS idx_study_history_user_start
+       ON study_history(user_id, guild_id, start_time, session_id)''',
+    '''CREATE INDEX IF NOT EXISTS idx_study_history_user_type
+       ON study_history(user_id, guild_id, study_type, start_time, session_id)''',
+    'CREATE INDEX IF NOT EXISTS idx_study_history_session ON study_history(session_id)',
+    # Guild-wide leaderboards by time window
+    'CREATE INDEX IF NOT EXISTS idx_study_history_guild_start ON study_history(guild_id, start_time)',
+    # Answers per session (scoring, rollups) and per user (exports)
+    'CREATE INDEX IF NOT EXISTS idx_study_answers_session ON study_answers(session_id, question_number)',
+    'CREATE INDEX IF NOT EXISTS idx_study_answers_user ON study_answers(user_id, guild_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_study_bookmarks_user ON study_bookmarks(user_id, guild_id, created_at)',
+]
+
+# Every query shape the bot runs against the study tables, with sample parameters.
+# check_study_indexes.py runs EXPLAIN QUERY PLAN on each and fails on a full table scan.
+STUDY_QUERIES = [
+    ('active session', 'SELECT * FROM study_sessions WHERE user_id = ? AND guild_id = ?', (1, 1)),
+    ('session expiry', '''SELECT start_time, last_activity, intended_duration FROM study_sessions
+                          WHERE user_id = ? AND guild_id = ? AND session_id = ?''', (1, 1, 's')),
+    ('touch activity', 'UPDATE study_sessions SET last_activity = ? WHERE user_id = ? AND guild_id = ?',
+     ('t', 1, 1)),
+    ('history count', 'SELECT COUNT(*) FROM study_history WHERE user_id = ? AND guild_id = ?', (1, 1)),
+    ('history page', '''SELECT session_id FROM study_history WHERE user_id = ? AND guild_id = ?
+                        ORDER BY start_time DESC, session_id DESC LIMIT 5''', (1, 1)),
+    ('history page by type', '''SELECT session_id FROM study_history
+                                WHERE user_id = ? AND guild_id = ? AND study_type = ?
+                                ORDER BY start_time DESC, session_id DESC LIMIT 5''', (1, 1, 'Reading')),
+    ('latest test', '''SELECT session_id FROM study_history
+                       WHERE user_id = ? AND guild_id = ? AND study_type = 'MCQ Test'
+                       ORDER BY end_time DESC LIMIT 1''', (1, 1)),
+    ('session details', '''SELECT * FROM study_history
+                           WHERE user_id = ? AND guild_id = ? AND session_id = ?''', (1, 1, 's')),
+    ('history export', '''SELECT * FROM study_history WHERE user_id = ? AND guild_id = ?
+                          ORDER BY end_time DESC''', (1, 1)),
+    ('guild history window', '''SELECT user_id, SUM(actual_duration) FROM study_history
+                                WHERE guild_id = ? AND start_time >= ? GROUP BY user_id''', (1, '')),
+    ('rollup session', '''SELECT COUNT(*), SUM(is_correct) FROM study_answers
+                          WHERE session_id = ?''', ('s',)),
+    ('test summary', '''SELECT question_number, answer, is_correct FROM study_answers
+                        WHERE user_id = ? AND guild_id = ? AND session_id = ?
+                        ORDER BY question_number''', (1, 1, 's')),
+    ('answers export', '''SELECT * FROM study_answers WHERE user_id = ? AND guild_id = ?
+                          ORDER BY timestamp DESC''', (1, 1)),
+    ('bookmarks', '''SELECT id, title, url, category, created_at FROM study_bookmarks
+                     WHERE user_id = ? AND guild_id = ? ORDER BY created_at DESC''', (1, 1)),
+    ('bookmark delete', 'DELETE FROM study_bookmarks WHERE id = ? AND user_id = ? AND guild_id = ?',
+     (1, 1, 1)),
+    ('rollup analytics', '''SELECT SUM(sessions), SUM(total_duration) FROM study_daily_rollup
+                            WHERE user_id = ? AND guild_id = ? AND date >= ?''', (1, 1, '')),
+    ('streak leaderboard', '''SELECT user_id, current_streak FROM study_streaks
+                              WHERE guild_id = ? AND last_study_date >= ? AND current_streak > 0
+                              ORDER BY current_streak DESC LIMIT 10''', (1, '')),
+    ('rollup leaderboard', '''SELECT user_id, SUM(total_duration) FROM study_daily_rollup
+                              WHERE guild_id = ? AND date >= ? GROUP BY user_id''', (1, '')),
+]
+
+
+def create_study_tables(c: sqlite3.Cursor):
+    """Create the study tables and indexes, upgrading older tables in place"""
+    for table, ddl in STUDY_TABLES.items():
+        c.execute(ddl)
+    for table, column, column_type in ADDED_COLUMNS:
+        existing = {row[1] for row in c.execute(f'PRAGMA table_info({table})')}
+        if column not in existing:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+            print(f"✅ Added column: {table}.{column}")
+    for ddl in STUDY_INDEXES:
+        c.execute(ddl)
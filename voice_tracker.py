@@ -0,0 +1,457 @@
+"""
+Voice Tracker for Questuza Discord Bot
+Holds active voice sessions in memory and checkpoints them to SQLite in batches
+"""
+
+import sqlite3
+import datetime
+import math
+import time
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from quest_system import add_vc_minutes
+
+VC_SESSION_CAP = 18000  # 5 hours max credited per session
+VC_XP_PER_MINUTE = 60
+VC_ACCRUAL_SECONDS = 60  # how often connected members are credited
+
+# Voice state flags, stored as a bitmask on voice_segments rows
+VC_MUTED = 1
+VC_DEAFENED = 2
+VC_AFK = 4
+VC_ALONE = 8
+
+VC_STATE_NAMES = {VC_MUTED: 'muted', VC_DEAFENED: 'deafened', VC_AFK: 'afk', VC_ALONE: 'alone'}
+
+# States that earn no VC credit unless a guild sets its own policy
+DEFAULT_EXCLUDED_STATES = VC_AFK
+
+
+def get_db_connection():
+    """Get database connection with proper settings"""
+    conn = sqlite3.connect('questuza.db', check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class VoiceSession:
+    """One member's time in voice, as segments of constant channel and state"""
+
+    def __init__(self, user_id: int, guild_id: int, channel_id: int, state: int,
+                 creditable: bool, joined_at: datetime.datetime, started: float):
+        self.user_id = user_id
+        self.guild_id = guild_id
+        self.joined_at = joined_at  # wall clock, for voice_sessions rows
+        self.counted = 0  # creditable seconds in finished segments
+        self.credited = 0  # seconds already credited to the user
+        self.credited_at = joined_at
+        self.start_segment(channel_id, state, creditable, started, joined_at)
+
+    def start_segment(self, channel_id: int, state: int, creditable: bool,
+                      now: float, now_wall: datetime.datetime):
+        self.channel_id = channel_id
+        self.state = state
+        self.creditable = creditable
+        self.segment_started = now
+        self.segment_started_at = now_wall
+
+    def end_segment(self, now: float) -> Tuple:
+        """Close the current segment and return its voice_segments row"""
+        seconds = int(max(0.0, now - self.segment_started))
+        if self.creditable:
+            self.counted += seconds
+        return (self.user_id, self.guild_id, self.channel_id, self.state,
+                self.segment_started_at.isoformat(), seconds)
+
+    def creditable_elapsed(self, now: float) -> int:
+        current = now - self.segment_started if self.creditable else 0.0
+        return self.counted + int(max(0.0, current))
+
+    def split_by_day(self, start: int, end: int,
+                     end_wall: datetime.datetime) -> Dict[str, List[int]]:
+        """Split creditable seconds [start, end) by calendar day as [seconds, whole minutes]
+
+        The seconds are placed so they finish at end_wall. A minute belongs to
+        the day on which it was completed, so a session running over midnight
+        credits each day's daily_stats row separately.
+        """
+        days = {}
+        offset = start
+        while offset < end:
+            moment = end_wall - datetime.timedelta(seconds=end - offset)
+            midnight = datetime.datetime.combine(moment.date() + datetime.timedelta(days=1),
+                                                 datetime.time.min)
+            boundary = min(end, offset + max(1, math.ceil((midnight - moment).total_seconds())))
+            entry = days.setdefault(moment.date().isoformat(), [0, 0])
+            entry[0] += boundary - offset
+            entry[1] += boundary // 60 - offset // 60
+            offset = boundary
+        return days
+
+
+class VoiceTracker:
+    """Active voice sessions keyed by (guild_id, user_id)"""
+
+    def __init__(self, cap: int = VC_SESSION_CAP):
+        self.cap = cap
+        self.sessions: Dict[Tuple[int, int], VoiceSession] = {}
+        self._ops: List[Tuple] = []  # voice_sessions writes, applied in order
+        self._credits: Dict[Tuple[int, int, str], List[int]] = {}  # -> [seconds, minutes]
+        self._accrued: Dict[Tuple[int, int], VoiceSession] = {}  # open sessions to checkpoint
+        self._segments: List[Tuple] = []  # finished voice_segments rows
+        self.policies: Dict[int, int] = {}  # guild_id -> excluded state mask
+
+    def is_tracking(self, guild_id: int, user_id: int) -> bool:
+        return (guild_id, user_id) in self.sessions
+
+    def load_policies(self):
+        """Load every guild's excluded VC states from guild_settings"""
+        conn = get_db_connection()
+        rows = conn.execute('''SELECT guild_id, vc_excluded_states FROM guild_settings
+                               WHERE vc_excluded_states IS NOT NULL''').fetchall()
+        conn.close()
+        self.policies = {row['guild_id']: row['vc_excluded_states'] for row in rows}
+
+    def excluded_states(self, guild_id: int) -> int:
+        return self.policies.get(guild_id, DEFAULT_EXCLUDED_STATES)
+
+    def is_creditable(self, guild_id: int, state: int) -> bool:
+        return not state & self.excluded_states(guild_id)
+
+    def join(self, guild_id: int, user_id: int, channel_id: int, state: int = 0) -> VoiceSession:
+        """Start a session, closing any session the member still had open"""
+        if (guild_id, user_id) in self.sessions:
+            self.leave(guild_id, user_id)
+        session = VoiceSession(user_id, guild_id, channel_id, state,
+                               self.is_creditable(guild_id, state),
+                               datetime.datetime.now(), time.monotonic())
+        self.sessions[(guild_id, user_id)] = session
+        self._ops.append(('open', session))
+        return session
+
+    def update(self, guild_id: int, user_id: int, channel_id: int, state: int) -> VoiceSession:
+        """Move a member to a channel/state, starting a new segment when either changes"""
+        session = self.sessions.get((guild_id, user_id))
+        if session is None:
+            return self.join(guild_id, user_id, channel_id, state)
+        if session.channel_id == channel_id and session.state == state:
+            return session
+
+        now = time.monotonic()
+        # Credit the finished segment under the rules it was recorded with
+        if self._credit(session, now):
+            self._accrued[(guild_id, user_id)] = session
+        self._segments.append(session.end_segment(now))
+        moved = session.channel_id != channel_id
+        session.start_segment(channel_id, state, self.is_creditable(guild_id, state),
+                              now, datetime.datetime.now())
+        if moved:
+            self._ops.append(('move', session))
+        return session
+
+    def leave(self, guild_id: int, user_id: int) -> Optional[int]:
+        """End a session and queue its remaining credit; returns total seconds credited"""
+        session = self.sessions.pop((guild_id, user_id), None)
+        if session is None:
+            return None
+        now = time.monotonic()
+        self._credit(session, now)
+        self._segments.append(session.end_segment(now))
+        self._accrued.pop((guild_id, user_id), None)
+        self._ops.append(('close', session, datetime.datetime.now()))
+        return session.credited
+
+    def reconcile(self, guild_id: int, live: Dict[int, Tuple[int, int]]) -> Tuple[int, int, int]:
+        """Diff a guild's open sessions against the members currently in voice
+
+        `live` maps user_id -> (channel_id, state) from the gateway. Sessions
+        still live stay open and resume accruing, departed ones are closed and
+        missed joins are opened, with every untracked row written in a single
+        transaction. Returns (kept, closed, opened) counts.
+        """
+        # Sessions already in memory (a gateway resume) just replay the missed events
+        for key in [key for key in self.sessions if key[0] == guild_id]:
+            if key[1] in live:
+                self.update(guild_id, key[1], *live[key[1]])
+            else:
+                self.leave(guild_id, key[1])
+        self.flush()
+
+        now, now_wall = time.monotonic(), datetime.datetime.now()
+        conn = get_db_connection()
+        c = conn.cursor()
+        rows = c.execute('''SELECT user_id, channel_id, join_time, COALESCE(credited_seconds, 0),
+                                   last_credit_time
+                            FROM voice_sessions
+                            WHERE guild_id = ? AND leave_time IS NULL''', (guild_id,)).fetchall()
+
+        kept, moved, closed, credits = [], [], [], []
+        open_users = set()
+        for user_id, channel_id, join_time, credited, last_credit_time in rows:
+            if (guild_id, user_id) in self.sessions:
+                continue
+            open_users.add(user_id)
+            joined_at = datetime.datetime.fromisoformat(join_time)
+            if user_id in live:
+                live_channel, state = live[user_id]
+                # Still connected: resume from what was credited, so the outage earns
+                # nothing. Rows that never accrued keep the old capped catch-up of join
+                # to now, as departed rows below do.
+                session = VoiceSession(user_id, guild_id, live_channel, state,
+                                       self.is_creditable(guild_id, state), joined_at, now)
+                session.start_segment(live_channel, state, session.creditable, now, now_wall)
+                session.counted = credited
+                if not last_credit_time:
+                    elapsed = int(max(0.0, (now_wall - joined_at).total_seconds()))
+                    session.counted = max(credited, min(elapsed, self.cap))
+                session.credited = credited
+                session.credited_at = datetime.datetime.fromisoformat(last_credit_time) \
+                    if last_credit_time else joined_at
+                kept.append(session)
+                if live_channel != channel_id:
+                    moved.append((live_channel, user_id, guild_id))
+            else:
+                # Accrued sessions were credited up to their last tick; older rows
+                # get the previous catch-up of join to now, capped
+                credit = 0
+                if not last_credit_time:
+                    elapsed = int(max(0.0, (now_wall - joined_at).total_seconds()))
+                    credit = max(0, min(elapsed, self.cap) - credited)
+                if credit:
+                    credits.append((user_id, credit, (credited + credit) // 60 - credited // 60))
+                closed.append((now_wall.isoformat(), credited + credit, user_id, guild_id))
+
+        opened = []
+        for user_id, (channel_id, state) in live.items():
+            if (guild_id, user_id) not in self.sessions and user_id not in open_users:
+                opened.append(VoiceSession(user_id, guild_id, channel_id, state,
+                                           self.is_creditable(guild_id, state), now_wall, now))
+
+        try:
+            c.executemany('''UPDATE voice_sessions SET leave_time = ?, credited_seconds = ?
+                             WHERE user_id = ? AND guild_id = ? AND leave_time IS NULL''', closed)
+            c.executemany('''UPDATE voice_sessions SET channel_id = ?
+                             WHERE user_id = ? AND guild_id = ? AND leave_time IS NULL''', moved)
+            c.executemany('''DELETE FROM voice_sessions WHERE user_id = ? AND guild_id = ?''',
+                          [(session.user_id, guild_id) for session in opened])
+            c.executemany('''INSERT INTO voice_sessions
+                             (user_id, guild_id, channel_id, join_time, leave_time)
+                             VALUES (?, ?, ?, ?, NULL)''',
+                          [(session.user_id, guild_id, session.channel_id, now_wall.isoformat())
+                           for session in opened])
+            if credits:
+                c.executemany('''INSERT OR IGNORE INTO users (user_id, guild_id, created_at)
+                                 VALUES (?, ?, ?)''',
+                              [(user_id, guild_id, now_wall.isoformat()) for user_id, _, _ in credits])
+                c.executemany('''UPDATE users SET vc_seconds = vc_seconds + ?, xp = xp + ?
+                                 WHERE user_id = ? AND guild_id = ?''',
+                              [(credit, minutes * VC_XP_PER_MINUTE, user_id, guild_id)
+                               for user_id, credit, minutes in credits])
+                add_vc_minutes(c, [(user_id, guild_id, now_wall.date().isoformat(), minutes)
+                                   for user_id, _, minutes in credits if minutes > 0])
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        for session in kept + opened:
+            self.sessions[(guild_id, session.user_id)] = session
+        return len(kept), len(closed), len(opened)
+
+
+    def accrue(self) -> int:
+        """Credit every connected member for the time since their last credit"""
+        now = time.monotonic()
+        credited = 0
+        for key, session in self.sessions.items():
+            if self._credit(session, now):
+                self._accrued[key] = session
+                credited += 1
+        return credited
+
+    def _credit(self, session: VoiceSession, now: float) -> bool:
+        """Queue the seconds accrued since the last credit; the cap applies per session"""
+        total = min(session.creditable_elapsed(now), self.cap)
+        if total <= session.credited:
+            return False
+        now_wall = datetime.datetime.now()
+        for date, (seconds, minutes) in session.split_by_day(session.credited, total, now_wall).items():
+            entry = self._credits.setdefault((session.user_id, session.guild_id, date), [0, 0])
+            entry[0] += seconds
+            entry[1] += minutes
+        session.credited = total
+        session.credited_at = now_wall
+        return True
+
+    def has_pending(self) -> bool:
+        return bool(self._ops or self._credits or self._accrued or self._segments)
+
+    def flush(self) -> Set[Tuple[int, int]]:
+        """Write queued session changes and credits in one transaction.
+
+        Returns the (guild_id, user_id) pairs whose users row changed.
+        """
+        if not self.has_pending():
+            return set()
+
+        ops, credits = self._ops, self._credits
+        conn = get_db_connection()
+        c = conn.cursor()
+        try:
+            for op in ops:
+                if op[0] == 'open':
+                    session = op[1]
+                    c.execute('''DELETE FROM voice_sessions WHERE user_id = ? AND guild_id = ?''',
+                              (session.user_id, session.guild_id))
+                    c.execute('''INSERT INTO voice_sessions
+                                 (user_id, guild_id, channel_id, join_time, leave_time)
+                                 VALUES (?, ?, ?, ?, NULL)''',
+                              (session.user_id, session.guild_id, session.channel_id,
+                               session.joined_at.isoformat()))
+                elif op[0] == 'move':
+                    session = op[1]
+                    c.execute('''UPDATE voice_sessions SET channel_id = ?
+                                 WHERE user_id = ? AND guild_id = ? AND leave_time IS NULL''',
+                              (session.channel_id, session.user_id, session.guild_id))
+                else:
+                    session, left_at = op[1], op[2]
+                    c.execute('''UPDATE voice_sessions
+                                 SET leave_time = ?, credited_seconds = ?, last_credit_time = ?
+                                 WHERE user_id = ? AND guild_id = ? AND leave_time IS NULL''',
+                              (left_at.isoformat(), session.credited, session.credited_at.isoformat(),
+                               session.user_id, session.guild_id))
+
+            c.executemany('''INSERT INTO voice_segments
+                             (user_id, guild_id, channel_id, state, start_time, seconds)
+                             VALUES (?, ?, ?, ?, ?, ?)''',
+                          [segment for segment in self._segments if segment[5] > 0])
+
+            # Persist progress so a restart never credits the same seconds twice
+            c.executemany('''UPDATE voice_sessions SET credited_seconds = ?, last_credit_time = ?
+                             WHERE user_id = ? AND guild_id = ? AND leave_time IS NULL''',
+                          [(session.credited, session.credited_at.isoformat(),
+                            session.user_id, session.guild_id)
+                           for session in self._accrued.values()])
+
+            if credits:
+                now = datetime.datetime.now().isoformat()
+                users = {(user_id, guild_id) for user_id, guild_id, _ in credits}
+                c.executemany('''INSERT OR IGNORE INTO users (user_id, guild_id, created_at)
+                                 VALUES (?, ?, ?)''',
+                              [(user_id, guild_id, now) for user_id, guild_id in users])
+                c.executemany('''UPDATE users SET vc_seconds = vc_seconds + ?, xp = xp + ?
+                                 WHERE user_id = ? AND guild_id = ?''',
+                              [(seconds, minutes * VC_XP_PER_MINUTE, user_id, guild_id)
+                               for (user_id, guild_id, _), (seconds, minutes) in credits.items()])
+                add_vc_minutes(c, [(user_id, guild_id, date, minutes)
+                                   for (user_id, guild_id, date), (_, minutes) in credits.items()
+                                   if minutes > 0])
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logging.error(f"Voice checkpoint failed, will retry: {e}")
+            return set()
+        finally:
+            conn.close()
+
+        self._ops, self._credits, self._accrued, self._segments = [], {}, {}, []
+        return {(guild_id, user_id) for user_id, guild_id, _ in credits}
+
+
+def close_orphaned_sessions(live: Set[Tuple[int, int]], grace_seconds: int = 600,
+                            cap: int = VC_SESSION_CAP) -> List[Tuple[int, int, int]]:
+    """Close open voice_sessions rows whose member is no longer in voice
+
+    `live` holds the (guild_id, user_id) pairs the gateway or the tracker still
+    sees in voice; those rows are never touched. Rows that were accrued get
+    nothing more, as reconcile does; rows never accrued get join to now, capped. Credit comes with XP and daily/weekly VC minutes, using
+    a handful of set-based statements. Returns (guild_id, user_id, seconds).
+    """
+    now = datetime.datetime.now()
+    cutoff = (now - datetime.timedelta(seconds=grace_seconds)).isoformat()
+    today = now.date()
+    week_start = (today - datetime.timedelta(days=today.weekday())).isoformat()
+
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        c.execute('''CREATE TEMP TABLE IF NOT EXISTS vc_live
+                     (guild_id INTEGER, user_id INTEGER, PRIMARY KEY (guild_id, user_id))''')
+        c.execute('''CREATE TEMP TABLE IF NOT EXISTS vc_orphans
+                     (user_id INTEGER, guild_id INTEGER, credit INTEGER, minutes INTEGER,
+                      PRIMARY KEY (user_id, guild_id))''')
+        c.execute('DELETE FROM vc_live')
+        c.execute('DELETE FROM vc_orphans')
+        c.executemany('INSERT OR IGNORE INTO vc_live (guild_id, user_id) VALUES (?, ?)', live)
+
+        # Rows that were accrued already hold all their credit (the outage and any
+        # time the guild policy excluded earn nothing); rows never accrued get the
+        # capped join to now. A user with several open rows is credited once, from
+        # the row owed the most. Uses idx_voice_sessions_cleanup
+        c.execute('''INSERT INTO vc_orphans (user_id, guild_id, credit, minutes)
+                     SELECT user_id, guild_id, credit, (credited + credit) / 60 - credited / 60
+                     FROM (SELECT user_id, guild_id, credited, credit,
+                                  ROW_NUMBER() OVER (PARTITION BY user_id, guild_id
+                                                     ORDER BY credit DESC) AS pick
+                           FROM (SELECT user_id, guild_id,
+                                        COALESCE(credited_seconds, 0) AS credited,
+                                        CASE WHEN last_credit_time IS NOT NULL THEN 0
+                                             ELSE MAX(0, MIN(?, CAST((julianday(?) - julianday(join_time))
+                                                                     * 86400 AS INTEGER))
+                                                         - COALESCE(credited_seconds, 0))
+                                        END AS credit
+                                 FROM voice_sessions vs
+                                 WHERE leave_time IS NULL AND join_time < ?
+                                 AND NOT EXISTS (SELECT 1 FROM vc_live l
+                                                 WHERE l.guild_id = vs.guild_id
+                                                 AND l.user_id = vs.user_id)))
+                     WHERE pick = 1''',
+                  (cap, now.isoformat(), cutoff))
+
+        c.execute('''INSERT OR IGNORE INTO users (user_id, guild_id, created_at)
+                     SELECT user_id, guild_id, ? FROM vc_orphans WHERE credit > 0''',
+                  (now.isoformat(),))
+        c.execute('''UPDATE users
+                     SET vc_seconds = users.vc_seconds + o.credit,
+                         xp = users.xp + o.minutes * ?
+                     FROM vc_orphans AS o
+                     WHERE users.user_id = o.user_id AND users.guild_id = o.guild_id
+                     AND o.credit > 0''',
+                  (VC_XP_PER_MINUTE,))
+
+        # The leave time is unknown, so the minutes land on today's rows
+        c.execute('''INSERT INTO daily_stats (user_id, guild_id, date, vc_minutes)
+                     SELECT user_id, guild_id, ?, minutes FROM vc_orphans WHERE minutes > 0
+                     ON CONFLICT(user_id, guild_id, date) DO UPDATE SET
+                     vc_minutes = vc_minutes + excluded.vc_minutes''',
+                  (today.isoformat(),))
+        c.execute('''INSERT INTO weekly_stats (user_id, guild_id, week_start, vc_minutes, active_days)
+                     SELECT o.user_id, o.guild_id, ?, o.minutes,
+                            (SELECT COUNT(DISTINCT date) FROM daily_stats d
+                             WHERE d.user_id = o.user_id AND d.guild_id = o.guild_id AND d.date >= ?)
+                     FROM vc_orphans o WHERE o.minutes > 0
+                     ON CONFLICT(user_id, guild_id, week_start) DO UPDATE SET
+                     vc_minutes = vc_minutes + excluded.vc_minutes,
+                     active_days = excluded.active_days''',
+                  (week_start, week_start))
+
+        c.execute('''UPDATE voice_sessions
+                     SET leave_time = ?, credited_seconds = COALESCE(credited_seconds, 0) + o.credit,
+                         last_credit_time = CASE WHEN o.credit > 0 THEN ? ELSE last_credit_time END
+                     FROM vc_orphans AS o
+                     WHERE voice_sessions.user_id = o.user_id AND voice_sessions.guild_id = o.guild_id
+                     AND voice_sessions.leave_time IS NULL''',
+                  (now.isoformat(), now.isoformat()))
+
+        closed = [(row['guild_id'], row['user_id'], row['credit'])
+                  for row in c.execute('SELECT guild_id, user_id, credit FROM vc_orphans')]
+        conn.commit()
+        return closed
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()